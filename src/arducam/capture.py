@@ -0,0 +1,111 @@
+"""Thread that grabs frames from the Arducam independently of processing"""
+
+from constants import ARDUCAM_TIMEOUT, ARDUCAM_RETRY_DELAY
+import numpy as np
+import threading
+import time
+
+
+class CaptureThread(threading.Thread):
+    """
+    Grabs frames from a VideoCapture as fast as the camera delivers them.
+
+    Frames are only decoded (retrieved) when the processing stage asks for one,
+    so frames that arrive while it is busy are dropped without being decoded
+    and the driver's buffer queue never fills up with stale frames
+    """
+
+    def __init__(self, vidcap, shape, stats=None, timeout=ARDUCAM_TIMEOUT):
+        """
+        Parameters:
+        - vidcap (cv2.VideoCapture): Opened camera. Must not be used by any other thread
+        - shape (tuple (int)): Shape of a frame
+        - stats (CaptureStats | None): Shared counters to update as frames are grabbed
+        - timeout (float): Maximum time in seconds to allow the camera to not send a frame
+        """
+        super().__init__(daemon=True)
+        self.vidcap = vidcap
+        self.stats = stats
+        self.timeout = timeout
+
+        # Exception that stopped the thread, raised again by read()
+        self.error = None
+
+        # Decoded frame handed to the processing stage
+        self._frame = np.empty(shape, dtype='uint8')
+        self._timestamp = 0.0
+
+        # Handoff state, guarded by the condition
+        self._cond = threading.Condition()
+        self._wanted = False # Processing stage is waiting for a frame
+        self._ready  = False # A decoded frame is waiting for the processing stage
+        self._done   = False # Thread exited
+
+        self._stop_sig = threading.Event()
+
+
+    def run(self):
+        last_good_frame = time.monotonic()
+        try:
+            while not self._stop_sig.is_set():
+                # Wait for the next frame without decoding it
+                # A failed grab returns immediately, back off instead of spinning until the timeout
+                if not self.vidcap.grab():
+                    assert (time.monotonic() - last_good_frame) < self.timeout, "Camera connection timed out"
+                    self._stop_sig.wait(ARDUCAM_RETRY_DELAY)
+                    continue
+
+                # OpenCV doesn't give us a reliable capture time, use the arrival time
+                last_good_frame = capture_time = time.monotonic()
+                if self.stats is not None: self.stats.grabbed += 1
+
+                with self._cond:
+                    # Processing stage is busy, drop the frame
+                    if not self._wanted:
+                        if self.stats is not None: self.stats.dropped += 1
+                        continue
+
+                    # Decode the frame and hand it off
+                    ret, self._frame = self.vidcap.retrieve(self._frame)
+                    if not ret: continue
+                    self._timestamp = capture_time
+                    self._wanted = False
+                    self._ready = True
+                    self._cond.notify()
+
+        except BaseException as err:
+            self.error = err
+
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify()
+
+
+    def read(self, timeout=None):
+        """
+        Wait for the next frame from the camera
+
+        Parameters:
+        - timeout (float | None): Maximum time to wait in seconds
+
+        Returns (tuple (bool, numpy.ndarray, float)): Boolean indicates whether a frame was read,
+        followed by the frame (valid until the next read) and its monotonic capture time
+
+        Notes: Raises the exception that stopped the capture thread, if any
+        """
+        with self._cond:
+            self._wanted = True
+            self._cond.wait_for(lambda: self._ready or self._done, timeout)
+
+            if self.error is not None: raise self.error
+            if not self._ready: return False, None, 0.0
+
+            self._ready = False
+            return True, self._frame, self._timestamp
+
+
+    def stop(self):
+        """Stop grabbing frames and wait for the thread to exit"""
+        self._stop_sig.set()
+        if self.is_alive(): self.join(timeout=2)
@@ -1,26 +1,38 @@
 """Arducam polling launcher"""
 
 from .polling_worker import polling_worker
+from misc.frame_buffer import CaptureStats
 from misc.launcher import Launcher
+from multiprocessing import Value
 import logging
 
 
 class Arducam(Launcher):
     """Class for managing the arducam polling worker"""
 
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        Parameters:
+        - backend (object | None): Capture backend to use instead of the camera, e.g. arducam.replay.VisibleReplay
+        """
         super().__init__()
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
 
+        # Capture backend, the worker opens the Arducam if None
+        self.backend = backend
+
+        # Grabbed/processed/dropped frame counters and latency
+        self.capture_stats = Value(CaptureStats, lock=False)
+
 
     def start(self, vis_mem, frame_event, log_queue):
         """
         Start the arducam polling worker
 
         Parameters:
-        - vis_mem (multiprocessing.Array): Shared memory location of visible camera data
-        - frame_event (NewFrameEvent): Master 'new frame' event. Set all child events when a new frame is written
+        - vis_mem (FrameRing): Shared memory ring of visible camera data
+        - frame_event (NewFrameEvent): Publisher of the stream. Wakes all subscribers when a new frame is written
         - log_queue (multiprocessing.Queue): Queue to handle log messages
         """
 
@@ -32,6 +44,9 @@ class Arducam(Launcher):
                 self.streaming_ports,
                 self.suspend_sig,
                 log_queue,
-                self.exception_queue
+                self.exception_queue,
+                self.capture_stats,
+                self.cpu_usage,
+                self.backend
             )
          )
@@ -1,7 +1,10 @@
 """Worker process for polling Arducam"""
 
 from misc.logs import configure_subprocess_log
+from misc.cpu_meter import CpuMeter
 from misc.monitor import MonitorServer
+from .undistort import get_undistort_maps, undistort_frame
+from .capture import CaptureThread
 from constants import *
 import numpy as np
 import subprocess
@@ -11,17 +14,20 @@ import time
 import cv2
 
 
-def polling_worker(mem, new, ports, stop, log, errs):
+def polling_worker(mem, new, ports, stop, log, errs, capture_stats, cpu_usage, backend):
     """
     Main polling loop for Arducam
 
     Parameters:
-    - mem (multiprocessing.Array): Shared memory location of visible image data
-    - new (NewFrameEvent): Master 'new frame' event. Sets all child events when a new frame is written
+    - mem (FrameRing): Shared memory ring of visible image data
+    - new (NewFrameEvent): Publisher of the stream. Wakes all subscribers when a new frame is written
     - ports (list (int)): List of UDP ports to stream image data to
     - stop (multiprocessing.Event): Flag that indicates when to suspend process
     - log (multiprocessing.Queue): Queue to handle log messages
     - errs (multiprocessing.Queue): Queue to dump errors raised by worker
+    - capture_stats (CaptureStats): Grabbed/processed/dropped frame counters and capture-to-publish latency
+    - cpu_usage (multiprocessing.Value (double)): CPU usage of the worker in percent of one core
+    - backend (object | None): Capture backend whose open() returns a cv2.VideoCapture-like object (e.g. VisibleReplay). Opens the Arducam if None
     """
     # === Setup ===
     try:
@@ -32,15 +38,21 @@ def polling_worker(mem, new, ports, stop, log, errs):
         logger = logging.getLogger(__name__)
         logger.setLevel(logging.DEBUG)
 
-        # Find Arducam
-        logger.debug("Searching for Arducam")
-        arducam_index = get_arducam_index()
-        assert arducam_index != None, "Failed to find Arducam"
+        # Open replay instead of the camera
+        if backend is not None:
+            vidcap = backend.open()
+            assert vidcap.isOpened(), "Capture backend failed to open"
 
-        # Open Arducam
-        logger.debug(f"Attemping to open VideoCapture({arducam_index})")
-        vidcap = cv2.VideoCapture(arducam_index)
-        assert vidcap.isOpened(), "VideoCapture failed to open"
+        else:
+            # Find Arducam
+            logger.debug("Searching for Arducam")
+            arducam_index = get_arducam_index()
+            assert arducam_index != None, "Failed to find Arducam"
+
+            # Open Arducam
+            logger.debug(f"Attemping to open VideoCapture({arducam_index})")
+            vidcap = cv2.VideoCapture(arducam_index)
+            assert vidcap.isOpened(), "VideoCapture failed to open"
 
         # Set resolution
         if int(vidcap.get(cv2.CAP_PROP_FRAME_WIDTH)) != int(VISIBLE_SHAPE[1]):
@@ -62,14 +74,19 @@ def polling_worker(mem, new, ports, stop, log, errs):
         
         logger.debug("Arducam opened sucessfully")
 
+        # Load undistortion maps
+        map1, map2 = get_undistort_maps()
+
         # Create monitor for UDP streaming
         monitor = MonitorServer()
 
-        # Create numpy array backed by shared memory
-        frame_dst = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8', buffer=mem.get_obj())
+        # Grab frames on a separate thread
+        # so slow processing doesn't let stale frames pile up in the driver
+        capture = CaptureThread(vidcap, VISIBLE_SHAPE, capture_stats)
+        capture.start()
 
-        # Timestamp for camera watchdog timer
-        last_good_frame = time.time()
+        # CPU usage measurement
+        cpu_meter = CpuMeter(cpu_usage)
 
     # Add errors to queue
     except BaseException as err:
@@ -82,36 +99,38 @@ def polling_worker(mem, new, ports, stop, log, errs):
     # === Loop ===
     while not stop.is_set():
         try:
-            # Grab frame
-            ret, frame = vidcap.read()
-            if ret: last_good_frame = time.time()
-            else: 
-                assert (time.time() - last_good_frame) < ARDUCAM_TIMEOUT, "Camera connection timed out"
-                continue
+            # Measure CPU usage
+            cpu_meter.update()
+
+            # Get the newest frame from the capture thread
+            # Raises the capture thread's error (e.g. camera timeout)
+            ret, frame, capture_time = capture.read(timeout=0.5)
+            if not ret: continue
+
+            # Writes straight into the next slot of the shared memory ring
+            frame_dst = mem.begin_write()
+
+            # Point space mode: publish the raw frame, only rotated upright.
+            # Consumers undistort their results instead of the whole frame
+            if ARDUCAM_UNDISTORT_POINTS: cv2.flip(frame, -1, dst=frame_dst)
 
             # Undistort frame
-            # Copies data to shared memory
-            if not mem.get_lock().acquire(timeout=0.5): continue
-            cv2.undistort(
-                src=frame, 
-                dst=frame_dst,
-                cameraMatrix=np.array(ARDUCAM_CALIB),
-                distCoeffs=np.array(ARDUCAM_DIST),
-                newCameraMatrix=np.array(ARDUCAM_NEW_CAM)
-            )
-            mem.get_lock().release()
+            else: undistort_frame(frame, map1, map2, dst=frame_dst)
+            mem.end_write(capture_time)
 
             # Set new frame flag
             new.set()
 
-            if len(ports):
-                # Copy data back to frame
-                if not mem.get_lock().acquire(timeout=0.5): continue
-                np.copyto(frame, frame_dst)
-                mem.get_lock().release()
+            # Update counters
+            capture_stats.processed += 1
+            capture_stats.latency = time.monotonic() - capture_time
 
-                # Stream data over UDP
-                monitor.show(frame, *ports)
+            # Stream data over UDP
+            # Only this process writes to the ring, so the slot can be read without copying.
+            # In point space mode the rectified frame is only produced here
+            if len(ports):
+                if ARDUCAM_UNDISTORT_POINTS: frame_dst = undistort_frame(frame, map1, map2)
+                monitor.show(frame_dst, *ports)
 
         # Add errors to queue
         except BaseException as err:
@@ -122,6 +141,9 @@ def polling_worker(mem, new, ports, stop, log, errs):
     # === Terminate ===
     try:
         new.clear() # Invalidate last data
+
+        try: capture.stop()
+        except UnboundLocalError: pass
         
         try: vidcap.release()
         except UnboundLocalError: pass
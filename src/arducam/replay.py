@@ -0,0 +1,158 @@
+"""Capture backend that replays a video file or an image folder in place of the Arducam"""
+
+from constants import VISIBLE_SHAPE, ARDUCAM_REPLAY_RATE
+import numpy as np
+import logging
+import glob
+import time
+import cv2
+import os
+
+# Image files picked up from a folder
+_IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+class VisibleReplay:
+    """
+    Replays a video file or a folder of images in place of the Arducam, so the real polling worker
+    (and everything downstream of it) can run without a camera.
+
+    Recordings must hold raw camera frames (as read from cv2.VideoCapture), the worker still undistorts them.
+    Frames of a different size are resized to VISIBLE_SHAPE
+
+    Notes: Pass to the Arducam launcher. The source is only opened by open(), in the worker process
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, fps=None):
+        """
+        Parameters:
+        - path (str): Video file, or folder of images replayed in name order
+        - speed (float): Playback speed. 1 is real time, 0 is as fast as possible
+        - loop (bool): Start over at the end of the recording
+        - fps (float | None): Frame rate of the recording. Read from the video file if None, ARDUCAM_REPLAY_RATE for image folders
+        """
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.fps = fps
+
+
+    def open(self):
+        """Returns (ReplayCapture): The opened recording, with the cv2.VideoCapture interface"""
+        return ReplayCapture(self.path, self.speed, self.loop, self.fps)
+
+
+
+class ReplayCapture:
+    """Plays back a video file or image folder through the subset of cv2.VideoCapture the Arducam worker uses"""
+
+    def __init__(self, path, speed=1.0, loop=False, fps=None):
+        """See VisibleReplay"""
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.DEBUG)
+
+        self.speed = speed
+        self.loop = loop
+
+        # Source
+        if os.path.isdir(path):
+            self._images = sorted(f for f in glob.glob(os.path.join(glob.escape(path), "*")) if f.lower().endswith(_IMAGE_EXTS))
+            self._video = None
+            self.fps = fps or ARDUCAM_REPLAY_RATE
+            opened = len(self._images) > 0
+        else:
+            self._images = None
+            self._video = cv2.VideoCapture(path)
+            opened = self._video.isOpened()
+            self.fps = fps or (self._video.get(cv2.CAP_PROP_FPS) if opened else 0) or ARDUCAM_REPLAY_RATE
+        self._opened = opened
+        if opened: self.logger.debug(f"Replaying {path} at {self.fps:.1f} fps x{speed}")
+
+        # Grabbed frame, decoded by retrieve()
+        self._frame = np.empty(VISIBLE_SHAPE, dtype='uint8')
+        self._grabbed = None
+        self._index = 0
+
+        # Replay clock
+        self._start = None
+        self._count = 0
+
+
+    def isOpened(self):
+        return self._opened
+
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH: return float(VISIBLE_SHAPE[1])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT: return float(VISIBLE_SHAPE[0])
+        if prop == cv2.CAP_PROP_FPS: return float(self.fps)
+        return 0.0
+
+
+    def set(self, prop, value):
+        # Frames are always resized to VISIBLE_SHAPE
+        return self.get(prop) == value
+
+
+    def _next(self):
+        """Returns (bool | str | None): Advance the source. True for a grabbed video frame, the next image's path for folders, None at the end"""
+        if self._video is not None:
+            if self._video.grab(): return True
+            if not self.loop: return None
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return True if self._video.grab() else None
+
+        if self._index >= len(self._images):
+            if not self.loop: return None
+            self._index = 0
+        self._index += 1
+        return self._images[self._index - 1]
+
+
+    def grab(self):
+        """Wait until the next frame is due, like a camera. Returns (bool): False at the end of the recording"""
+        if not self._opened: return False
+
+        # Pace the replay
+        now = time.monotonic()
+        if self._start is None: self._start = now
+        if self.speed > 0:
+            due = self._start + self._count / (self.fps * self.speed)
+            if due > now: time.sleep(due - now)
+
+            # Fell behind by more than a frame, resync instead of delivering a burst
+            elif now - due > 1 / (self.fps * self.speed): self._start = now - self._count / (self.fps * self.speed)
+
+        self._grabbed = self._next()
+        if self._grabbed is None: return False
+        self._count += 1
+        return True
+
+
+    def retrieve(self, image=None):
+        """Decode the grabbed frame. Returns (tuple (bool, numpy.ndarray)): Same as cv2.VideoCapture.retrieve()"""
+        if self._grabbed is None: return False, None
+
+        if self._video is not None: ret, frame = self._video.retrieve()
+        else:
+            frame = cv2.imread(self._grabbed, cv2.IMREAD_COLOR)
+            ret = frame is not None
+        if not ret: return False, None
+
+        # Match the camera's frame size
+        out = self._frame if image is None or image.shape != VISIBLE_SHAPE else image
+        if frame.shape != VISIBLE_SHAPE:
+            cv2.resize(frame, (VISIBLE_SHAPE[1], VISIBLE_SHAPE[0]), dst=out, interpolation=cv2.INTER_AREA)
+        else: np.copyto(out, frame)
+        return True, out
+
+
+    def read(self, image=None):
+        """Grab and decode the next frame. Returns (tuple (bool, numpy.ndarray)): Same as cv2.VideoCapture.read()"""
+        if not self.grab(): return False, None
+        return self.retrieve(image)
+
+
+    def release(self):
+        if self._video is not None: self._video.release()
+        self._opened = False
@@ -0,0 +1,138 @@
+"""
+Undistortion of Arducam frames.
+
+Frames can be undistorted in image space (remap every frame) or in point space.
+In point space mode (ARDUCAM_UNDISTORT_POINTS) the polling worker publishes the raw
+frame, only rotated upright, and consumers map their results into rectified
+coordinates with undistort_boxes()
+"""
+
+from constants import *
+import numpy as np
+import hashlib
+import logging
+import os
+import cv2
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Calibration as numpy arrays
+_CALIB   = np.array(ARDUCAM_CALIB)
+_DIST    = np.array(ARDUCAM_DIST)
+_NEW_CAM = np.array(ARDUCAM_NEW_CAM)
+
+# Termination criteria for undistorting points
+_POINT_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 20, 1e-3)
+
+
+def calibration_key():
+    """Returns (str): Hash of everything the undistortion maps depend on"""
+    calib = (ARDUCAM_CALIB, ARDUCAM_DIST, ARDUCAM_NEW_CAM, VISIBLE_SHAPE, cv2.__version__)
+    return hashlib.sha1(repr(calib).encode()).hexdigest()
+
+
+def get_undistort_maps(cache_path=None):
+    """
+    Get the fixed-point maps that undistort Arducam frames with cv2.remap()
+
+    Parameters:
+    - cache_path (str | None): Path of the cache file. Defaults to ARDUCAM_REMAP_CACHE next to this module
+
+    Returns (tuple (numpy.ndarray, numpy.ndarray)): Maps to pass to cv2.remap()
+
+    Notes: The maps are loaded from the cache file if it matches the current calibration constants,
+    otherwise they are computed and the cache is rewritten
+    """
+    if cache_path is None:
+        cache_path = os.path.join(os.path.dirname(__file__), ARDUCAM_REMAP_CACHE)
+    key = calibration_key()
+
+    # Try the cache first
+    try:
+        with np.load(cache_path) as cache:
+            if str(cache["key"]) == key:
+                return cache["map1"], cache["map2"]
+        logger.debug("Undistortion map cache is stale")
+    except (OSError, KeyError, ValueError):
+        logger.debug("No usable undistortion map cache")
+
+    # Same maps cv2.undistort() builds internally on every call
+    map1, map2 = cv2.initUndistortRectifyMap(
+        cameraMatrix=_CALIB,
+        distCoeffs=_DIST,
+        R=None,
+        newCameraMatrix=_NEW_CAM,
+        size=(VISIBLE_SHAPE[1], VISIBLE_SHAPE[0]),
+        m1type=cv2.CV_16SC2
+    )
+
+    # Write to a temporary file first so a crash never leaves a partial cache
+    try:
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, key=key, map1=map1, map2=map2)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        logger.warning(f"Failed to write undistortion map cache '{cache_path}'")
+
+    return map1, map2
+
+
+def undistort_frame(frame, map1, map2, dst=None):
+    """
+    Undistort (and rotate) a raw Arducam frame
+
+    Parameters:
+    - frame (numpy.ndarray): The raw frame, as read from the camera
+    - map1, map2 (numpy.ndarray): Maps from get_undistort_maps()
+    - dst (numpy.ndarray | None): Array to write the result into. Allocated if not given
+
+    Returns (numpy.ndarray): The rectified frame
+    """
+    return cv2.remap(
+        src=frame,
+        map1=map1,
+        map2=map2,
+        interpolation=cv2.INTER_LINEAR,
+        dst=dst
+    )
+
+
+def undistort_boxes(boxes):
+    """
+    Map bounding boxes found in a point space mode frame into rectified frame coordinates
+
+    Parameters:
+    - boxes (list (list (float))): xyxy boxes in the published (raw, rotated upright) frame
+
+    Returns (numpy.ndarray): Nx4 array of xyxy boxes in rectified frame coordinates
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0: return boxes
+
+    # Box edges bend under lens distortion,
+    # so map the edge midpoints along with the corners
+    x1, y1, x2, y2 = boxes.T
+    xm, ym = (x1 + x2) / 2, (y1 + y2) / 2
+    xs = np.stack([x1, xm, x2, x2, x2, xm, x1, x1], axis=1)
+    ys = np.stack([y1, y1, y1, ym, y2, y2, y2, ym], axis=1)
+
+    # Undo the 180 degree rotation applied when the frame was published
+    h, w = VISIBLE_SHAPE[:2]
+    pts = np.stack([(w-1) - xs, (h-1) - ys], axis=-1).reshape(-1, 1, 2)
+
+    # Same projection as the undistortion maps (including their rotation)
+    # The distortion is strong near the edges, iterate longer than the default
+    if hasattr(cv2, "undistortPointsIter"): # OpenCV 4
+        pts = cv2.undistortPointsIter(pts, _CALIB, _DIST, None, _NEW_CAM, _POINT_CRITERIA)
+    else:
+        pts = cv2.undistortPoints(pts, _CALIB, _DIST, R=None, P=_NEW_CAM, criteria=_POINT_CRITERIA)
+    pts = pts.reshape(-1, 8, 2)
+
+    # Bounding box of the mapped points, clipped to the frame
+    out = np.concatenate([pts.min(axis=1), pts.max(axis=1)], axis=1)
+    np.clip(out[:, 0::2], 0, w-1, out=out[:, 0::2])
+    np.clip(out[:, 1::2], 0, h-1, out=out[:, 1::2])
+    return out
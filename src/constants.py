@@ -7,6 +7,27 @@ EXCEPTION_HISTORY_WINDOW = 10
 ALLOWABLE_EXCEPTION_COUNT = 2
 """(int) Maximum number of nonfatal errors within the history window that will be tolerated before the program exits"""
 
+CPU_USAGE_PERIOD = 1.0
+"""(float) Period in seconds over which a worker's CPU usage is averaged"""
+
+
+
+# Shared frame buffers
+FRAME_RING_SLOTS = 4
+"""(int) Number of frames held in a shared memory frame ring, unless the stream sets its own"""
+
+VISIBLE_RING_SLOTS = 16
+"""(int) Number of frames held in the visible frame ring. At 30 fps this covers ~530 ms, several inference passes on the Jetson, so user detection rarely reads a torn frame"""
+
+FRAME_BUFFER_PREFIX = "jetson_frames"
+"""(str) Prefix of the shared memory segment names, followed by the stream type"""
+
+FRAME_BUFFER_ALIGN = 64
+"""(int) Byte alignment of the frame data in shared memory segments"""
+
+FRAME_EVENT_MAX_SUBSCRIBERS = 8
+"""(int) Number of subscriber slots in a FrameEventHub, i.e. the maximum number of simultaneous frame consumers"""
+
 
 
 # Node.js server constants
@@ -74,6 +95,36 @@ LIBUVC_DLL_PATH = "/usr/local/lib/libuvc.so"
 """(str) PureThermal USB vendor ID"""
 
 
+# Purethermal frame buffering
+LEPTON_FRAME_POOL_SIZE = 4
+"""(int) Number of preallocated frames the PureThermal driver callback copies into"""
+
+
+# Raw16 recordings
+RAW16_WRITER_QUEUE_SIZE = 64
+"""(int) Number of frames a raw16 recording can buffer in memory before new frames are dropped"""
+
+
+# Thermal recorder
+RECORDER_DIRECTORY = "recordings"
+"""(str) Default directory compressed thermal recordings are written to"""
+
+RECORDER_CHUNK_SIZE = 64 * 2**20
+"""(int) Size in bytes after which a recording starts a new chunk file"""
+
+RECORDER_KEYFRAME_INTERVAL = 90
+"""(int) Number of frames between keyframes in a compressed recording. Bounds the work needed to seek"""
+
+RECORDER_COMPRESSION_LEVEL = 1
+"""(int) zlib compression level of recordings. Level 1 is the fastest"""
+
+RECORDER_QUEUE_SIZE = 32
+"""(int) Number of frames the recorder can buffer between shared memory and disk before new frames are dropped"""
+
+RECORDER_STATS_PERIOD = 1.0
+"""(float) Period in seconds over which the recorder's disk bandwidth is averaged"""
+
+
 # Purethermal timeout
 PURETHERMAL_TIMEOUT = 3.0 
 """(float) Maximum time in seconds to allow the purethermal board to not send a valid frame"""
@@ -89,6 +140,9 @@ HOTSPOT_TRIP_TIME = 3
 HOTSPOT_RELEASE_TIME = 10
 """(float) Duration in seconds where no hotspots are detected after which the hotspot flag will be lowered"""
 
+HOTSPOT_FILTER_SIZE = 5
+"""(int) Size of the median filter that removes outlier pixels before finding the hottest spot (3 or 5)"""
+
 
 # Thermal image clipping limits
 TEMP_THRESH_LOW  = 40.0
@@ -116,9 +170,6 @@ BLOB_HISTORY_RATE = 2.0
 BLOB_HISTORY_DEPTH = 30 
 """(int) Maximum number of history samples to keep"""
 
-SLOPE_EST_MAX_POINTS = 900
-"""(int) Maximum number of pairwise slopes to consider for the Theil-Sen estimator.\n\n Should be >= BLOB_HISTORY_DEPTH*(BLOB_HISTORY_DEPTH-1) if you don't want random sampling"""
-
 
 # Cooking detection hysteresis
 COOKING_TRIP_TIME = 10 
@@ -128,6 +179,34 @@ COOKING_RELEASE_TIME = 10
 """(float) Duration in seconds that a cooking blob must have a negative slope in order to deregister as cooking"""
 
 
+# Cooking detection scheduling
+COOKING_DETECT_RATE = BLOB_HISTORY_RATE
+"""(float | None) Full blob extractions per second while the scene is steady. Blobs are only re-measured in between. None extracts on every frame"""
+
+COOKING_DETECT_MAX_RATE = RAW_THERMAL_RATE
+"""(float) Full blob extractions per second while the scene is changing"""
+
+COOKING_DETECT_BOOST_TIME = 3.0
+"""(float) Duration in seconds to extract at COOKING_DETECT_MAX_RATE after the blob count or a blob temperature changed quickly"""
+
+COOKING_DETECT_TEMP_RATE = 2.0
+"""(float) Blob temperature change in celsius per second that counts as a quick change"""
+
+COOKING_DETECT_TIMING = False
+"""(bool) Time each stage of blob extraction and log the averages when the worker exits. For profiling, adds bookkeeping to every frame"""
+
+
+# Cooking detection change gate
+CHANGE_GATE_DOWNSAMPLE = 4
+"""(int) Factor by which thermal frames are downsampled (area average) before comparing them"""
+
+CHANGE_GATE_TOLERANCE = 1.0
+"""(float) Largest temperature difference in celsius between downsampled frames that still counts as an unchanged scene"""
+
+CHANGE_GATE_MAX_SKIP_TIME = 10.0
+"""(float) Maximum duration in seconds without a full blob extraction, even if the scene is unchanged"""
+
+
 # Blob similarity scoring
 SIM_SCORE_WEIGHTS = (1, 4, 2, 0.1)
 """(tuple (float)) Sub-score weights (overlap, distance, temperature, area)"""
@@ -153,6 +232,12 @@ VISIBLE_SHAPE = (480, 640, 3)
 ARDUCAM_TIMEOUT = 2.0 
 """(float) Maximum time in seconds to allow the arducam to not send a valid frame """
 
+ARDUCAM_RETRY_DELAY = 10e-3
+"""(float) Time in seconds to wait before grabbing again after the arducam failed to deliver a frame"""
+
+ARDUCAM_REPLAY_RATE = 30.0
+"""(float) Frame rate of replayed image folders, and of videos that don't report one"""
+
 
 # Arducam calibration matrix
 ARDUCAM_CALIB = [
@@ -184,6 +269,16 @@ ARDUCAM_NEW_CAM = [
 """(list (list (float))) Arducam new camera matrix"""
 
 
+# Arducam undistortion mode
+ARDUCAM_UNDISTORT_POINTS = False
+"""(bool) If True, publish raw Arducam frames (rotated upright) and undistort detection boxes instead of whole frames. Rectified frames are then only produced for UDP streaming"""
+
+
+# Arducam undistortion map cache
+ARDUCAM_REMAP_CACHE = "undistort_maps.npz"
+"""(str) File name of the cached undistortion maps, stored in the arducam module directory. Rebuilt automatically when the calibration changes"""
+
+
 # User detection constants
 USER_TRIP_TIME = 2 
 """(float) Duration in seconds that a person must be detected to set the detection flag"""
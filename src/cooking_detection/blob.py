@@ -2,9 +2,9 @@
 
 from misc.hysteresis import HysteresisBool
 from lepton.utils import raw2temp
-from .theil_sen import TheilSen
 from constants import *
 import numpy as np
+import itertools
 import time
 import cv2
 
@@ -13,15 +13,106 @@ import logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Source of unique track IDs
+_track_ids = itertools.count()
+
+
+BLOB_HISTORY_DTYPE = np.dtype([
+    ("timestamp", np.float64),     # Monotonic capture time
+    ("centroid",  np.int32, (2,)), # Centroid (x, y)
+    ("area",      np.int32),       # Number of blob pixels
+    ("temp",      np.float64),     # Average temperature in celsius
+])
+"""(numpy.dtype) One blob history sample"""
+
+
+class BlobHistory:
+    """
+    Fixed-capacity ring of blob history samples, oldest first.\n
+    Every sample is written twice, at its ring index and one capacity further, so the retained
+    samples are always contiguous and view() returns them without copying
+    """
+
+    __slots__ = ("_buf", "_capacity", "_start", "_len")
+
+    def __init__(self, capacity=BLOB_HISTORY_DEPTH):
+        """
+        Parameters:
+        - capacity (int): Maximum number of samples to keep. Older samples are dropped
+        """
+        self._buf = np.zeros(2*capacity, dtype=BLOB_HISTORY_DTYPE)
+        self._capacity = capacity
+        self._start = 0 # Ring index of the oldest sample
+        self._len = 0
+
+
+    def __len__(self):
+        return self._len
+
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+
+    def append(self, timestamp, centroid, area, temp):
+        """
+        Add a sample, dropping the oldest one if the ring is full
+
+        Parameters:
+        - timestamp (float): Monotonic capture time
+        - centroid (tuple (int)): Centroid (x, y)
+        - area (int): Number of blob pixels
+        - temp (float): Average temperature in celsius
+        """
+        i = (self._start + self._len) % self._capacity
+        self._buf[i] = self._buf[i + self._capacity] = (timestamp, centroid, area, temp)
+
+        if self._len < self._capacity: self._len += 1
+        else: self._start = (self._start + 1) % self._capacity
+
+
+    def view(self):
+        """Returns (numpy.ndarray): Read-only view of the samples, oldest first. Only valid until the next append()"""
+        out = self._buf[self._start:self._start + self._len]
+        out.flags.writeable = False
+        return out
+
+
+    @property
+    def last(self):
+        """(numpy.void): The newest sample"""
+        return self._buf[(self._start + self._len - 1) % self._capacity]
+
+
 
 class Blob:
     """Characterize and operate on thermal image blobs"""
 
-    def __init__(self, contour, thermal_img):
+    __slots__ = (
+        "lives", "track_id", "_cooking", "color",
+        "rect", "mask", "area", "centroid", "temp", "_contour",
+        "timestamp", "first_detected", "_history", "new_data_flag",
+    )
+
+    def __init__(self, rect, mask, centroid, area, temp, timestamp=None):
+        """
+        Parameters:
+        - rect (tuple (int)): Bounding rect (x, y, w, h) in the thermal image
+        - mask (numpy.ndarray): Blob pixels (255) within the bounding rect, uint8
+        - centroid (tuple (int)): Centroid (x, y) in the thermal image
+        - area (int): Number of blob pixels
+        - temp (float): Average temperature in celsius
+        - timestamp (float | None): Monotonic capture time of the image. Defaults to now
+
+        Notes: See BlobExtractor in cooking_detect_worker.py, or from_contour()
+        """
         # Number of frames to retain blob for
         # after it has not been detected
         self.lives = BLOB_LIVES
 
+        # Identifies the blob across frames, kept by merge()
+        self.track_id = next(_track_ids)
+
         # Filtered result of cooking detection
         # is_cooking() returns this value
         self._cooking = HysteresisBool(COOKING_TRIP_TIME, COOKING_RELEASE_TIME)
@@ -31,42 +122,73 @@ class Blob:
         np.random.shuffle(self.color)
 
         # --- Store blob properties ---
-        # Store contour
-        self.contour = contour
+        # Bounding rect (x, y, w, h) and the mask cropped to it
+        self.rect = tuple(rect)
+        self.mask = mask
 
-        # Store mask
-        self.mask = np.zeros(thermal_img.shape, dtype="uint8")
-        cv2.drawContours(self.mask, [self.contour], -1, 255, thickness=cv2.FILLED)
+        self.area = area
+        self.centroid = tuple(centroid)
+        self.temp = temp
 
-        # Compute area (including contour border)
-        self.area = np.count_nonzero(self.mask)
+        # Outline, computed from the mask when first needed
+        self._contour = None
 
-        # Compute centroid
-        M = cv2.moments(self.contour)
-        centroid_x = int(M["m10"] / (M["m00"]+0.001))
-        centroid_y = int(M["m01"] / (M["m00"]+0.001))
-        self.centroid = (centroid_x, centroid_y)
+        # Capture time of the image the blob was found in
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.first_detected = self.timestamp
 
-        # Compute average temperature
-        # TODO: Use median for better outlier robustness? 
-        # self.temp = np.median(thermal_img[self.mask==255]) 
-        self.temp = cv2.mean(thermal_img, self.mask)[0]
-        self.temp = raw2temp(self.temp)
-
-        # Store position, area, and temperature history
-        self.first_detected = time.time()
-        self.history = [{
-            "timestamp" : self.first_detected,
-            "centroid"  : self.centroid,
-            "area"      : self.area,
-            "temp"      : self.temp,
-        }]
+        # Position, area, and temperature history. Blobs that get merged into a tracked blob never need their own
+        self._history = None
 
         # Flag to indicate when a new point is added to history
         self.new_data_flag = False
 
-        # Slope estimator object
-        self.slope_est = TheilSen(BLOB_HISTORY_DEPTH, SLOPE_EST_MAX_POINTS)
+
+    @classmethod
+    def from_contour(cls, contour, thermal_img, timestamp=None):
+        """
+        Create a blob from a contour
+
+        Parameters:
+        - contour (numpy.ndarray): Blob outline as returned by cv2.findContours()
+        - thermal_img (numpy.ndarray): The raw, 16-bit thermal image the blob was found in
+        - timestamp (float | None): Monotonic capture time of the image. Defaults to now
+
+        Returns (Blob): The new blob
+        """
+        # Bounding rect and the mask cropped to it
+        x, y, w, h = rect = cv2.boundingRect(contour)
+        mask = np.zeros((h, w), dtype="uint8")
+        cv2.drawContours(mask, [contour], -1, 255, thickness=cv2.FILLED, offset=(-x, -y))
+
+        # Compute centroid
+        M = cv2.moments(contour)
+        centroid = (int(M["m10"] / (M["m00"]+0.001)), int(M["m01"] / (M["m00"]+0.001)))
+
+        # Compute average temperature
+        temp = raw2temp(cv2.mean(thermal_img[y:y+h, x:x+w], mask)[0])
+
+        blob = cls(rect, mask, centroid, np.count_nonzero(mask), temp, timestamp)
+        blob._contour = contour
+        return blob
+
+
+    @property
+    def history(self):
+        """(BlobHistory): Position, area, and temperature samples, at most BLOB_HISTORY_RATE per second"""
+        if self._history is None:
+            self._history = BlobHistory()
+            self._history.append(self.timestamp, self.centroid, self.area, self.temp)
+        return self._history
+
+
+    @property
+    def contour(self):
+        """(numpy.ndarray): Outline of the blob in thermal image coordinates, as returned by cv2.findContours()"""
+        if self._contour is None:
+            contours, _ = cv2.findContours(self.mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=self.rect[:2])
+            self._contour = max(contours, key=len)
+        return self._contour
 
 
     def compare(self, other):
@@ -80,9 +202,10 @@ class Blob:
         """
         # 1. Overlap score
         # [0, 1] 1 for full overlap
-        over    = cv2.bitwise_and(self.mask, other.mask)
-        n_over  = cv2.countNonZero(over)
-        overlap = n_over / min(self.area, other.area)
+        overlap = self.overlap(other) / min(self.area, other.area)
+
+        # Can't be a match, skip the other scores
+        if overlap < SIM_SCORE_MIN: return 0
 
         # 2. Centroid distance score
         # [0, 1] 1 for idetical centroids
@@ -108,6 +231,66 @@ class Blob:
         return score
 
 
+    def overlap(self, other):
+        """
+        Count the pixels two blobs share
+
+        Parameters:
+        - other (Blob): The blob to compare against
+
+        Returns (int): Number of pixels in both masks
+        """
+        ax, ay, aw, ah = self.rect
+        bx, by, bw, bh = other.rect
+
+        # Intersection of the bounding rects
+        x0, x1 = max(ax, bx), min(ax+aw, bx+bw)
+        y0, y1 = max(ay, by), min(ay+ah, by+bh)
+        if x0 >= x1 or y0 >= y1: return 0
+
+        # Compare the masks on the intersection only
+        a = self.mask [y0-ay:y1-ay, x0-ax:x1-ax]
+        b = other.mask[y0-by:y1-by, x0-bx:x1-bx]
+        return cv2.countNonZero(cv2.bitwise_and(a, b))
+
+
+    def measure(self, thermal_img):
+        """
+        Average temperature of the blob's pixels in another image, assuming the blob hasn't moved
+
+        Parameters:
+        - thermal_img (numpy.ndarray): The raw, 16-bit thermal image
+
+        Returns (float): Average temperature in celsius
+        """
+        x, y, w, h = self.rect
+        return raw2temp(cv2.mean(thermal_img[y:y+h, x:x+w], self.mask)[0])
+
+
+    def refresh(self, temp, timestamp):
+        """
+        Update the blob's temperature without re-extracting it. Used between full extractions.\n
+        Samples the history at BLOB_HISTORY_RATE, like merge()
+
+        Parameters:
+        - temp (float): New average temperature in celsius, see measure()
+        - timestamp (float): Monotonic capture time of the image
+
+        Returns (float): Temperature change in celsius per second since the previous measurement
+        """
+        dt = timestamp - self.timestamp
+        rate = (temp - self.temp) / dt if dt > 0 else 0.0
+        self.temp = temp
+        self.timestamp = timestamp
+
+        # Enforce history sample rate
+        if (timestamp - self.history.last["timestamp"]) > 1/BLOB_HISTORY_RATE:
+            self.history.append(timestamp, self.centroid, self.area, temp)
+            self.new_data_flag = True
+
+        return rate
+
+
     def merge(self, other):
         """
         Combine two blobs
@@ -124,57 +307,43 @@ class Blob:
         # New object holds the most recent contour, mask, area, temp, etc.
         new._cooking       = old._cooking
         new.color          = old.color
+        new.track_id       = old.track_id
         new.first_detected = old.first_detected
         new.new_data_flag  = old.new_data_flag
-        new.slope_est      = old.slope_est
 
         # Enforce history sample rate
-        dt = new.history[-1]["timestamp"] - old.history[-1]["timestamp"]
-        add_new = dt > 1/BLOB_HISTORY_RATE
-        new.history = old.history + ([new.history[-1]] if add_new else [])
+        # The history ring enforces the max depth
+        history = old.history
+        add_new = (new.timestamp - history.last["timestamp"]) > 1/BLOB_HISTORY_RATE
+        if add_new: history.append(new.timestamp, new.centroid, new.area, new.temp)
+        new._history = history
         new.new_data_flag |= add_new
 
-        # Enforce max history depth
-        new.history = new.history[-BLOB_HISTORY_DEPTH:]
-
         return new
 
 
     def is_cooking(self):
         """
-        Examine history and determine if the blob is associated with cooking
-
-        Returns (bool): True if blob is associated with cooking
+        Returns (bool): True if blob is associated with cooking. See update_cooking() in cooking_detect_worker.py
         """
-        # If there's no new data,
-        # return most recent value
-        if not self.new_data_flag:
-            return self._cooking.value
-        else: self.new_data_flag = False
-
-        # Grab the newest sample and add it to  the estimator
-        new_sample = self.history[-1]
-        self.slope_est.add_point(new_sample["timestamp"], new_sample["temp"])
+        return self._cooking.value
 
-        # Log history to CSV
-        # if time.time() - self.first_detected > 10:
-        #     temp_history = [(h["timestamp"], h["temp"]) for h in self.history]
-        #     temp_history = np.array(temp_history)
 
-        #     filename = f"blob_history_" + "_".join([str(c) for c in self.color]) + ".csv"
-        #     np.savetxt(filename, temp_history, delimiter = ",")
+    def update_cooking(self, slope, timestamp):
+        """
+        Update the cooking state from the blob's temperature trend
 
-        # Not enough samples to make a prediction yet
-        if not self.slope_est.full():
-            return False
+        Parameters:
+        - slope (float): Theil-Sen estimate of the temperature slope over the blob history
+        - timestamp (float): Monotonic time of the newest history sample
 
-        # Find the slope using the Theil-Sen estimator
-        slope = self.slope_est.get_estimate()
+        Returns (bool): True if blob is associated with cooking
+        """
         logger.debug(f"Slope {tuple(self.color)} = {slope:+.3f}")
-        
+
         # Threshold slope & update cooking state
         # TODO: Calculate blob velocity & add scoring?
-        self._cooking.value = slope > TEMP_SLOPE_THRESHOLD
+        self._cooking.update(slope > TEMP_SLOPE_THRESHOLD, timestamp)
         return self._cooking.value
 
 
@@ -195,3 +364,54 @@ class Blob:
             cv2.drawContours(image, [self.contour], -1, (0,100,255), 2)
             
         return image
+
+
+def similarity_matrix(old_blobs, new_blobs):
+    """
+    Compare every old blob with every new blob. Same scores as Blob.compare(), computed for all pairs at once
+
+    Parameters:
+    - old_blobs (list (Blob)): Blobs for the rows
+    - new_blobs (list (Blob)): Blobs for the columns
+
+    Returns (numpy.ndarray): len(old_blobs) x len(new_blobs) matrix of similarity scores [0, 1]
+    """
+    if len(old_blobs) == 0 or len(new_blobs) == 0:
+        return np.zeros((len(old_blobs), len(new_blobs)))
+
+    # Blob properties as arrays (x, y, w, h, centroid x, centroid y, temp, area)
+    # Old blobs along axis 0, new blobs along axis 1
+    props = lambda blobs: np.array([(*b.rect, *b.centroid, b.temp, b.area) for b in blobs], dtype=np.float64)
+    old, new = props(old_blobs)[:,None], props(new_blobs)[None]
+    old_rect, new_rect = old[...,0:4], new[...,0:4]
+    old_cent, new_cent = old[...,4:6], new[...,4:6]
+    old_temp, new_temp = old[...,6], new[...,6]
+    old_area, new_area = old[...,7], new[...,7]
+
+    # 1. Overlap score
+    # Masks are only compared for pairs whose bounding rects intersect
+    x0 = np.maximum(old_rect[...,0], new_rect[...,0])
+    y0 = np.maximum(old_rect[...,1], new_rect[...,1])
+    x1 = np.minimum(old_rect[...,0] + old_rect[...,2], new_rect[...,0] + new_rect[...,2])
+    y1 = np.minimum(old_rect[...,1] + old_rect[...,3], new_rect[...,1] + new_rect[...,3])
+    overlap = np.zeros((len(old_blobs), len(new_blobs)))
+    for r, c in zip(*np.nonzero((x0 < x1) & (y0 < y1))):
+        overlap[r,c] = old_blobs[r].overlap(new_blobs[c])
+    overlap /= np.minimum(old_area, new_area)
+
+    # 2. Centroid distance score
+    distance = 1.0 - np.linalg.norm(old_cent - new_cent, axis=-1) / RAW_THERMAL_DIAG
+
+    # 3. Temperature score
+    temp = 1.0 - np.abs(old_temp - new_temp) / (TEMP_THRESH_HIGH - TEMP_THRESH_LOW)
+
+    # 4. Area score
+    size = np.minimum(old_area, new_area) / np.maximum(old_area, new_area)
+
+    # Weighted average of sub-scores
+    scores = np.stack((overlap, distance, temp, size))
+    out = np.tensordot(SIM_SCORE_WEIGHTS, scores, axes=1) / sum(SIM_SCORE_WEIGHTS)
+
+    # Coerce overall score to zero if any sub-scores are extremely low
+    out[(scores < SIM_SCORE_MIN).any(axis=0)] = 0
+    return out
@@ -1,15 +1,21 @@
 """Cooking detection launcher"""
 
-from .cooking_detect_worker import cooking_detect_worker
-from multiprocessing import Manager
+from .cooking_detect_worker import cooking_detect_worker, DetectionStats
+from multiprocessing import Manager, Value
+from misc.frame_buffer import ReaderStats
 from misc.launcher import Launcher
+from constants import COOKING_DETECT_RATE
 import logging
 
 
 class CookingDetect(Launcher):
     """Class for managing the cooking detection worker"""
 
-    def __init__(self):
+    def __init__(self, rate=COOKING_DETECT_RATE):
+        """
+        Parameters:
+        - rate (float | None): Full blob extractions per second while the scene is steady, see COOKING_DETECT_RATE. None extracts on every frame
+        """
         super().__init__()
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
@@ -17,13 +23,22 @@ class CookingDetect(Launcher):
         # Coordinates of cooking blob centroids
         self.cooking_coords = Manager().list()
 
+        # Received/dropped thermal frame counters
+        self.frame_stats = Value(ReaderStats, lock=False)
+
+        # Extracted/refreshed frame counters and latencies
+        self.detect_stats = Value(DetectionStats, lock=False)
+
+        # Full extraction rate
+        self.rate = rate
+
 
     def start(self, raw16_mem, frame_event, log_queue):
         """
         Start the cooking detection worker
 
         Parameters:
-        - raw16_mem (multiprocessing.Array): Shared memory location of raw16 frame data
+        - raw16_mem (FrameRing): Shared memory ring of raw16 frame data
         - frame_event (NewFrameConsumer): Flag that indicates when a new frame is available
         - log_queue (multiprocessing.Queue): Queue used to transfer log records from a subrocess to the main process
         """
@@ -37,6 +52,10 @@ class CookingDetect(Launcher):
                 self.suspend_sig,
                 log_queue,
                 self.exception_queue,
-                self.cooking_coords
+                self.cooking_coords,
+                self.frame_stats,
+                self.detect_stats,
+                self.cpu_usage,
+                self.rate
             )
         )
@@ -1,29 +1,50 @@
 """Worker that performs cooking detection"""
 
 from misc.logs import configure_subprocess_log
-from lepton.utils import clip_norm, temp2raw
+from misc.cpu_meter import CpuMeter
+from lepton.utils import ClipNorm, clip_norm, temp2raw, raw2temp
 from misc.monitor import MonitorServer
 from constants import *
-from .blob import Blob
+from .blob import Blob, similarity_matrix
+from .theil_sen import TheilSenBatch
+from .scheduler import ExtractionScheduler, ChangeGate
+from ctypes import Structure, c_uint64, c_double
 import numpy as np
 import logging
 import time
 import cv2
 
 
+class DetectionStats(Structure):
+    """Cooking detection counters, per frame type. Create with multiprocessing.Value(DetectionStats, lock=False)"""
+    _fields_ = [
+        ("extracted",       c_uint64), # Number of frames that got a full blob extraction
+        ("refreshed",       c_uint64), # Number of frames that only re-measured the tracked blobs
+        ("skipped",         c_uint64), # Number of refreshed frames that were due an extraction but hadn't changed
+        ("skip_rate",       c_double), # Fraction of due extractions skipped because the frame hadn't changed
+        ("rate",            c_double), # Current target rate of full extractions per second (inf for every frame)
+        ("extract_latency", c_double), # Capture-to-output time in seconds of the last extracted frame
+        ("refresh_latency", c_double), # Capture-to-output time in seconds of the last refreshed frame
+    ]
 
-def cooking_detect_worker(mem, new, ports, stop, log, errs, cooking_coords):
+
+
+def cooking_detect_worker(mem, new, ports, stop, log, errs, cooking_coords, frame_stats, detect_stats, cpu_usage, rate):
     """
     Main cooking detection loop
 
     Parameters:
-    - mem (multiprocessing.Array): Shared memory location of raw16 image data
+    - mem (FrameRing): Shared memory ring of raw16 image data
     - new (NewFrameConsumer): Flag that indicates when a new frame is available
     - ports (list (int)): List of UDP ports to stream image data to
     - stop (multiprocessing.Event): Flag that indicates when to suspend process
     - log (multiprocessing.Queue): Queue to handle log messages
     - errs (multiprocessing.Queue): Queue to dump errors raised by worker
     - cooking_coords (multiprocessing.Manager.list): Centroid locations (x, y) of cooking blobs
+    - frame_stats (ReaderStats): Received/dropped frame counters and latency
+    - detect_stats (DetectionStats): Extracted/refreshed frame counters and latencies
+    - cpu_usage (multiprocessing.Value (double)): CPU usage of the worker in percent of one core
+    - rate (float | None): Full blob extractions per second while the scene is steady. None extracts on every frame
     """
 
     # === Setup ===
@@ -38,14 +59,35 @@ def cooking_detect_worker(mem, new, ports, stop, log, errs, cooking_coords):
         # Create a UDP server to send images to for debugging
         monitor = MonitorServer()
 
-        # Create numpy array backed by shared memory
-        frame_src = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16', buffer=mem.get_obj())
+        # Create reader for the shared memory ring
+        reader = mem.reader(frame_stats)
 
-        # Create array for us to copy to
-        frame = np.empty_like(frame_src)
+        # Create array to copy to if a zero-copy read gets torn
+        frame_copy = np.empty(RAW_THERMAL_SHAPE, dtype='uint16')
 
-        # Create list of blobs
+        # Create blob extractor, reuses its image buffers every frame
+        extractor = BlobExtractor(timed=COOKING_DETECT_TIMING)
+
+        # Create list of blobs, and the ones matched by the last extraction.
+        # Unmatched blobs may be gone, so they aren't re-measured under their old masks
         tracked_blobs = []
+        visible_blobs = []
+
+        # Temperature slope estimators of all tracked blobs
+        slope_est = TheilSenBatch(BLOB_HISTORY_DEPTH)
+
+        # Decides which frames get a full extraction
+        scheduler = ExtractionScheduler(rate)
+
+        # Skips extractions while the scene is unchanged
+        # Not used without a rate, which extracts on every frame
+        gate = None if rate is None else ChangeGate()
+
+        # Last published cooking coordinates
+        coords = []
+
+        # CPU usage measurement
+        cpu_meter = CpuMeter(cpu_usage)
 
     # Add errors to queue
     except BaseException as err:
@@ -58,34 +100,70 @@ def cooking_detect_worker(mem, new, ports, stop, log, errs, cooking_coords):
     # === Loop ===
     while not stop.is_set():
         try:
+            # Measure CPU usage
+            cpu_meter.update()
+
             # Wait for new frame
             if not new.wait(timeout=0.5): continue
             else: new.clear()
 
-            # Copy frame from shared memory
-            if not mem.get_lock().acquire(timeout=0.2): continue
-            np.copyto(frame, frame_src)
-            mem.get_lock().release()
-
-            # Find blobs in image
-            new_blobs = find_blobs(frame)
-
-            # Filter new blobs
-            good = lambda b: (b.area >= BLOB_MIN_AREA) and (b.temp >= BLOB_MIN_TEMP)
-            new_blobs = [b for b in new_blobs if good(b)]
-
-            # Compare and match blobs
-            tracked_blobs = match_blobs(new_blobs, tracked_blobs)
+            # Read newest frame in place
+            ret, frame = reader.read_view()
+            if not ret: continue
+            due = scheduler.due(reader.header.timestamp)
+            extract = due and (gate is None or gate.changed(frame, reader.header.timestamp))
+
+            # Find blobs in image, or only re-measure the tracked blobs
+            process = lambda frame: extractor(frame, reader.header.timestamp) if extract else [b.measure(frame) for b in visible_blobs]
+            result = process(frame)
+
+            # The frame was overwritten while we were reading it.
+            # Fall back to a private copy of the newest frame
+            if reader.torn():
+                ret, frame = reader.read(out=frame_copy)
+                if not ret: continue
+                result = process(frame)
+            timestamp = reader.header.timestamp
+
+            if extract:
+                # Compare and match blobs
+                scheduler.extracted(timestamp, len(result))
+                if gate is not None: gate.update(frame, timestamp)
+                tracked_blobs = match_blobs(result, tracked_blobs)
+                visible_blobs = [b for b in tracked_blobs if b.lives == BLOB_LIVES]
+            else:
+                # Nothing moved, keep the previous blobs
+                if due: scheduler.skipped(timestamp)
+
+                # Quick temperature changes need full extractions
+                rates = [b.refresh(temp, timestamp) for b, temp in zip(visible_blobs, result)]
+                if any(abs(r) > COOKING_DETECT_TEMP_RATE for r in rates): scheduler.boost(timestamp)
+
+            # Update temperature trends
+            update_cooking(tracked_blobs, slope_est)
 
             # Output list of cooking blob centroids
-            cooking_coords[:] = [list(b.centroid) for b in tracked_blobs if b.is_cooking()]
+            new_coords = [list(b.centroid) for b in tracked_blobs if b.is_cooking()]
+            if new_coords != coords: cooking_coords[:] = coords = new_coords
+
+            # Output stats
+            latency = reader.latency()
+            frame_stats.latency = latency
+            detect_stats.rate = scheduler.rate(timestamp)
+            if extract:
+                detect_stats.extracted += 1
+                detect_stats.extract_latency = latency
+            else:
+                detect_stats.refreshed += 1
+                detect_stats.refresh_latency = latency
+                if due: detect_stats.skipped += 1
+            if due: detect_stats.skip_rate = detect_stats.skipped / (detect_stats.skipped + detect_stats.extracted)
 
             # Output to debug monitor
             if len(ports):
                 three_chan = cv2.merge([clip_norm(frame)]*3)
-                for blob in tracked_blobs:
-                    if blob.lives == BLOB_LIVES:
-                        blob.draw_blob(three_chan)
+                for blob in visible_blobs:
+                    blob.draw_blob(three_chan)
                 monitor.show(three_chan, *ports)
 
         # Add errors to queue
@@ -102,6 +180,13 @@ def cooking_detect_worker(mem, new, ports, stop, log, errs, cooking_coords):
         try: cooking_coords[:] = []
         except BrokenPipeError: pass
 
+        # Report where blob extraction spends its time
+        try:
+            if extractor.timed:
+                times = ", ".join(f"{k} {v:.2f}" for k, v in extractor.stage_times().items())
+                logger.debug(f"Blob extraction over {extractor.frames} frames (ms/frame): {times}")
+        except UnboundLocalError: pass
+
     # Add errors to queue
     except BaseException as err:
         errs.put(err, False)
@@ -110,63 +195,203 @@ def cooking_detect_worker(mem, new, ports, stop, log, errs, cooking_coords):
     else: logger.debug("Termination routine completed. Exiting...")
 
 
-def find_blobs(frame):
+class BlobExtractor:
+    """
+    Finds blobs in raw, 16-bit thermal images.\n
+    Owns every intermediate image and the closing kernel, so the filters write into the same
+    buffers frame after frame instead of allocating new arrays.
+    Can also measure how long each stage takes, see stage_times()
     """
-    Find blobs in image
+
+    # Pipeline stages, in order
+    STAGES = ("clip", "bilateral", "threshold", "closing", "fill", "labels", "blobs")
+
+    def __init__(self, shape=RAW_THERMAL_SHAPE, timed=False):
+        """
+        Parameters:
+        - shape (tuple (int)): Image shape
+        - timed (bool): Time each stage. Off by default, the timers add bookkeeping to every frame
+        """
+        # Clip extreme pixel values and convert to 8-bit.
+        # OpenCV doesn't like 16-bit images
+        self.clip_norm = ClipNorm(temp2raw(TEMP_THRESH_LOW), temp2raw(TEMP_THRESH_HIGH))
+
+        # Intermediate images
+        self._clipped = np.empty(shape, dtype='uint8')
+        self._smoothed = np.empty(shape, dtype='uint8')
+        self._thresh = np.empty(shape, dtype='uint8')
+        self._closed = np.empty(shape, dtype='uint8')
+        self._filled = np.empty(shape, dtype='uint8')
+        self._labels = np.empty(shape, dtype='uint16')
+
+        # Hole filling: closed image with a 1 px background border, and the flood fill mask (1 px larger still).
+        # Only the mask is filled, so the border of the padded image stays background
+        self._padded = np.zeros((shape[0]+2, shape[1]+2), dtype='uint8')
+        self._flood_mask = np.zeros((shape[0]+4, shape[1]+4), dtype='uint8')
+
+        # Closing kernel
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
+
+        # Total time spent in each stage (s), and number of frames timed
+        self.timed = timed
+        self.stage_total = dict.fromkeys(self.STAGES, 0.0)
+        self.frames = 0
+
+
+    def stage_times(self):
+        """Returns (dict (str, float)): Average time spent in each stage per frame, in milliseconds. Zero if not timed"""
+        return {k: 1e3 * v / max(self.frames, 1) for k, v in self.stage_total.items()}
+
+
+    def reset_timing(self):
+        """Clear the stage timers"""
+        self.stage_total = dict.fromkeys(self.STAGES, 0.0)
+        self.frames = 0
+
+
+    def __call__(self, frame, timestamp=None):
+        """
+        Find blobs in image
+
+        Parameters:
+        - frame (numpy.ndarray): The raw, 16-bit thermal image
+        - timestamp (float | None): Monotonic capture time of the frame. Defaults to now
+
+        Returns (list (Blob)): A list of detected blob objects, filtered by BLOB_MIN_AREA and BLOB_MIN_TEMP
+        """
+        timed = self.timed
+        if timed: t = [time.perf_counter()]
+
+        # Clip and convert to 8-bit
+        self.clip_norm(frame, dst=self._clipped)
+        if timed: t.append(time.perf_counter())
+
+        # Bilateral filter
+        # Edge-preserving, smoothing filter
+        cv2.bilateralFilter(
+            src = self._clipped,
+            d = 5,
+            sigmaColor = 30,
+            sigmaSpace = 20,
+            dst = self._smoothed
+        )
+        if timed: t.append(time.perf_counter())
+
+        # Adaptive threshold
+        # Binarizes image, true for regions of hot pixels
+        cv2.adaptiveThreshold(
+            src = self._smoothed,
+            maxValue = 255,
+            adaptiveMethod = cv2.ADAPTIVE_THRESH_MEAN_C,
+            thresholdType = cv2.THRESH_BINARY,
+            blockSize = 35,
+            C = 0,
+            dst = self._thresh
+        )
+        if timed: t.append(time.perf_counter())
+
+        # Morphological closing
+        # Closes any holes in the blob
+        cv2.morphologyEx(
+            src = self._thresh,
+            op = cv2.MORPH_CLOSE,
+            kernel = self._kernel,
+            iterations = 2,
+            dst = self._closed
+        )
+        if timed: t.append(time.perf_counter())
+
+        # Fill holes
+        # Blobs are the filled outer outlines, so a hot rim includes its cooler centre.
+        # Flood the background from the border, whatever isn't reached is a blob or enclosed by one
+        np.copyto(self._padded[1:-1, 1:-1], self._closed)
+        self._flood_mask.fill(0)
+        cv2.floodFill(self._padded, self._flood_mask, (0, 0), 255, flags=4 | cv2.FLOODFILL_MASK_ONLY | (255 << 8))
+        cv2.bitwise_not(self._flood_mask[2:-2, 2:-2], dst=self._filled)
+        if timed: t.append(time.perf_counter())
+
+        # Connected components
+        # Labels every blob in one pass. Label 0 is the background
+        n_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
+            image = self._filled,
+            labels = self._labels,
+            connectivity = 8,
+            ltype = cv2.CV_16U
+        )
+        if timed: t.append(time.perf_counter())
+
+        # Average temperature of every label in one pass.
+        # Only over blob pixels: the background (label 0) is most of the frame, and summing it into one bin is slow
+        area = stats[:, cv2.CC_STAT_AREA]
+        blob_pixels = self._filled.ravel() != 0
+        sums = np.bincount(labels.ravel()[blob_pixels], weights=frame.ravel()[blob_pixels], minlength=n_labels)
+        temps = raw2temp(sums / np.maximum(area, 1))
+
+        # Filter by area and temperature before touching any pixels. Label 0 is the background
+        good = (area >= BLOB_MIN_AREA) & (temps >= BLOB_MIN_TEMP)
+        good[0] = False
+
+        blobs = []
+        for i in np.flatnonzero(good):
+            # Blob mask, cropped to its bounding rect. Owned by the blob, so not a reused buffer
+            x, y, w, h = stats[i, :4]
+            mask = cv2.compare(labels[y:y+h, x:x+w], float(i), cv2.CMP_EQ)
+
+            centroid = (int(centroids[i,0]), int(centroids[i,1]))
+            blobs.append(Blob((x, y, w, h), mask, centroid, int(area[i]), float(temps[i]), timestamp))
+        if timed: t.append(time.perf_counter())
+
+        # Update stage timers
+        if timed:
+            for stage, start, end in zip(self.STAGES, t, t[1:]):
+                self.stage_total[stage] += end - start
+            self.frames += 1
+
+        return blobs
+
+
+def assign_blobs(similarities, first_detected, threshold=SIM_SCORE_MATCH):
+    """
+    Match old blobs (rows) to new blobs (columns).\n
+    Each old blob takes its most similar new blob above the threshold. When several old blobs
+    want the same new blob, the oldest keeps it and the others move on to their next best choice.
+    This is deferred acceptance, so the result doesn't depend on the order blobs are processed in
 
     Parameters:
-    - frame (numpy.ndarray): The raw, 16-bit thermal image
+    - similarities (numpy.ndarray): Old x new matrix of similarity scores
+    - first_detected (list (float)): Detection time of each old blob. Earlier is older
+    - threshold (float): Minimum similarity score (exclusive) for a match
 
-    Returns (list (Blob)): A list of detected blob objects
+    Returns (numpy.ndarray): For each new blob, the index of its matched old blob, or -1
     """
+    n_old, n_new = similarities.shape
+    matches = np.full(n_new, -1)
+
+    # Match candidates of each old blob, best first
+    choices = np.argsort(-similarities, axis=1, kind="stable")
+    n_choices = np.count_nonzero(similarities > threshold, axis=1)
+    next_choice = np.zeros(n_old, dtype=int)
+
+    # Older wins, ties go to the lower index
+    older = lambda a, b: (first_detected[a], a) < (first_detected[b], b)
 
-    # Clip extreme pixel values and convert to 8-bit.
-    # OpenCV doesn't like 16-bit images
-    clipped = clip_norm(
-        img = frame,
-        min_val = temp2raw(TEMP_THRESH_LOW),
-        max_val = temp2raw(TEMP_THRESH_HIGH)
-    )
-
-    # Bilateral filter
-    # Edge-preserving, smoothing filter
-    clipped = cv2.bilateralFilter(
-        src = clipped,
-        d = 5,
-        sigmaColor = 30,
-        sigmaSpace = 20
-    )
-
-    # Adaptive threshold
-    # Binarizes image, true for regions of hot pixels
-    thresh = cv2.adaptiveThreshold(
-        src = clipped,
-        maxValue = 255,
-        adaptiveMethod = cv2.ADAPTIVE_THRESH_MEAN_C,
-        thresholdType = cv2.THRESH_BINARY,
-        blockSize = 35,
-        C = 0
-    )
-
-    # Morphological closing
-    # Closes any holes in the blob
-    kernel  = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
-    closed = cv2.morphologyEx(
-        src = thresh,
-        op = cv2.MORPH_CLOSE,
-        kernel = kernel,
-        iterations = 2
-    )
-
-    # Find contours
-    # Gets blob outline
-    contours, heirarchy = cv2.findContours(
-        image = closed,
-        mode = cv2.RETR_EXTERNAL,
-        method = cv2.CHAIN_APPROX_SIMPLE
-    )
-
-    return [Blob(c, frame) for c in contours]
+    free = [r for r in range(n_old) if n_choices[r]]
+    while len(free):
+        r = free.pop()
+        if next_choice[r] >= n_choices[r]: continue # Out of candidates
+
+        # Propose to the next best new blob
+        c = choices[r, next_choice[r]]
+        next_choice[r] += 1
+
+        holder = matches[c]
+        if holder < 0: matches[c] = r
+        elif older(r, holder):
+            matches[c] = r
+            free.append(holder)
+        else: free.append(r)
+
+    return matches
 
 
 def match_blobs(new_blobs, old_blobs):
@@ -180,75 +405,63 @@ def match_blobs(new_blobs, old_blobs):
 
     Returns (list (Blob)): The updated list of tracked blobs
     """
+    # No old blobs to match with
+    if len(old_blobs) == 0:
+        return list(new_blobs)
 
     # Compare new and old blobs and compute the optimal matches
-    if len(new_blobs) and len(old_blobs):
-
-        # Compare each old blob with all new blobs
-        compare_all_news = lambda old: [old.compare(new) for new in new_blobs]
-        similarities = np.array([compare_all_news(old) for old in old_blobs])
-
-        running = True
-        while running:
-            # For each old blob, find the new blob with the highest similarity score
-            best_matches = np.argmax(similarities, axis=1)
-
-            # Mark a new blob as a match if
-            # - The similarity score is large enough AND
-            # - This old blob hasn't alreay selected a match
-            for r, c in enumerate(best_matches):
-                mark = lambda row, c: (row[c] > SIM_SCORE_MATCH) and (-1 not in row)
-                if mark(similarities[r,:], c): similarities[r,c] = -1
-
-            # Make sure each new blob has only one match
-            # If there is a conflict, select the oldest old blob
-            matches = np.count_nonzero(similarities == -1, axis=0)
-            for c, cnt in enumerate(matches):
-                if cnt <= 1: continue # No conflict
-
-                # Compute ages of all matching old blobs
-                age  = lambda i: time.time() - old_blobs[i].first_detected
-                ages = [(age(r) if (s==-1) else -1) for r, s in enumerate(similarities[:,c])]
-
-                # Mark the oldest match and zero all other scores
-                # for this new blob to prevent it from being selected again
-                oldest = np.argmax(ages)
-                similarities[:, c] = 0
-                similarities[oldest, c] = -1
-
-                # Start over to give old blobs a chance to select a new match
-                break
-
-            # Stop iterating after all new-blob conflicts have been resolved
-            else: running = False
+    similarities = similarity_matrix(old_blobs, new_blobs)
+    matches = assign_blobs(similarities, [b.first_detected for b in old_blobs])
 
     # Prepare new tracked blobs list
     out = []
 
     # Handle new blobs
-    if len(new_blobs):
-        # No old blobs to match with
-        if len(old_blobs) == 0:
-            return new_blobs
-
-        for c, col in enumerate(similarities.T):
-            # Got a match, merge blobs
-            if -1 in col:
-                match_idx = np.where(col == -1)[0][0]
-                out.append(new_blobs[c].merge(old_blobs[match_idx]))
-
-            # No matches, add new blob
-            else: out.append(new_blobs[c])
+    # Got a match, merge blobs. No matches, add new blob
+    for c, new in enumerate(new_blobs):
+        out.append(new.merge(old_blobs[matches[c]]) if matches[c] >= 0 else new)
 
     # Handle old blobs
-    for r in range(len(old_blobs)):
+    matched = set(matches.tolist())
+    for r, old in enumerate(old_blobs):
+        if r in matched: continue
 
         # Decrement score if there were no matches
-        if (len(new_blobs) == 0) or (-1 not in similarities[r,:]):
-            old_blobs[r].lives -= 1
+        old.lives -= 1
 
-            # Keep unmatched blobs until their scores hit 0
-            if old_blobs[r].lives > 0:
-                out.append(old_blobs[r])
+        # Keep unmatched blobs until their scores hit 0
+        if old.lives > 0:
+            out.append(old)
 
     return out
+
+
+def update_cooking(blobs, slope_est):
+    """
+    Add the new history samples of the tracked blobs to their slope estimators,
+    then update the cooking state of every blob with a full history in one batch
+
+    Parameters:
+    - blobs (list (Blob)): The tracked blobs
+    - slope_est (TheilSenBatch): Slope estimators, keyed by track ID
+    """
+    # Forget blobs that are no longer tracked
+    slope_est.retain([b.track_id for b in blobs])
+
+    # Grab the newest sample of every blob with new data
+    fresh = [b for b in blobs if b.new_data_flag]
+    if not len(fresh): return
+    for b in fresh: b.new_data_flag = False
+
+    ids = [b.track_id for b in fresh]
+    samples = [b.history.last for b in fresh]
+    slope_est.add_points(ids, [s["timestamp"] for s in samples], [s["temp"] for s in samples])
+
+    # Not enough samples to make a prediction yet
+    ready = [(b, s) for b, s, full in zip(fresh, samples, slope_est.full(ids)) if full]
+    if not len(ready): return
+
+    # Find the slopes of all blobs at once using the Theil-Sen estimator
+    slopes = slope_est.get_estimates([b.track_id for b, _ in ready])
+    for (b, s), slope in zip(ready, slopes):
+        b.update_cooking(slope, s["timestamp"])
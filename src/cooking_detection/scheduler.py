@@ -0,0 +1,129 @@
+"""Decides which thermal frames get a full blob extraction"""
+
+from constants import *
+from lepton.utils import temp2raw
+import numpy as np
+import math
+import cv2
+
+
+class ExtractionScheduler:
+    """
+    Rate governor for full blob extractions.\n
+    Extractions run at 'rate' while the scene is steady, and at 'max_rate' for 'boost_time'
+    seconds after boost() is called. Frames in between only re-measure the tracked blobs
+    """
+
+    def __init__(self, rate, max_rate=COOKING_DETECT_MAX_RATE, boost_time=COOKING_DETECT_BOOST_TIME):
+        """
+        Parameters:
+        - rate (float | None): Extractions per second while the scene is steady. None extracts on every frame
+        - max_rate (float): Extractions per second while the scene is changing
+        - boost_time (float): Duration in seconds of the max rate after a change
+        """
+        self.base_rate = math.inf if rate is None else rate
+        self.max_rate = max(max_rate, self.base_rate)
+        self.boost_time = boost_time
+
+        # Capture time of the last extracted frame, and end of the current boost
+        self._last = -math.inf
+        self._boost_end = -math.inf
+
+        # Number of blobs found by the last extraction
+        self.last_count = None
+
+
+    def rate(self, timestamp):
+        """Returns (float): Target extraction rate at the given time"""
+        return self.max_rate if timestamp < self._boost_end else self.base_rate
+
+
+    def due(self, timestamp):
+        """
+        Parameters:
+        - timestamp (float): Monotonic capture time of the frame
+
+        Returns (bool): True if the frame should get a full extraction
+        """
+        # Frames arrive in steps of one frame period, allow half a period early
+        period = 1 / self.rate(timestamp) - 0.5 / RAW_THERMAL_RATE
+        return timestamp - self._last >= period
+
+
+    def extracted(self, timestamp, count):
+        """
+        Record a full extraction. A change in the number of blobs raises the rate
+
+        Parameters:
+        - timestamp (float): Monotonic capture time of the frame
+        - count (int): Number of blobs found
+        """
+        if self.last_count is not None and count != self.last_count: self.boost(timestamp)
+        self.last_count = count
+        self._last = timestamp
+
+
+    def skipped(self, timestamp):
+        """Record a due extraction that was skipped because the scene didn't change. Counts as an extraction without changing the blob count"""
+        self._last = timestamp
+
+
+    def boost(self, timestamp):
+        """Extract at the max rate for the next 'boost_time' seconds"""
+        self._boost_end = timestamp + self.boost_time
+
+
+
+class ChangeGate:
+    """
+    Detects thermal frames that are nearly identical to the last extracted one.\n
+    Frames are compared by the largest absolute difference of their downsampled (area averaged)
+    images, which also averages out sensor noise. An unchanged scene keeps the previous blobs
+    """
+
+    def __init__(self, shape=RAW_THERMAL_SHAPE, factor=CHANGE_GATE_DOWNSAMPLE, tolerance=CHANGE_GATE_TOLERANCE, max_skip_time=CHANGE_GATE_MAX_SKIP_TIME):
+        """
+        Parameters:
+        - shape (tuple (int)): Image shape
+        - factor (int): Downsampling factor
+        - tolerance (float): Largest temperature difference in celsius of an unchanged scene
+        - max_skip_time (float): Maximum duration in seconds a reference frame is used for
+        """
+        self._size = (shape[1] // factor, shape[0] // factor) # (w, h) for cv2.resize
+        self._tolerance = temp2raw(tolerance) - temp2raw(0)
+        self._max_skip_time = max_skip_time
+
+        # Downsampled reference frame, incoming frame and their difference
+        self._ref = np.empty(self._size[::-1], dtype='uint16')
+        self._small = np.empty(self._size[::-1], dtype='uint16')
+        self._diff = np.empty(self._size[::-1], dtype='uint16')
+
+        # Capture time of the reference frame
+        self._ref_time = None
+
+
+    def changed(self, frame, timestamp):
+        """
+        Parameters:
+        - frame (numpy.ndarray): The raw, 16-bit thermal image
+        - timestamp (float): Monotonic capture time of the frame
+
+        Returns (bool): True if the frame needs a full extraction
+        """
+        if self._ref_time is None or (timestamp - self._ref_time) >= self._max_skip_time: return True
+
+        cv2.resize(frame, self._size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.absdiff(self._small, self._ref, dst=self._diff)
+        return int(self._diff.max()) > self._tolerance
+
+
+    def update(self, frame, timestamp):
+        """
+        Use a frame as the new reference, after a full extraction
+
+        Parameters:
+        - frame (numpy.ndarray): The raw, 16-bit thermal image
+        - timestamp (float): Monotonic capture time of the frame
+        """
+        cv2.resize(frame, self._size, dst=self._ref, interpolation=cv2.INTER_AREA)
+        self._ref_time = timestamp
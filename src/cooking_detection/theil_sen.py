@@ -5,107 +5,244 @@ Very robust to outliers
 
 import numpy as np
 
-class TheilSenPoint:
-    def __init__(self, x, y, n_points):
-        """
-        Parameters:
-        - x (float): The independant variable
-        - y (float): The depenant variable
-        - n_points (int): The maximum number of children that can be added to this point
-        """
-        # Store point
-        self.x = x
-        self.y = y
-
-        # Create an empty slope list
-        self._slopes = np.zeros(n_points-1)
-        self._n_slopes = 0
 
-    def add_child(self, other):
+class TheilSen:
+    """
+    An incremental, windowed implementation of the Theil-Sen slope estimator.\n
+    Keeps the pairwise slopes of the retained points in a sorted array. Adding a point inserts its
+    slopes with the points already in the window, and evicting the oldest point removes its slopes,
+    both located by binary search. The median is then read directly from the middle of the array
+    """
+
+    def __init__(self, n_points):
         """
-        Introcude a new point to this point so that a pairwise slope can be calculated.
-        
         Parameters:
-        - other (TheilSenPoint): The new point to be introduced
-
-        Notes: This method will attempt to add the child even if no space is available, so be careful
-        """
-        dx = other.x - self.x
-        slope = (other.y - self.y) / (1e-6 if dx==0 else dx)
-        self._slopes[self._n_slopes] = slope
-        self._n_slopes += 1
-
-    @property
-    def valid_slopes(self):
-        """
-        Returns (tuple):
-        - (int): The number of pairwise slopes
-        - (numpy.ndarray): The list of pairwise slopes
+        - n_points (int): The maximum number of points to retain (queue size)
         """
-        return self._n_slopes, self._slopes[:self._n_slopes]
+        self._max_points = n_points
 
+        # Ring of retained points. The oldest point is at _head once the ring is full
+        self._x = np.zeros(n_points)
+        self._y = np.zeros(n_points)
+        self._head = 0
+        self._n_points = 0
 
+        # Sorted pairwise slopes of the retained points
+        self._slopes = np.empty(0)
 
-class TheilSen:
-    """An incremental implementation of the Theil-Sen slope estimator"""
 
-    def __init__(self, n_points, max_pairs=None):
+    @staticmethod
+    def _pair_slopes(x0, y0, x1, y1):
         """
-        Parameters:
-        - n_points (int): The maximum number of points to retain (queue size)
-        - max_pairs (int | None): Maximum number of pairwise slopes to consider; will use random sampling if exceded. If not specified, never use random sampling
+        Returns (numpy.ndarray): Slopes from the earlier points (x0, y0) to the later points (x1, y1).
+        Always computed in this order, so a slope is bit-identical when it is inserted and evicted
         """
-        self._max_points = n_points
-        self._max_pairs = max_pairs
+        dx = x1 - x0
+        return (y1 - y0) / np.where(dx == 0, 1e-6, dx)
 
-        self._points = []
-        self._n_points = 0
-        
 
     def add_point(self, x, y):
         """
         Add a new point to the estimator.
-        
+
         Parameters:
         - x (float): The independant variable
         - y (float): The depenant variable
         """
-        # Create new point
-        new_point = TheilSenPoint(x, y, self._max_points)
+        if self.full():
+            # Evict the oldest point and its slopes with every other point
+            slot = self._head
+            others = np.arange(self._max_points) != slot
+            old = np.sort(self._pair_slopes(self._x[slot], self._y[slot], self._x[others], self._y[others]))
+
+            # Equal slopes map to the same position, offset them to remove distinct copies
+            idx = np.searchsorted(self._slopes, old)
+            idx += np.arange(len(old)) - np.searchsorted(old, old)
+            self._slopes = np.delete(self._slopes, idx)
+
+            self._head = (self._head + 1) % self._max_points
+        else:
+            slot = self._n_points
+            others = np.arange(self._max_points) < slot
+            self._n_points += 1
+
+        # Compute pairwise slopes with all other points and insert them in order
+        new = np.sort(self._pair_slopes(self._x[others], self._y[others], x, y))
+        self._slopes = np.insert(self._slopes, np.searchsorted(self._slopes, new), new)
 
-        # Remove oldest point and append the new one
-        if self._n_points >= self._max_points: self._points.pop(0)
-        else: self._n_points += 1
-        self._points.append(new_point)
-        
-        # Compute pairwise slopes with all old points
-        for p in self._points[:-1]:
-            p.add_child(new_point)
+        # Store the new point in place of the evicted one
+        self._x[slot] = x
+        self._y[slot] = y
 
 
     def get_estimate(self):
         """Compute the slope estimate (median of pairwise slopes)."""
-        if self._n_points <= 1: return 0.0
-
-        # Create an empty array to hold pairwise slopes
-        idx = 0
-        slopes = np.zeros(int(self._n_points*(self._n_points-1)/2))
-        
-        # Collect all pairwise slopes
-        for p in self._points[:-1]:
-            count, sub_slopes = p.valid_slopes
-            slopes[idx:idx+count] = sub_slopes
-            idx += count
-
-        # Randomly sample slopes if there are too many
-        if (self._max_pairs != None) and (len(slopes) > self._max_pairs):
-            np.random.shuffle(slopes)
-            slopes = slopes[:self._max_pairs]
-
-        # Compute median slope
-        return float(np.median(slopes))
-    
+        n = len(self._slopes)
+        if n == 0: return 0.0
+
+        mid = n // 2
+        if n % 2: return float(self._slopes[mid])
+        return float((self._slopes[mid-1] + self._slopes[mid]) / 2)
+
 
     def full(self):
         """Return True if the buffer is full"""
         return self._n_points == self._max_points
+
+
+
+class TheilSenBatch:
+    """
+    Windowed Theil-Sen slope estimators for many tracks at once.\n
+    Every track's points are a row of one 2-D array (tracks x window), filled like a ring, and its
+    pairwise slopes are a sorted row of another, kept up to date incrementally like TheilSen.
+    The slopes of the new and evicted points of all updated tracks are computed in one vectorized call,
+    and the medians of all requested tracks are read from the middle of their rows at once.
+    An update costs O(n^2) per track for a window of n points, instead of sorting all n^2/2 slopes
+    """
+
+    def __init__(self, n_points, capacity=16):
+        """
+        Parameters:
+        - n_points (int): The maximum number of points to retain per track (window size)
+        - capacity (int): Initial number of tracks. Grows as needed
+        """
+        self._max_points = n_points
+
+        # Points of every track, one row each. Slots [0, count) are valid
+        self._x = np.zeros((capacity, n_points))
+        self._y = np.zeros((capacity, n_points))
+        self._count = np.zeros(capacity, dtype=int)
+        self._next = np.zeros(capacity, dtype=int) # Slot the next point is written to
+
+        # Sorted pairwise slopes of every track. The first count*(count-1)/2 are valid
+        self._slopes = np.zeros((capacity, n_points*(n_points-1)//2))
+        # Slope offsets, and a mask of the slopes kept by an update
+        self._offsets = np.arange(n_points)
+        self._keep = np.empty(n_points*(n_points-1)//2, dtype=bool)
+
+        # Row of every track, and unused rows
+        self._rows = dict()
+        self._free = list(range(capacity-1, -1, -1))
+
+
+    def _row(self, track_id):
+        """Returns (int): Row of a track. Rows are assigned to new tracks, growing the arrays if none are free"""
+        row = self._rows.get(track_id)
+        if row is not None: return row
+
+        if not len(self._free):
+            capacity = len(self._count)
+            self._x = np.concatenate((self._x, np.zeros_like(self._x)))
+            self._y = np.concatenate((self._y, np.zeros_like(self._y)))
+            self._count = np.concatenate((self._count, np.zeros_like(self._count)))
+            self._next = np.concatenate((self._next, np.zeros_like(self._next)))
+            self._slopes = np.concatenate((self._slopes, np.zeros_like(self._slopes)))
+            self._free = list(range(2*capacity-1, capacity-1, -1))
+
+        row = self._rows[track_id] = self._free.pop()
+        return row
+
+
+    def add_points(self, track_ids, x, y):
+        """
+        Add one new point to each of several tracks. The oldest point of a full track is evicted
+
+        Parameters:
+        - track_ids (list): Tracks to add to. New tracks are created. Must not repeat
+        - x (list (float)): The independant variable of each point
+        - y (list (float)): The depenant variable of each point
+        """
+        assert len(set(track_ids)) == len(track_ids), "Repeated track IDs"
+        rows = np.array([self._row(t) for t in track_ids], dtype=int)
+        if not len(rows): return
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        slots, count = self._next[rows], self._count[rows]
+        full = count == self._max_points
+        r = np.arange(len(rows))
+
+        # Points the new point is paired with: every valid one except the evicted one
+        others = np.arange(self._max_points) < count[:, None]
+        others[r, slots] = False
+        n_others = np.count_nonzero(others, axis=1)
+
+        # Sorted slopes of the evicted points with the other points, and of the new points with the other points.
+        # Always from the earlier to the later point, like TheilSen, so evicted slopes match bit for bit
+        px, py = self._x[rows], self._y[rows]
+        old = TheilSen._pair_slopes(px[r, slots][:, None], py[r, slots][:, None], px, py)
+        old[~(others & full[:, None])] = np.inf
+        old.sort(axis=1)
+        new = TheilSen._pair_slopes(px, py, x[:, None], y[:, None])
+        new[~others] = np.inf
+        new.sort(axis=1)
+
+        # Update the sorted slopes of each track
+        keep = self._keep
+        for i, row in enumerate(rows):
+            k = n_others[i]
+            slopes = self._slopes[row, :count[i] * (count[i] - 1) // 2]
+
+            # Remove the evicted point's slopes. Equal slopes map to the same position, offset them to remove distinct copies
+            if full[i]:
+                evicted = old[i, :k]
+                keep[:len(slopes)] = True
+                keep[np.searchsorted(slopes, evicted) + self._offsets[:k] - np.searchsorted(evicted, evicted)] = False
+                slopes = slopes[keep[:len(slopes)]]
+            else:
+                slopes = slopes.copy()
+
+            # Insert the new point's slopes in order: each one moves up by the new slopes before it,
+            # and the kept slopes fill the remaining positions
+            added = new[i, :k]
+            dest = np.searchsorted(slopes, added) + self._offsets[:k]
+            n_slopes = len(slopes) + k
+            keep[:n_slopes] = True
+            keep[dest] = False
+            self._slopes[row, dest] = added
+            self._slopes[row, :n_slopes][keep[:n_slopes]] = slopes
+
+        # Store the new points in place of the evicted ones
+        self._x[rows, slots] = x
+        self._y[rows, slots] = y
+        self._next[rows] = (slots + 1) % self._max_points
+        self._count[rows] = np.minimum(count + 1, self._max_points)
+
+
+    def retain(self, track_ids):
+        """
+        Forget every track not in the list and free its row
+
+        Parameters:
+        - track_ids (list): Tracks to keep
+        """
+        keep = set(track_ids)
+        for track_id in [t for t in self._rows if t not in keep]:
+            row = self._rows.pop(track_id)
+            self._count[row] = self._next[row] = 0
+            self._free.append(row)
+
+
+    def full(self, track_ids):
+        """Returns (numpy.ndarray (bool)): True for tracks whose window is full"""
+        return np.array([self._count[self._rows[t]] == self._max_points if t in self._rows else False for t in track_ids], dtype=bool)
+
+
+    def get_estimates(self, track_ids):
+        """
+        Compute the slope estimates (median of pairwise slopes) of several tracks
+
+        Parameters:
+        - track_ids (list): Tracks to estimate
+
+        Returns (numpy.ndarray): The slope of each track. NaN for tracks with fewer than 2 points
+        """
+        rows = np.array([self._rows[t] for t in track_ids], dtype=int)
+        count = self._count[rows]
+
+        # Median of the valid slopes of each row, read from the middle of the sorted rows
+        n = count * (count - 1) // 2
+        lo, hi = np.maximum(n - 1, 0) // 2, n // 2
+        out = (self._slopes[rows, lo] + self._slopes[rows, hi]) / 2
+        out[n == 0] = np.nan
+        return out
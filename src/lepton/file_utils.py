@@ -1,7 +1,37 @@
 """Functions for reading and writing video files"""
 
-from constants import RAW_THERMAL_SHAPE
+from constants import *
+from queue import Queue, Full
+import numpy as np
+import threading
+import glob
+import time
+import zlib
 import cv2
+import os
+
+# Raw16 recording layout: a fixed size header followed by fixed size records (timestamp, frame)
+_RAW16_MAGIC = b"RAW16REC"
+_RAW16_CHUNK_MAGIC = b"RAW16ZLB"
+_RAW16_VERSION = 1
+_RAW16_HEADER_SIZE = 64
+_RAW16_HEADER_DTYPE = np.dtype([
+	("magic",   "S8"),
+	("version", "<u4"),
+	("ndim",    "<u4"),
+	("shape",   "<u4", 3),
+	("dtype",   "S8"),   # numpy dtype string, e.g. '<u2'
+	("created", "<f8"),  # Epoch time the recording was started
+])
+
+# Compressed raw16 chunk layout: the same header followed by variable size records (record header, payload)
+_RAW16_CHUNK_EXT = ".r16z"
+_RAW16_CHUNK_RECORD_DTYPE = np.dtype([
+	("timestamp", "<f8"),
+	("keyframe",  "u1"),  # Payload doesn't depend on the previous frame
+	("size",      "<u4"), # Payload size in bytes
+])
+
 
 class Raw16Video:
 	"""Takes a .tiff file and returns sequential frames similar to cv2.VideoCapture"""
@@ -51,3 +81,427 @@ class SaveVideo:
 		"""Close the video file"""
 		if self.__vid.isOpened():
 			self.__vid.release()
+
+
+def _raw16_header(magic, shape, dtype):
+	"""Returns (bytes): File header of a raw16 recording"""
+	assert 1 <= len(shape) <= 3, "Frames must have 1 to 3 dimensions"
+
+	header = np.zeros((), _RAW16_HEADER_DTYPE)
+	header["magic"]   = magic
+	header["version"] = _RAW16_VERSION
+	header["ndim"]    = len(shape)
+	header["shape"][:len(shape)] = shape
+	header["dtype"]   = np.dtype(dtype).newbyteorder("<").str.encode()
+	header["created"] = time.time()
+	return header.tobytes().ljust(_RAW16_HEADER_SIZE, b"\0")
+
+
+def _read_raw16_header(f, magic):
+	"""Returns (tuple (tuple (int), numpy.dtype, float)): Frame shape, frame dtype and creation time of a raw16 recording"""
+	header = f.read(_RAW16_HEADER_SIZE)
+	assert len(header) == _RAW16_HEADER_SIZE, "File too short for a raw16 recording"
+	header = np.frombuffer(header, _RAW16_HEADER_DTYPE, count=1)[0]
+	assert header["magic"] == magic, "Not a raw16 recording, or the wrong kind"
+	assert header["version"] == _RAW16_VERSION, f"Unsupported raw16 recording version {header['version']}"
+
+	shape = tuple(int(x) for x in header["shape"][:header["ndim"]])
+	return shape, np.dtype(header["dtype"].decode()), float(header["created"])
+
+
+def raw16_record_dtype(shape, dtype):
+	"""Returns (numpy.dtype): Structured dtype of one raw16 recording record"""
+	return np.dtype([("timestamp", "<f8"), ("frame", np.dtype(dtype).newbyteorder("<"), tuple(shape))])
+
+
+class Raw16Writer:
+	"""Appends frames and their timestamps to a raw16 recording. Writes to disk on a background thread"""
+
+	def __init__(self, filename, shape=RAW_THERMAL_SHAPE, dtype='uint16', queue_size=RAW16_WRITER_QUEUE_SIZE):
+		"""Create the file and write its header"""
+
+		self.record_dtype = raw16_record_dtype(shape, dtype)
+
+		self.__file = open(filename, 'wb')
+		self.__file.write(_raw16_header(_RAW16_MAGIC, shape, dtype))
+
+		# Frame counters
+		self.written = 0 # Frames written to disk
+		self.dropped = 0 # Frames discarded because the queue was full
+
+		# Exception that stopped the writer thread, raised again by write()
+		self.error = None
+
+		# Records waiting to be written
+		self.__queue = Queue(queue_size)
+		self.__thread = threading.Thread(target=self.__run, daemon=True)
+		self.__thread.start()
+
+	def __del__(self):
+		"""Destructor"""
+		self.close()
+
+	def __run(self):
+		"""Writer thread"""
+		try:
+			while True:
+				record = self.__queue.get()
+				if record is None: break
+				self.__file.write(record.data)
+				self.written += 1
+		except BaseException as err:
+			self.error = err
+
+	def write(self, frame, timestamp=None, block=False):
+		"""
+		Queue a frame to be written. The frame is copied, so the caller can reuse its buffer
+
+		Parameters:
+		- frame (numpy.ndarray): Frame with the recording's shape
+		- timestamp (float | None): Capture time of the frame. Defaults to time.monotonic()
+		- block (bool): Wait for space in the queue instead of dropping the frame
+
+		Returns (bool): False if the frame was dropped
+		"""
+		if self.error is not None: raise self.error
+		assert not self.__file.closed, "Recording is closed"
+
+		record = np.empty((), self.record_dtype)
+		record["timestamp"] = time.monotonic() if timestamp is None else timestamp
+		record["frame"] = frame
+
+		try: self.__queue.put(record, block)
+		except Full:
+			self.dropped += 1
+			return False
+		return True
+
+	def close(self):
+		"""Write the queued frames and close the file"""
+		if not hasattr(self, "_Raw16Writer__file") or self.__file.closed: return
+		if self.__thread.is_alive():
+			self.__queue.put(None)
+			self.__thread.join()
+		self.__file.close()
+
+
+class Raw16Reader:
+	"""Reads a raw16 recording through a memory map. Frames can be read sequentially like Raw16Video or by index"""
+
+	def __init__(self, filename):
+		"""Map the file. Frames are only read from disk when accessed"""
+
+		# Header
+		with open(filename, 'rb') as f:
+			self.shape, self.dtype, self.created = _read_raw16_header(f, _RAW16_MAGIC)
+		self.record_dtype = raw16_record_dtype(self.shape, self.dtype)
+
+		# Records. A partial record left by an interrupted recording is ignored
+		n_frames = (os.path.getsize(filename) - _RAW16_HEADER_SIZE) // self.record_dtype.itemsize
+		if n_frames > 0:
+			self.records = np.memmap(filename, self.record_dtype, mode='r', offset=_RAW16_HEADER_SIZE, shape=(n_frames,))
+		else:
+			self.records = np.empty(0, self.record_dtype)
+
+		# Read-only views into the records
+		self.frames     = self.records["frame"]
+		self.timestamps = self.records["timestamp"]
+
+		# Index of the next frame returned by read(), and timestamp of the last one
+		self.index = 0
+		self.timestamp = 0.0
+
+	def __len__(self):
+		"""Returns (int): Number of frames in the recording"""
+		return len(self.records)
+
+	def __getitem__(self, index):
+		"""Returns (numpy.ndarray): Frame at an index, as a read-only view into the file"""
+		return self.frames[index]
+
+	def seek(self, index):
+		"""Set the index of the next frame returned by read()"""
+		assert 0 <= index <= len(self), "Frame index out of range"
+		self.index = index
+
+	def read(self):
+		"""Try to return the next frame, otherwise return False. The frame is a read-only view into the file"""
+		if self.index >= len(self): return False, None
+		self.timestamp = float(self.timestamps[self.index])
+		frame = self.frames[self.index]
+		self.index += 1
+		return True, frame
+
+
+def tiff_to_raw16(src, dst, fps=RAW_THERMAL_RATE, chunk_size=64):
+	"""
+	Convert a multi-page .tiff file (see Raw16Video) to a raw16 recording
+
+	Parameters:
+	- src (str): Path of the .tiff file
+	- dst (str): Path of the raw16 recording to create
+	- fps (float): Frame rate of the .tiff file. It has no timestamps, so frames are spaced 1/fps apart
+	- chunk_size (int): Number of pages to load at once
+
+	Returns (int): Number of frames converted
+	"""
+	n_frames = cv2.imcount(src, cv2.IMREAD_UNCHANGED)
+	assert n_frames > 0, "Failed to read .tiff file"
+
+	writer = None
+	try:
+		for start in range(0, n_frames, chunk_size):
+			ret, frames = cv2.imreadmulti(src, start, min(chunk_size, n_frames-start), flags=cv2.IMREAD_UNCHANGED)
+			assert ret, "Failed to read .tiff file"
+
+			for i, frame in enumerate(frames):
+				if writer is None: writer = Raw16Writer(dst, frame.shape, frame.dtype)
+				writer.write(frame, (start+i) / fps, block=True)
+	finally:
+		if writer is not None: writer.close()
+
+	return n_frames
+
+
+class Raw16DeltaCodec:
+	"""
+	Lossless compression of raw16 frames.
+
+	Each frame is stored as its difference to the previous frame (keyframes: to zero). Differences are
+	zigzag encoded so small negative values stay small, split into low and high byte planes, and compressed
+	with zlib. Neighbouring Lepton frames differ by a few counts of noise, so most high bytes are zero
+	"""
+
+	def __init__(self, shape=RAW_THERMAL_SHAPE, level=RECORDER_COMPRESSION_LEVEL):
+		"""
+		Parameters:
+		- shape (tuple (int)): Shape of a frame
+		- level (int): zlib compression level
+		"""
+		self.shape = tuple(shape)
+		self.level = level
+
+		# Previous frame, and work buffers
+		self._prev  = np.zeros(shape, dtype='uint16')
+		self._delta = np.empty(shape, dtype='uint16')
+		self._tmp   = np.empty(shape, dtype='uint16')
+		self._planes = np.empty((2, self._delta.size), dtype='uint8')
+
+	def encode(self, frame, keyframe=False):
+		"""Returns (bytes): Compressed frame. Decoding needs every frame since the last keyframe"""
+		if keyframe: self._prev.fill(0)
+
+		# Wrapping difference, then zigzag: (d << 1) ^ (d >> 15) on the signed values
+		np.subtract(frame, self._prev, out=self._delta)
+		signed = self._delta.view('int16')
+		np.right_shift(signed, 15, out=self._tmp.view('int16'))
+		np.left_shift(self._delta, 1, out=self._delta)
+		np.bitwise_xor(self._delta, self._tmp, out=self._delta)
+
+		# Byte planes
+		np.copyto(self._planes, self._delta.view('uint8').reshape(-1, 2).T)
+		np.copyto(self._prev, frame)
+		return zlib.compress(self._planes, self.level)
+
+	def decode(self, payload, keyframe=False, out=None):
+		"""Returns (numpy.ndarray): Decompressed frame, written into 'out' if given"""
+		if keyframe: self._prev.fill(0)
+		if out is None: out = np.empty(self.shape, dtype='uint16')
+
+		# Byte planes
+		planes = np.frombuffer(zlib.decompress(payload), dtype='uint8').reshape(2, -1)
+		np.copyto(self._delta.view('uint8').reshape(-1, 2).T, planes)
+
+		# Undo zigzag: (z >> 1) ^ -(z & 1), then the wrapping difference
+		np.bitwise_and(self._delta, 1, out=self._tmp)
+		np.negative(self._tmp, out=self._tmp)
+		np.right_shift(self._delta, 1, out=self._delta)
+		np.bitwise_xor(self._delta, self._tmp, out=self._delta)
+		np.add(self._prev, self._delta, out=out)
+
+		np.copyto(self._prev, out)
+		return out
+
+
+class Raw16ChunkWriter:
+	"""Writes frames to a series of lossless compressed raw16 recording files (chunks), starting a new chunk once one gets too big"""
+
+	def __init__(self, prefix, shape=RAW_THERMAL_SHAPE, chunk_size=RECORDER_CHUNK_SIZE, keyframe_interval=RECORDER_KEYFRAME_INTERVAL, level=RECORDER_COMPRESSION_LEVEL):
+		"""
+		Parameters:
+		- prefix (str): Path prefix of the chunks. Chunks are named '<prefix>_0000.r16z', '<prefix>_0001.r16z', ...
+		- shape (tuple (int)): Shape of a frame
+		- chunk_size (int): Size in bytes after which a new chunk is started
+		- keyframe_interval (int): Number of frames between keyframes. Every chunk starts with a keyframe
+		- level (int): zlib compression level
+		"""
+		self.prefix = prefix
+		self.shape = tuple(shape)
+		self.chunk_size = chunk_size
+		self.keyframe_interval = keyframe_interval
+		self.codec = Raw16DeltaCodec(shape, level)
+
+		# Paths of the chunks written so far
+		self.paths = []
+
+		# Counters
+		self.frames = 0        # Frames written
+		self.bytes_written = 0 # Bytes written, including headers
+
+		self.__file = None
+		self.__since_keyframe = 0
+
+	def __del__(self):
+		"""Destructor"""
+		self.close()
+
+	def __next_chunk(self):
+		"""Close the current chunk and start a new one"""
+		if self.__file is not None: self.__file.close()
+
+		path = f"{self.prefix}_{len(self.paths):04d}{_RAW16_CHUNK_EXT}"
+		self.__file = open(path, 'wb')
+		header = _raw16_header(_RAW16_CHUNK_MAGIC, self.shape, 'uint16')
+		self.__file.write(header)
+
+		self.paths.append(path)
+		self.bytes_written += len(header)
+		self.__since_keyframe = 0
+
+	def write(self, frame, timestamp):
+		"""
+		Compress and write a frame
+
+		Parameters:
+		- frame (numpy.ndarray): Raw16 frame
+		- timestamp (float): Capture time of the frame
+
+		Returns (int): Number of bytes written
+		"""
+		if self.__file is None or self.__file.tell() >= self.chunk_size:
+			self.__next_chunk()
+
+		keyframe = self.__since_keyframe == 0
+		payload = self.codec.encode(frame, keyframe)
+
+		record = np.zeros((), _RAW16_CHUNK_RECORD_DTYPE)
+		record["timestamp"] = timestamp
+		record["keyframe"]  = keyframe
+		record["size"]      = len(payload)
+		self.__file.write(record.tobytes())
+		self.__file.write(payload)
+
+		self.__since_keyframe = (self.__since_keyframe + 1) % self.keyframe_interval
+		self.frames += 1
+		n_bytes = record.itemsize + len(payload)
+		self.bytes_written += n_bytes
+		return n_bytes
+
+	def close(self):
+		"""Close the current chunk"""
+		if getattr(self, "_Raw16ChunkWriter__file", None) is not None:
+			self.__file.close()
+			self.__file = None
+
+
+class Raw16ChunkReader:
+	"""Reads compressed raw16 recordings (see Raw16ChunkWriter) sequentially like Raw16Video, or by index with seek()"""
+
+	def __init__(self, paths):
+		"""
+		Index the records of every chunk. Frames are only decompressed when read
+
+		Parameters:
+		- paths (str | list (str)): A chunk, or all chunks of a recording in order. A prefix given to Raw16ChunkWriter also works
+		"""
+		if isinstance(paths, str):
+			if os.path.isfile(paths): paths = [paths]
+			else: paths = sorted(glob.glob(glob.escape(paths) + "_[0-9][0-9][0-9][0-9]" + _RAW16_CHUNK_EXT))
+		assert len(paths), "No raw16 chunks found"
+		self.paths = list(paths)
+
+		# Records of every chunk: (chunk index, payload offset, payload size, keyframe)
+		self.__records = []
+		timestamps = []
+		self.shape = None
+		for i, path in enumerate(self.paths):
+			with open(path, 'rb') as f:
+				shape, _, created = _read_raw16_header(f, _RAW16_CHUNK_MAGIC)
+				assert self.shape in (None, shape), "Chunks have different frame shapes"
+				self.shape = shape
+				if i == 0: self.created = created
+
+				while True:
+					record = f.read(_RAW16_CHUNK_RECORD_DTYPE.itemsize)
+					if len(record) < _RAW16_CHUNK_RECORD_DTYPE.itemsize: break
+					record = np.frombuffer(record, _RAW16_CHUNK_RECORD_DTYPE, count=1)[0]
+					offset = f.tell()
+					if offset + int(record["size"]) > os.fstat(f.fileno()).st_size: break # Interrupted recording
+
+					self.__records.append((i, offset, int(record["size"]), bool(record["keyframe"])))
+					timestamps.append(float(record["timestamp"]))
+					f.seek(int(record["size"]), os.SEEK_CUR)
+
+		self.timestamps = np.array(timestamps)
+		self.dtype = np.dtype('uint16')
+		self.codec = Raw16DeltaCodec(self.shape)
+
+		# Frame returned by read(). Reused by the next read()
+		self.__frame = np.empty(self.shape, dtype='uint16')
+
+		# Open chunk
+		self.__file = None
+		self.__file_index = None
+
+		# Index of the next frame returned by read(), the last frame decoded, and the timestamp of the last frame read
+		self.index = 0
+		self.__decoded = -1
+		self.timestamp = 0.0
+
+	def __del__(self):
+		"""Destructor"""
+		self.close()
+
+	def __len__(self):
+		"""Returns (int): Number of frames in the recording"""
+		return len(self.__records)
+
+	def __decode(self, index):
+		"""Decompress a frame into the frame buffer. Must follow the previous frame unless it is a keyframe"""
+		chunk, offset, size, keyframe = self.__records[index]
+		if chunk != self.__file_index:
+			if self.__file is not None: self.__file.close()
+			self.__file = open(self.paths[chunk], 'rb')
+			self.__file_index = chunk
+
+		self.__file.seek(offset)
+		self.codec.decode(self.__file.read(size), keyframe, self.__frame)
+		self.__decoded = index
+
+	def seek(self, index):
+		"""Set the index of the next frame returned by read()"""
+		assert 0 <= index <= len(self), "Frame index out of range"
+		self.index = index
+
+	def read(self):
+		"""Try to return the next frame, otherwise return False. The frame stays valid until the next read()"""
+		if self.index >= len(self): return False, None
+
+		# After a seek, decode forward from the nearest keyframe
+		if self.index != self.__decoded + 1 and not self.__records[self.index][3]:
+			start = self.index
+			while not self.__records[start][3]: start -= 1
+			if not (start <= self.__decoded < self.index): self.__decoded = start - 1
+			for i in range(self.__decoded + 1, self.index): self.__decode(i)
+
+		self.__decode(self.index)
+		self.timestamp = float(self.timestamps[self.index])
+		self.index += 1
+		return True, self.__frame
+
+	def close(self):
+		"""Close the open chunk"""
+		if getattr(self, "_Raw16ChunkReader__file", None) is not None:
+			self.__file.close()
+			self.__file = None
+			self.__file_index = None
@@ -0,0 +1,114 @@
+"""Preallocated frame buffers shared by a camera callback and its reader"""
+
+from constants import LEPTON_FRAME_POOL_SIZE
+from collections import deque
+import numpy as np
+import threading
+
+
+class FramePool:
+    """
+    Fixed set of preallocated frames handed between a producer (e.g. a driver callback) and one reader.
+
+    Frames cycle free -> filled by the producer -> ready -> returned by get() -> free again on the next get().
+    Nothing is allocated per frame and the producer never writes into a frame the reader is using.
+
+    Latest frame wins: get() returns the newest ready frame and skips older ones, and when the
+    pool is full the producer reuses the oldest ready frame instead of discarding the new one
+    """
+
+    def __init__(self, shape, dtype, size=LEPTON_FRAME_POOL_SIZE):
+        """
+        Parameters:
+        - shape (tuple (int)): Shape of a frame
+        - dtype (str | numpy.dtype): Data type of a frame
+        - size (int): Number of frames in the pool. Must be >= 3 (one being filled, one ready, one in use)
+        """
+        assert size >= 3, "Frame pool needs at least three frames"
+
+        self.frames = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self.timestamps = [0.0] * size
+        self.frame_bytes = self.frames[0].nbytes
+
+        # Raw addresses of the frames, for producers that copy with ctypes.memmove()
+        self.addresses = [f.ctypes.data for f in self.frames]
+
+        # Frame indices in each state
+        self._free  = deque(range(size))
+        self._ready = deque()
+        self._in_use = None
+
+        # Guards the frame states, notified when a frame is published
+        self._cond = threading.Condition()
+
+        # Frame counters
+        self.received    = 0 # Frames published by the producer
+        self.dropped     = 0 # Ready frames the reader skipped because a newer frame was available
+        self.overwritten = 0 # Ready frames the producer reused before the reader got to them
+
+
+    def acquire(self):
+        """
+        Claim a frame to fill (producer only)
+
+        Returns (int): Index of the frame
+
+        Notes: If no frame is free, the oldest ready frame is reused
+        """
+        with self._cond:
+            if len(self._free): return self._free.popleft()
+
+            # Only one frame is filled and one is in use at a time,
+            # so a full pool always has a ready frame to reuse
+            self.overwritten += 1
+            return self._ready.popleft()
+
+
+    def publish(self, idx, timestamp):
+        """
+        Hand a filled frame to the reader (producer only)
+
+        Parameters:
+        - idx (int): Index returned by acquire()
+        - timestamp (float): Monotonic capture time of the frame
+        """
+        self.timestamps[idx] = timestamp
+        with self._cond:
+            self._ready.append(idx)
+            self.received += 1
+            self._cond.notify()
+
+
+    def get(self, timeout=0):
+        """
+        Take the newest ready frame (reader only)
+
+        Parameters:
+        - timeout (float | None): Maximum time in seconds to wait for a frame. 0 returns immediately, None waits forever
+
+        Returns (tuple (bool, numpy.ndarray, float)): Boolean indicates whether a frame was available,
+        followed by the frame and its monotonic capture time. The frame stays valid until the next get()
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._ready), timeout):
+                return False, None, 0.0
+
+            # Recycle the previous frame
+            if self._in_use is not None:
+                self._free.append(self._in_use)
+
+            # Skip stale frames
+            while len(self._ready) > 1:
+                self._free.append(self._ready.popleft())
+                self.dropped += 1
+
+            self._in_use = idx = self._ready.popleft()
+        return True, self.frames[idx], self.timestamps[idx]
+
+
+    def reset(self):
+        """Discard all ready frames and return every frame to the pool"""
+        with self._cond:
+            self._free = deque(range(len(self.frames)))
+            self._ready.clear()
+            self._in_use = None
@@ -1,16 +1,23 @@
 """PureThermal polling launcher"""
 
 from .polling_worker import polling_worker
+from .recorder import Recorder
 from ctypes import c_bool, c_double
+from misc.frame_buffer import CaptureStats
 from misc.launcher import Launcher
 from multiprocessing import Value
+from constants import RECORDER_DIRECTORY
 import logging
 
 
 class PureThermal(Launcher):
     """Class for managing the PureThermal Lepton polling worker"""
 
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        Parameters:
+        - backend (object | None): Capture backend to use instead of the camera, e.g. lepton.replay.ThermalReplay
+        """
         super().__init__()
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
@@ -21,17 +28,33 @@ class PureThermal(Launcher):
         # Flag to indicate when hotspots have been detected
         self.hotspot_detected = Value(c_bool, False) 
 
+        # Capture backend, picked by the worker if None
+        self.backend = backend
+
+        # Frame counters and latency of the polling worker
+        self.capture_stats = Value(CaptureStats, lock=False)
+
+        # Records frames from shared memory in its own process.
+        # Created by the first start_recording(), so nothing is spawned unless recording is used
+        self.recorder = None
+
+        # Frame source of the recorder, set by start()
+        self._recording_source = None
+        self._recording_event = None
+
 
     def start(self, raw16_mem, frame_event, log_queue):
         """
         Start the PureThermal polling worker
 
         Parameters:
-        - raw16_mem (multiprocessing.Array): Shared memory location of thermal camera data
-        - frame_event (NewFrameEvent): Master 'new frame' event. Set all child events when a new frame is written
+        - raw16_mem (FrameRing): Shared memory ring of thermal camera data
+        - frame_event (NewFrameEvent): Publisher of the stream. Wakes all subscribers when a new frame is written
         - log_queue (multiprocessing.Queue): Queue to handle log messages
         """
-        
+        # Remember where frames are published for start_recording()
+        self._recording_source = (raw16_mem, frame_event, log_queue)
+
         super().start(
             target=polling_worker,
             args=(
@@ -42,6 +65,55 @@ class PureThermal(Launcher):
                 log_queue,
                 self.exception_queue,
                 self.max_temp,
-                self.hotspot_detected
+                self.hotspot_detected,
+                self.capture_stats,
+                self.cpu_usage,
+                self.backend
             )
          )
+
+
+    def stop(self):
+        """
+        Shut down the worker and stop recording\n
+        Notes: Will block for a while if process is hung
+        """
+        self.stop_recording()
+        super().stop()
+
+
+    def start_recording(self, directory=RECORDER_DIRECTORY):
+        """
+        Start recording the thermal stream to disk. Frames are compressed and written by a separate process
+
+        Parameters:
+        - directory (str): Directory to write the recording to
+
+        Notes: Progress, disk bandwidth and backlog are reported through recorder.stats, once recording has started
+        """
+        assert self._recording_source is not None, "Start the polling worker before recording"
+        if self.recording():
+            self.logger.warning("Already recording")
+            return
+
+        if self.recorder is None: self.recorder = Recorder()
+
+        raw16_mem, frame_event, log_queue = self._recording_source
+        self._recording_event = frame_event.subscribe()
+        self.recorder.start(raw16_mem, self._recording_event, log_queue, directory)
+        self.logger.info(f"Recording to {self.recorder.prefix}")
+
+
+    def stop_recording(self):
+        """Stop recording. Frames already read from shared memory are still written"""
+        if self.recorder is not None: self.recorder.stop()
+
+        # Release the subscriber slot
+        if self._recording_event is not None:
+            self._recording_event.unsubscribe()
+            self._recording_event = None
+
+
+    def recording(self):
+        """Returns (bool): True if the recorder is running"""
+        return self.recorder is not None and self.recorder.running()
@@ -1,7 +1,8 @@
 """Worker process for polling PureThermal"""
 
 from misc.logs import configure_subprocess_log
-from lepton.utils import raw2temp, clip_norm
+from misc.cpu_meter import CpuMeter
+from lepton.utils import ClipNorm, HotspotEstimator
 from .uvc_windows import PureThermalWindows
 from misc.hysteresis import HysteresisBool
 from .uvc_stream import PureThermalUVC
@@ -14,19 +15,22 @@ import time
 import cv2
 
 
-def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
+def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot, capture_stats, cpu_usage, backend):
     """
     Main polling loop for PureThermal Lepton driver
 
     Parameters:
-    - mem (multiprocessing.Array): Shared memory location of raw thermal image data
-    - new (NewFrameEvent): Master 'new frame' event. Set all child events when a new frame is written
+    - mem (FrameRing): Shared memory ring of raw thermal image data
+    - new (NewFrameEvent): Publisher of the stream. Wakes all subscribers when a new frame is written
     - ports (list (int)): List of UDP ports to stream image data to
     - stop (multiprocessing.Event): Flag that indicates when to suspend process
     - log (multiprocessing.Queue): Queue to handle log messages
     - errs (multiprocessing.Queue): Queue to dump errors raised by worker
     - max_temp (multiprocessing.Value (double)): Maximum detected temperature
     - hotspot (multiprocessing.Value (bool)): Flag to indicate when hotspots have been detected
+    - capture_stats (CaptureStats): Received/processed/dropped/overwritten frame counters and capture-to-publish latency
+    - cpu_usage (multiprocessing.Value (double)): CPU usage of the worker in percent of one core
+    - backend (object | None): Capture backend with the PureThermalUVC interface (e.g. ThermalReplay). Picked by platform if None
     """
     # === Setup ===
     try:
@@ -37,13 +41,12 @@ def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
         logger = logging.getLogger(__name__)
         logger.setLevel(logging.DEBUG)
 
-        # Create numpy array backed by shared memory
-        frame_dst = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16', buffer=mem.get_obj())
-
         # Create UVC streaming object
         # TODO: In theory, libuvc should work on windows as well.
         # I just have not had much luck trying to install it
-        if platform.system() == "Linux":
+        if backend is not None:
+            lep = backend
+        elif platform.system() == "Linux":
             lep = PureThermalUVC(LIBUVC_DLL_PATH)
         elif platform.system() == "Windows":
             lep = PureThermalWindows()
@@ -52,12 +55,15 @@ def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
         logger.debug("Connecting to PureThermal")
         lep.start_stream()
 
+        # Hottest spot finder
+        get_max_temp = HotspotEstimator(RAW_THERMAL_SHAPE)
+
         # Wait for first frame
         start = time.time()
         while True: 
             assert (time.time()-start) < 5, "Lepton did not send any data"
 
-            ret, frame = lep.read()
+            ret, frame = lep.read(0.5)
             if ret:
                 max_temp.value = get_max_temp(frame)[0] # Initialize value
                 break
@@ -67,6 +73,10 @@ def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
         # Create monitor
         monitor = MonitorServer()
 
+        # Auto-ranging 8-bit conversion for the monitor output
+        monitor_norm = ClipNorm(shape=RAW_THERMAL_SHAPE)
+        monitor_8bit = np.empty(RAW_THERMAL_SHAPE, dtype='uint8')
+
         # Timestamp for camera watchdog timer
         last_good_frame = time.time()
 
@@ -74,6 +84,9 @@ def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
         # Same as output flag, but needed to declare locally because reasons
         hotspot_detected = HysteresisBool(HOTSPOT_TRIP_TIME, HOTSPOT_RELEASE_TIME)
 
+        # CPU usage measurement
+        cpu_meter = CpuMeter(cpu_usage)
+
     # Add errors to queue
     except BaseException as err:
         errs.put(err, False)
@@ -85,8 +98,11 @@ def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
     # === Loop ===
     while not stop.is_set():
         try:
-            # Grab frame
-            ret, frame = lep.read()
+            # Measure CPU usage
+            cpu_meter.update()
+
+            # Wait for the newest frame
+            ret, frame = lep.read(0.5)
             if ret: last_good_frame = time.time()
             else: 
                 assert (time.time() - last_good_frame) < PURETHERMAL_TIMEOUT, "Camera connection timed out"
@@ -96,25 +112,30 @@ def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
             frame = np.flipud(frame)
 
             # Copy frame to shared memory
-            if not mem.get_lock().acquire(timeout=0.5): continue
-            np.copyto(frame_dst, frame)
-            mem.get_lock().release()
+            mem.write(frame, lep.capture_time)
 
             # Set new frame flag
             new.set()
 
+            # Update frame counters
+            capture_stats.grabbed     = lep.received
+            capture_stats.processed  += 1
+            capture_stats.dropped     = lep.dropped
+            capture_stats.overwritten = lep.overwritten
+            capture_stats.latency     = time.monotonic() - lep.capture_time
+
             # Apply exponential moving average (EMA) filter to max_temp
             t_max, t_max_loc = get_max_temp(frame)
             max_temp.value *= 1-HOTSPOT_EMA_ALPHA
             max_temp.value +=   HOTSPOT_EMA_ALPHA*t_max
 
             # Update 'hotpot detected' flag
-            hotspot_detected.value = max_temp.value > BLOB_MIN_TEMP
+            hotspot_detected.update(max_temp.value > BLOB_MIN_TEMP, lep.capture_time)
             hotspot.value = hotspot_detected.value
 
             # Show monitor output
             if len(ports):
-                frame = cv2.applyColorMap(clip_norm(frame), cv2.COLORMAP_INFERNO)
+                frame = cv2.applyColorMap(monitor_norm(frame, monitor_8bit), cv2.COLORMAP_INFERNO)
                 # cv2.circle(frame, t_max_loc, 3, (0, 255, 0), -1)
                 monitor.show(frame, *ports)
 
@@ -140,21 +161,3 @@ def polling_worker(mem, new, ports, stop, log, errs, max_temp, hotspot):
         logger.exception("Termination error:")
 
     else: logger.debug("Termination routine completed. Exiting...")
-
-
-def get_max_temp(frame):
-    """
-    Gets the hottest temperature in the image and its coordinates
-    
-    Parameters:
-    - frame (numpy.ndarray): Raw-16 image array
-    
-    Returns (tuple):
-    - (float) Maximum temperature in celsius
-    - (tuple (int, int)): The image coordinates (x, y) of the hottest pixel
-    
-    Note: I had to truncate the 16-bit array to 8-bit so the temperature accuracy is +/- 2.56 C
-    """
-    frame = cv2.medianBlur((frame >> 8).astype("uint8"), 7) # Filter outliers
-    _, t_max, _, loc = cv2.minMaxLoc(frame)
-    return raw2temp(int(t_max) << 8), loc
@@ -0,0 +1,57 @@
+"""Thermal recorder launcher"""
+
+from .recorder_worker import recorder_worker, RecorderStats
+from misc.launcher import Launcher
+from multiprocessing import Value
+from constants import RECORDER_DIRECTORY
+import logging
+import time
+import os
+
+
+class Recorder(Launcher):
+    """Class for managing the thermal recorder worker"""
+
+    def __init__(self):
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.DEBUG)
+
+        # Frame counters, disk bandwidth and backlog
+        self.stats = Value(RecorderStats, lock=False)
+
+        # Path prefix of the current (or last) recording
+        self.prefix = None
+
+
+    def start(self, raw16_mem, frame_event, log_queue, directory=RECORDER_DIRECTORY):
+        """
+        Start recording to a new set of files
+
+        Parameters:
+        - raw16_mem (FrameRing): Shared memory ring of raw16 frame data
+        - frame_event (NewFrameConsumer): Flag that indicates when a new frame is available
+        - log_queue (multiprocessing.Queue): Queue used to transfer log records from a subrocess to the main process
+        - directory (str): Directory to write the recording to. Files are named after the start time
+        """
+        if self.running():
+            self.logger.warning("The worker is already running")
+            return
+
+        # Reset counters
+        for name, _ in RecorderStats._fields_: setattr(self.stats, name, 0)
+        self.prefix = os.path.join(directory, time.strftime("thermal_%Y%m%d_%H%M%S"))
+
+        super().start(
+            target=recorder_worker,
+            args=(
+                raw16_mem,
+                frame_event,
+                self.suspend_sig,
+                log_queue,
+                self.exception_queue,
+                self.prefix,
+                self.stats,
+                self.cpu_usage
+            )
+        )
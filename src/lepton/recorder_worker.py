@@ -0,0 +1,201 @@
+"""Worker process for recording thermal frames to disk"""
+
+from misc.logs import configure_subprocess_log
+from misc.frame_buffer import ReaderStats
+from misc.cpu_meter import CpuMeter
+from .file_utils import Raw16ChunkWriter
+from ctypes import Structure, c_uint32, c_uint64, c_double
+from queue import Queue, Empty
+from constants import *
+import numpy as np
+import threading
+import logging
+import time
+import os
+
+
+class RecorderStats(Structure):
+    """Recorder counters. Create with multiprocessing.Value(RecorderStats, lock=False)"""
+    _fields_ = [
+        ("frames",    c_uint64), # Number of frames written to disk
+        ("dropped",   c_uint64), # Number of frames published while recording that were not recorded
+        ("bytes",     c_uint64), # Number of bytes written to disk
+        ("chunks",    c_uint32), # Number of chunk files started
+        ("backlog",   c_uint32), # Number of frames waiting to be compressed and written
+        ("bandwidth", c_double), # Disk write rate in bytes per second, averaged over RECORDER_STATS_PERIOD
+        ("ratio",     c_double), # Compressed size over raw size of the recorded frames
+    ]
+
+
+class DiskWriter(threading.Thread):
+    """Compresses and writes queued frames, so slow disk writes don't make the worker miss frames"""
+
+    def __init__(self, writer: Raw16ChunkWriter, stats, queue_size=RECORDER_QUEUE_SIZE):
+        """
+        Parameters:
+        - writer (Raw16ChunkWriter): Recording to write to. Must not be used by any other thread
+        - stats (RecorderStats): Shared counters to update as frames are written
+        - queue_size (int): Number of preallocated frame buffers
+        """
+        super().__init__(daemon=True)
+        self.writer = writer
+        self.stats = stats
+
+        # Exception that stopped the thread
+        self.error = None
+
+        # Frame buffers cycle free -> pending -> free
+        self.free = Queue()
+        self.pending = Queue()
+        for _ in range(queue_size):
+            self.free.put(np.empty(writer.shape, dtype='uint16'))
+
+
+    def run(self):
+        raw_bytes = 0
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None: break
+
+                frame, timestamp = item
+                self.writer.write(frame, timestamp)
+                self.free.put(frame)
+
+                raw_bytes += frame.nbytes
+                self.stats.frames  = self.writer.frames
+                self.stats.bytes   = self.writer.bytes_written
+                self.stats.chunks  = len(self.writer.paths)
+                self.stats.ratio   = self.writer.bytes_written / raw_bytes
+
+        except BaseException as err:
+            self.error = err
+
+
+    def stop(self):
+        """Write the queued frames and wait for the thread to exit"""
+        if self.is_alive():
+            self.pending.put(None)
+            self.join()
+
+
+
+def recorder_worker(mem, new, stop, log, errs, prefix, stats, cpu_usage):
+    """
+    Main recording loop. Copies every new frame out of shared memory and hands it to a writer thread
+
+    Parameters:
+    - mem (FrameRing): Shared memory ring of raw thermal image data
+    - new (NewFrameConsumer): Flag that indicates when a new frame is available
+    - stop (multiprocessing.Event): Flag that indicates when to suspend process
+    - log (multiprocessing.Queue): Queue to handle log messages
+    - errs (multiprocessing.Queue): Queue to dump errors raised by worker
+    - prefix (str): Path prefix of the recording's chunk files
+    - stats (RecorderStats): Recorder counters, disk bandwidth and backlog
+    - cpu_usage (multiprocessing.Value (double)): CPU usage of the worker in percent of one core
+    """
+    # === Setup ===
+    try:
+        # Configure subprocess logs
+        configure_subprocess_log(log)
+
+        # Create logger
+        logger = logging.getLogger(__name__)
+        logger.setLevel(logging.DEBUG)
+
+        # Create recording
+        directory = os.path.dirname(prefix)
+        if directory: os.makedirs(directory, exist_ok=True)
+        writer = Raw16ChunkWriter(prefix, mem.shape)
+
+        # Compress and write on a separate thread
+        disk = DiskWriter(writer, stats)
+        disk.start()
+
+        # Create reader for the shared memory ring
+        reader_stats = ReaderStats()
+        reader = mem.reader(reader_stats)
+
+        # Frames skipped while every buffer was queued
+        overflow = 0
+
+        # Disk bandwidth measurement
+        last_stats = time.monotonic()
+        last_bytes = 0
+
+        # CPU usage measurement
+        cpu_meter = CpuMeter(cpu_usage)
+
+    # Add errors to queue
+    except BaseException as err:
+        errs.put(err, False)
+        logger.exception("Setup error:")
+        stop.set() # Skip loop
+
+    else: logger.debug(f"Setup complete, recording to {prefix}...")
+
+    # === Loop ===
+    while not stop.is_set():
+        try:
+            # Measure CPU usage
+            cpu_meter.update()
+
+            # Writer thread died
+            if disk.error is not None: raise disk.error
+
+            # Update disk bandwidth and backlog
+            now = time.monotonic()
+            if (now - last_stats) >= RECORDER_STATS_PERIOD:
+                stats.bandwidth = (stats.bytes - last_bytes) / (now - last_stats)
+                last_stats, last_bytes = now, stats.bytes
+            stats.backlog = disk.pending.qsize()
+
+            # Wait for new frame
+            if not new.wait(timeout=0.5): continue
+            else: new.clear()
+
+            # Signals can outlive the frame they announced, don't record the same frame twice
+            if not reader.new_frame(): continue
+
+            # Get a free buffer. The frame is dropped if the disk has fallen behind
+            try: frame = disk.free.get_nowait()
+            except Empty:
+                # Skip up to the newest frame, so the next read doesn't count the same frames again as a gap
+                seq = mem.latest
+                overflow += max(0, seq - reader.last_seq)
+                reader.last_seq = max(reader.last_seq, seq)
+                stats.dropped = reader_stats.dropped + overflow
+                continue
+
+            # Copy the frame out, the ring is overwritten long before it is written to disk
+            ret, _ = reader.read(out=frame)
+            if not ret:
+                disk.free.put(frame)
+                continue
+
+            disk.pending.put((frame, reader.header.timestamp))
+            stats.dropped = reader_stats.dropped + overflow
+
+        # Add errors to queue
+        except BaseException as err:
+            errs.put(err, False)
+            logger.exception("Loop error:")
+            stop.set() # Exit loop
+
+    # === Terminate ===
+    try:
+        try: disk.stop()
+        except UnboundLocalError: pass
+
+        try: writer.close()
+        except UnboundLocalError: pass
+
+        stats.backlog = 0
+        stats.bandwidth = 0.0
+
+    # Add errors to queue
+    except BaseException as err:
+        errs.put(err, False)
+        logger.exception("Termination error:")
+
+    else: logger.debug("Termination routine completed. Exiting...")
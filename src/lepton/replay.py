@@ -0,0 +1,180 @@
+"""Capture backend that replays thermal recordings in place of the PureThermal board"""
+
+from .file_utils import Raw16Reader, Raw16ChunkReader
+from constants import RAW_THERMAL_RATE
+import numpy as np
+import logging
+import time
+import cv2
+import os
+
+
+class TiffFrames:
+    """Frames of a multi-page .tiff file with the same interface as Raw16Reader. Timestamps are spaced 1/fps apart"""
+
+    def __init__(self, filename, fps=RAW_THERMAL_RATE):
+        ret, self.frames = cv2.imreadmulti(filename=filename, flags=cv2.IMREAD_UNCHANGED)
+        assert ret, "Failed to read .tiff file"
+        self.timestamps = np.arange(len(self.frames)) / fps
+        self.index = 0
+        self.timestamp = 0.0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def seek(self, index):
+        assert 0 <= index <= len(self), "Frame index out of range"
+        self.index = index
+
+    def read(self):
+        if self.index >= len(self): return False, None
+        self.timestamp = float(self.timestamps[self.index])
+        frame = self.frames[self.index]
+        self.index += 1
+        return True, frame
+
+
+def open_recording(path, fps=RAW_THERMAL_RATE):
+    """
+    Open a thermal recording of any supported format
+
+    Parameters:
+    - path (str): A .tiff file, a .raw16 recording, or a compressed recording (a chunk or the prefix of its chunks)
+    - fps (float): Frame rate of .tiff files, which have no timestamps
+
+    Returns (TiffFrames | Raw16Reader | Raw16ChunkReader): Reader with timestamps, seek() and read()
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".tif", ".tiff"): return TiffFrames(path, fps)
+    if ext == ".raw16": return Raw16Reader(path)
+    return Raw16ChunkReader(path)
+
+
+class ThermalReplay:
+    """
+    Replays a thermal recording through the same interface as PureThermalUVC, so the real polling worker
+    (and everything downstream of it) can run without a camera.
+
+    Frames are delivered at the recorded pace scaled by 'speed', or as fast as the reader asks for them if speed is 0.
+    Like the camera, a paced replay skips frames the reader was too slow to take (counted as dropped).
+    Once the recording ends, read() stops returning frames unless 'loop' is set
+
+    Notes: Pass to the PureThermal launcher. The recording is only opened by start_stream(), in the worker process
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, fps=RAW_THERMAL_RATE):
+        """
+        Parameters:
+        - path (str): Recording to replay, see open_recording()
+        - speed (float): Playback speed. 1 is real time, 0 is as fast as possible
+        - loop (bool): Start over at the end of the recording
+        - fps (float): Frame rate of .tiff files, which have no timestamps
+        """
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.fps = fps
+
+        # Monotonic capture time of the last frame returned by read()
+        self.capture_time = 0.0
+
+        # Frame counters
+        self.received = 0    # Frames that became due
+        self.dropped = 0     # Frames skipped because the reader was too slow
+        self.overwritten = 0 # Always 0, the replay doesn't buffer frames
+
+        self._recording = None
+
+
+    def __getstate__(self):
+        # Open recordings (memory maps, files) can't be pickled, start_stream() reopens it in the worker
+        state = self.__dict__.copy()
+        state["_recording"] = None
+        return state
+
+
+    def start_stream(self):
+        """Opens the recording and starts the replay clock"""
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.DEBUG)
+
+        self._recording = open_recording(self.path, self.fps)
+        assert len(self._recording), "Recording is empty"
+        self.logger.debug(f"Replaying {len(self._recording)} frames from {self.path}")
+
+        # Recording time of every frame, relative to the first
+        self._times = np.asarray(self._recording.timestamps, dtype=np.float64)
+        self._times = self._times - self._times[0]
+
+        # Length of one pass, for looping
+        period = (self._times[-1] / (len(self._times) - 1)) if len(self._times) > 1 else 1 / self.fps
+        self._duration = self._times[-1] + period
+
+        self._index = 0  # Index of the next frame
+        self._pass = 0   # Number of completed passes
+        self._start = time.monotonic()
+
+
+    def stop_stream(self):
+        """Closes the recording"""
+        if hasattr(self._recording, "close"): self._recording.close()
+        self._recording = None
+
+
+    def _due(self, index):
+        """Returns (float): Monotonic time at which a frame of the current pass is delivered"""
+        return self._start + (self._pass * self._duration + self._times[index]) / self.speed
+
+
+    def read(self, timeout=0):
+        """
+        Read the next frame of the recording
+
+        Parameters:
+        - timeout (float | None): Maximum time in seconds to wait for a frame. 0 returns immediately, None waits until the next frame
+
+        Returns (tuple [bool, np.array]): First returns True if frame is valid,
+        then the frame (None if invalid). The frame stays valid until the next read()
+        """
+        n_frames = len(self._times)
+
+        # End of the recording
+        if self._index >= n_frames:
+            if not self.loop:
+                if timeout: time.sleep(timeout)
+                return False, None
+            self._index = 0
+            self._pass += 1
+
+        # Pace the replay
+        now = time.monotonic()
+        if self.speed > 0:
+            due = self._due(self._index)
+            if due > now:
+                if timeout is not None and due - now > timeout:
+                    time.sleep(timeout)
+                    return False, None
+                time.sleep(due - now)
+                now = due
+
+            # Skip frames the reader was too slow for, like the camera would
+            skip = self._index
+            while skip+1 < n_frames and self._due(skip+1) <= now: skip += 1
+            self.received += skip - self._index
+            self.dropped  += skip - self._index
+            if skip != self._index: self._recording.seek(skip)
+            self._index = skip
+            self.capture_time = self._due(self._index)
+        else:
+            self.capture_time = now
+
+        # Start of a new pass
+        if self._recording.index != self._index: self._recording.seek(self._index)
+
+        ret, frame = self._recording.read()
+        if not ret: return False, None
+        self._index += 1
+        self.received += 1
+
+        # Recordings hold frames as published to shared memory, undo the flip the polling worker applies
+        return True, np.flipud(frame)
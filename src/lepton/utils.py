@@ -1,6 +1,9 @@
 """Helper functions for manipulating lepton images"""
 
+from constants import HOTSPOT_FILTER_SIZE
+from functools import lru_cache
 import numpy as np
+import cv2
 
 # Temp. conversion helpers
 def f2c(f):
@@ -23,7 +26,73 @@ def raw2temp(raw):
 
 
 # Image manipulation methods
-def clip_norm(img, min_val=None, max_val=None):
+class ClipNorm:
+	"""
+	Clip/normalize engine for 16-bit images.\n
+	Fixed limits use a precomputed 65,536-entry uint16 -> uint8 lookup table.
+	Missing limits are taken from the min/max pixel value of each image, which is then scaled
+	straight into the 8-bit output (rounded rather than truncated like the table)
+	"""
+
+	def __init__(self, min_val=None, max_val=None, shape=None):
+		"""
+		Parameters:
+		- min_val (int, None): Lower clipping limit. Uses the min pixel value if not given
+		- max_val (int, None): Upper clipping limit. Uses the max pixel value if not given
+		- shape (tuple (int), None): Image shape, used to preallocate scratch buffers
+		"""
+		self.min_val = min_val
+		self.max_val = max_val
+
+		# Lookup table for fixed limits
+		self.lut = None
+		if min_val is not None and max_val is not None:
+			self.lut = self._build_lut(min_val, max_val, np.arange(65536))
+
+		# Scratch buffer for clipping when only one limit is fixed
+		self._tmp = None if shape is None else np.empty(shape, dtype='uint16')
+
+	@staticmethod
+	def _build_lut(min_val, max_val, values):
+		"""Map 'values' to 8-bit. Same arithmetic as normalizing the image directly"""
+		values = np.clip(values, min_val, max_val) - min_val
+		return (values * (255/(max_val-min_val+0.001))).astype('uint8')
+
+	def __call__(self, img, dst=None):
+		"""
+		Parameters:
+		- img (Mat): 16-bit image to be clipped/normed
+		- dst (Mat, None): 8-bit array to write the result into. Allocated if not given
+
+		Returns (Mat): The 8-bit image
+		"""
+		if dst is None: dst = np.empty(img.shape, dtype='uint8')
+
+		# Fixed limits, single table lookup
+		if self.lut is not None:
+			return np.take(self.lut, img, out=dst, mode='clip')
+
+		min_val = int(img.min()) if self.min_val is None else self.min_val
+		max_val = int(img.max()) if self.max_val is None else self.max_val
+
+		# A fixed limit can cut into the pixel range, clip to it first
+		if self.min_val is not None or self.max_val is not None:
+			if self._tmp is None or self._tmp.shape != img.shape:
+				self._tmp = np.empty(img.shape, dtype='uint16')
+			img = np.clip(img, min_val, max_val, out=self._tmp)
+
+		# Map [min_val, max_val] to [0, 255] in one pass
+		scale = 255/(max_val-min_val+0.001)
+		return cv2.convertScaleAbs(img, dst=dst, alpha=scale, beta=-min_val*scale)
+
+
+@lru_cache(maxsize=8)
+def _clip_norm_engine(min_val, max_val):
+	"""Returns (ClipNorm): Engine for the given limits, shared by clip_norm() calls. Only the most recent few are kept"""
+	return ClipNorm(min_val, max_val)
+
+
+def clip_norm(img, min_val=None, max_val=None, dst=None):
 	"""
 	Limit pixel values (usually 16-bit) to a given range and normalize to 8-bit.
 	
@@ -31,20 +100,50 @@ def clip_norm(img, min_val=None, max_val=None):
 	- img (Mat): Image to be clipped/normed
 	- min_val (int, None): Lower clipping limit
 	- max_val (int, None): Upper clipping limit
+	- dst (Mat, None): 8-bit array to write the result into. Allocated if not given
 	
-	Notes: Uses min/max pixel value if min_val/max_val are not given
-    """
-	
-	if min_val == None: min_val = int(min(img.flatten()))
-	if max_val == None: max_val = int(max(img.flatten()))
+	Notes: Uses min/max pixel value if min_val/max_val are not given.
+	Workers should hold their own ClipNorm to avoid per-call allocations
+	"""
+	return _clip_norm_engine(min_val, max_val)(img, dst)
+
+
+class HotspotEstimator:
+	"""
+	Finds the hottest spot in 16-bit thermal images at full radiometric precision.\n
+	A median filter rejects dead/hot pixels and other small outliers before taking the max.
+	The full-frame filter buffer is allocated once
+	"""
+
+	def __init__(self, shape, ksize=HOTSPOT_FILTER_SIZE):
+		"""
+		Parameters:
+		- shape (tuple (int)): Image shape
+		- ksize (int): Median filter size. OpenCV supports 3 or 5 for 16-bit images
+		"""
+		assert ksize in (3, 5), "16-bit median filter size must be 3 or 5"
+		self.ksize = ksize
+		self._filtered = np.empty(shape, dtype='uint16')
+
+	def __call__(self, img):
+		"""
+		Parameters:
+		- img (Mat): Raw-16 image
 
-	# Clip image
-	img = np.clip(img.flatten(), min_val, max_val).reshape(img.shape)
+		Returns (tuple):
+		- (float) Maximum temperature in celsius
+		- (tuple (int, int)): The image coordinates (x, y) of the hottest spot
+		"""
+		# Locate the hotspot on the filtered image
+		cv2.medianBlur(img, self.ksize, dst=self._filtered)
+		_, t_max, _, loc = cv2.minMaxLoc(self._filtered)
 
-	# Map limits to 8-bit
-	# Surely there's a function for this
-	img = np.multiply(np.subtract(img, min_val), 255/(max_val-min_val+0.001))
-	return img.astype('uint8')
+		# The median flattens narrow peaks, so read the value from the raw pixels around it.
+		# Taking the second highest still rejects a single outlier next to the hotspot
+		x, y = loc
+		window = img[max(y-1, 0):y+2, max(x-1, 0):x+2].ravel()
+		t_max = max(t_max, np.partition(window, -2)[-2])
+		return raw2temp(int(t_max)), loc
 
 
 def hist_equalize(img, clipped=False):
@@ -1,15 +1,16 @@
 """Stream video from the PureThermal Lepton driver using libuvc"""
 
 from .uvc_structs import *
-from queue import Queue
+from .frame_pool import FramePool
 from constants import *
 import numpy as np
 import logging
+import time
 
 
-class QueueStruct(Structure):
-    """ctypes structure to wrap a Python queue object"""
-    _fields_ = [("queue", py_object)]
+class PoolStruct(Structure):
+    """ctypes structure to wrap a Python FramePool object"""
+    _fields_ = [("pool", py_object)]
 
 
 class PureThermalUVC:
@@ -27,15 +28,18 @@ class PureThermalUVC:
         # Load libuvc library
         self.libuvc = cdll.LoadLibrary(libuvc_dll)
 
-        # Queue to buffer frame data
-        self.frame_queue = Queue(2)
+        # Preallocated frames the callback copies into
+        self.frame_pool = FramePool(RAW_THERMAL_SHAPE, 'uint16')
 
-        # Ctypes wrapper for frame queue
-        self.frame_queue_struct = QueueStruct(self.frame_queue)
+        # Ctypes wrapper for frame pool
+        self.frame_pool_struct = PoolStruct(self.frame_pool)
 
         # Create pointer for stream control object
         self.ctrl = uvc_stream_ctrl()
 
+        # Monotonic capture time of the last frame returned by read()
+        self.capture_time = 0.0
+
 
     def start_stream(self):
         """Connects to PureThermal board and opens the raw-16 video stream"""
@@ -46,8 +50,7 @@ class PureThermalUVC:
             return
 
         # Clear old frames
-        while not self.frame_queue.empty():
-            self.frame_queue.get_nowait()
+        self.frame_pool.reset()
 
         # Initialize the libuvc context
         temp = POINTER(uvc_context)()
@@ -95,12 +98,12 @@ class PureThermalUVC:
         assert res == 0, f"uvc_get_stream_ctrl_format_size error: {res} {uvc_err_msg(res)}"
 
         # Start stream
-        queue_ptr = pointer(self.frame_queue_struct)
+        pool_ptr = pointer(self.frame_pool_struct)
         res = self.libuvc.uvc_start_streaming(
             self.devh,          # Device handle
             byref(self.ctrl),   # Device control object
             FRAME_CALLBACK_PTR, # Frame callback
-            queue_ptr,          # User pointer
+            pool_ptr,           # User pointer
             0                   # Flags
         )
         assert res == 0, f"uvc_start_streaming error: {res} {uvc_err_msg(res)}"
@@ -157,47 +160,66 @@ class PureThermalUVC:
             self.logger.warning(f"Failed to set shutter mode. Expected {str(mode)}, got {str(shutter_obj.shutterMode)}.")
 
 
-    def read(self):
+    @property
+    def received(self):
+        """(int): Number of frames delivered by the driver"""
+        return self.frame_pool.received
+
+
+    @property
+    def dropped(self):
+        """(int): Number of frames skipped by read() because a newer frame was available"""
+        return self.frame_pool.dropped
+
+
+    @property
+    def overwritten(self):
+        """(int): Number of buffered frames replaced by newer ones before read() got to them"""
+        return self.frame_pool.overwritten
+
+
+    def read(self, timeout=0):
         """
-        Read a frame (if available) from the active stream
+        Read the newest frame (if available) from the active stream
+
+        Parameters:
+        - timeout (float | None): Maximum time in seconds to wait for a frame. 0 returns immediately, None waits forever
         
         Returns (tuple [bool, np.array]): First returns True if frame is valid,
-        then the frame (None if invalid)
+        then the frame (None if invalid). The frame stays valid until the next read()
         """
-        if self.frame_queue.empty():
-            return False, None
-        
-        return True, self.frame_queue.get_nowait()
-
+        ret, frame, capture_time = self.frame_pool.get(timeout)
+        if ret: self.capture_time = capture_time
+        return ret, frame
 
 
-def py_frame_callback(frame_struct_ptr, queue_struct_ptr):
+def py_frame_callback(frame_struct_ptr, pool_struct_ptr):
     """Callback function for new frame data. Invoked by libuvc"""
 
     # Dereference frame struct pointer and get contents
     frame = cast(frame_struct_ptr, POINTER(uvc_frame)).contents
-    
-    # Get frame dimensions
-    w = frame.width
-    h = frame.height
+
+    # Dereference the pool struct pointer and extract the python frame pool
+    frame_pool = cast(pool_struct_ptr, POINTER(PoolStruct)).contents.pool
 
     # Check data size (bytes)
-    if frame.data_bytes != 2*(w*h): return
+    if frame.data_bytes != frame_pool.frame_bytes: return
+    if frame.width*frame.height*2 != frame_pool.frame_bytes: return
 
-    # Get a pointer to the array
-    array_pointer = cast(frame.data, POINTER(c_uint16*(w*h)))
+    # Claim a buffer. Replaces the oldest unread frame if the reader has fallen behind
+    idx = frame_pool.acquire()
 
-    # Specify the data type and shape
-    data = np.frombuffer(array_pointer.contents, dtype=np.dtype(np.uint16))
-    data = data.reshape(h, w)
+    # Convert libuvc's capture time (system clock) to the monotonic clock
+    # Fall back to the arrival time if the driver didn't fill it in
+    capture_time = frame.capture_time.tv_sec + 1e-6*frame.capture_time.tv_usec
+    if capture_time > 0: capture_time -= time.time() - time.monotonic()
+    else: capture_time = time.monotonic()
 
-    # Dereference the queue struct pointer and extract the python queue
-    queue_ptr = cast(queue_struct_ptr, POINTER(QueueStruct))
-    frame_queue = queue_ptr.contents.queue
+    # Copy out of libuvc's buffer, which is reused once the callback returns
+    memmove(frame_pool.addresses[idx], frame.data, frame_pool.frame_bytes)
 
-    # Add the frame to the buffer
-    try: frame_queue.put(data, block=False)
-    except: pass
+    # Hand the frame to the reader
+    frame_pool.publish(idx, capture_time)
 
 # Create pointer to callback function
 FRAME_CALLBACK_PTR = CFUNCTYPE(None, POINTER(uvc_frame), c_void_p)(py_frame_callback)
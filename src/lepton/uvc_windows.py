@@ -1,9 +1,11 @@
 """Class for handling PureThermal UVC stream on Windows"""
 
-from multiprocessing import Queue
+from .frame_pool import FramePool
+from constants import RAW_THERMAL_SHAPE
 import numpy as np
 import platform
 import logging
+import time
 import sys
 import os
 
@@ -44,8 +46,12 @@ class PureThermalWindows:
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
 
-        # Queue to buffer frame data
-        PureThermalWindows.frame_queue = Queue(2)
+        # Preallocated frames the callback copies into
+        # Class attribute because the SDK callback has no user pointer
+        PureThermalWindows.frame_pool = FramePool(RAW_THERMAL_SHAPE, 'uint16')
+
+        # Monotonic capture time of the last frame returned by read()
+        self.capture_time = 0.0
 
         # Lepton capture object
         self.capture = IR16Capture()
@@ -89,6 +95,7 @@ class PureThermalWindows:
         assert self.lep.sys.GetGainMode() == self.CCI.Sys.GainMode.HIGH
 
         # Begin/restart video capture
+        self.frame_pool.reset()
         self.capture.RunGraph()
 
 
@@ -98,17 +105,37 @@ class PureThermalWindows:
             self.capture.StopGraph()
 
 
-    def read(self):
+    @property
+    def received(self):
+        """(int): Number of frames delivered by the driver"""
+        return self.frame_pool.received
+
+
+    @property
+    def dropped(self):
+        """(int): Number of frames skipped by read() because a newer frame was available"""
+        return self.frame_pool.dropped
+
+
+    @property
+    def overwritten(self):
+        """(int): Number of buffered frames replaced by newer ones before read() got to them"""
+        return self.frame_pool.overwritten
+
+
+    def read(self, timeout=0):
         """
-        Read a frame (if available) from the active stream
+        Read the newest frame (if available) from the active stream
+
+        Parameters:
+        - timeout (float | None): Maximum time in seconds to wait for a frame. 0 returns immediately, None waits forever
         
         Returns (tuple [bool, np.array]): First returns True if frame is valid,
-        then the frame (None if invalid)
+        then the frame (None if invalid). The frame stays valid until the next read()
         """
-        if self.frame_queue.empty():
-            return False, None
-        
-        return True, self.frame_queue.get_nowait()
+        ret, frame, capture_time = self.frame_pool.get(timeout)
+        if ret: self.capture_time = capture_time
+        return ret, frame
 
 
 def frame_callback(short_array, width, height):
@@ -120,11 +147,17 @@ def frame_callback(short_array, width, height):
     - width (int): Frame width
     - height (int): Frame height
     """
+    frame_pool = PureThermalWindows.frame_pool
+
+    # Check frame size
+    if (height, width) != RAW_THERMAL_SHAPE: return
+
+    # Claim a buffer. Replaces the oldest unread frame if the reader has fallen behind
+    idx = frame_pool.acquire()
 
-    # Specify the data type and shape
-    incoming_data = np.fromiter(short_array, dtype="uint16")
-    frame = incoming_data.reshape(height, width)
+    # Copy pixel values into the buffer
+    frame_pool.frames[idx].reshape(-1)[:] = np.fromiter(short_array, dtype="uint16", count=width*height)
     
-    # Add frame to queue
-    if not PureThermalWindows.frame_queue.full():
-        PureThermalWindows.frame_queue.put_nowait(frame)
+    # Hand the frame to the reader
+    # The SDK doesn't report a capture time, use the arrival time
+    frame_pool.publish(idx, time.monotonic())
@@ -0,0 +1,44 @@
+"""Measures the CPU usage of a worker process"""
+
+from constants import CPU_USAGE_PERIOD
+import time
+
+
+class CpuMeter():
+    """
+    Averages the CPU time used by the calling process (all threads) over fixed periods
+    and publishes it to a shared value
+    """
+
+    def __init__(self, output=None, period=CPU_USAGE_PERIOD):
+        """
+        Parameters:
+        - output (multiprocessing.Value (double) | None): Shared value to write the CPU usage to
+        - period (float): Duration in seconds to average over
+        """
+        self.output = output
+        self.period = period
+
+        # Last measured CPU usage in percent of one core
+        self.usage = 0.0
+
+        # Start of the current period
+        self._wall = time.monotonic()
+        self._cpu  = time.process_time()
+
+
+    def update(self):
+        """
+        Call regularly (e.g. once per loop iteration). Updates the measurement once every period
+
+        Returns (float): CPU usage in percent of one core, averaged over the last complete period
+        """
+        wall = time.monotonic()
+        if (wall - self._wall) < self.period: return self.usage
+
+        cpu = time.process_time()
+        self.usage = 100 * (cpu - self._cpu) / (wall - self._wall)
+        self._wall, self._cpu = wall, cpu
+
+        if self.output is not None: self.output.value = self.usage
+        return self.usage
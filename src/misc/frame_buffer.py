@@ -0,0 +1,441 @@
+"""
+Lock-free ring of frame slots in shared memory.
+
+One producer writes frames into the next slot of the ring and never blocks.
+Consumers always read the newest complete frame. Each slot has a sequence number
+that is cleared while the slot is being written, so readers can detect when a
+frame was overwritten while they were copying it.
+
+Consumers can also read in place (seqlock style): read_view() returns a read-only
+view into shared memory and torn() tells the consumer, after it is done with the
+frame, whether the producer overwrote the slot in the meantime.
+
+Every slot carries a FrameHeader with the frame's sequence number, capture time and
+the pid of the producer. Capture times use time.monotonic() so they can be compared
+across processes.
+
+Rings live in named multiprocessing.shared_memory segments. They are pickled by name,
+so any process can attach to a ring, and a restarted worker picks up the same buffer
+(including the last frame written) without re-plumbing. FrameBufferRegistry allocates
+one ring per stream in the main process and owns the segments.
+"""
+
+from multiprocessing.shared_memory import SharedMemory
+from ctypes import Structure, sizeof, c_uint64, c_double, c_int32
+from constants import FRAME_RING_SLOTS, VISIBLE_RING_SLOTS, FRAME_BUFFER_ALIGN, FRAME_BUFFER_PREFIX
+from constants import STREAM_TYPE_THERMAL, STREAM_TYPE_VISIBLE, RAW_THERMAL_SHAPE, VISIBLE_SHAPE
+import numpy as np
+import logging
+import time
+import os
+
+
+class FrameHeader(Structure):
+    """Metadata stored alongside every frame in a FrameRing"""
+    _fields_ = [
+        ("seq",       c_uint64), # Frame sequence number, starts at 1. 0 while the slot is being written
+        ("timestamp", c_double), # Monotonic capture time in seconds (time.monotonic() clock)
+        ("pid",       c_int32),  # Process ID of the producer
+    ]
+
+
+class ReaderStats(Structure):
+    """Per-consumer frame counters. Create with multiprocessing.Value(ReaderStats, lock=False)"""
+    _fields_ = [
+        ("received", c_uint64), # Number of frames read by the consumer
+        ("dropped",  c_uint64), # Number of frames the consumer never saw
+        ("latency",  c_double), # Capture-to-output time in seconds of the last processed frame
+    ]
+
+
+class CaptureStats(Structure):
+    """Per-producer frame counters. Create with multiprocessing.Value(CaptureStats, lock=False)"""
+    _fields_ = [
+        ("grabbed",     c_uint64), # Number of frames delivered by the camera
+        ("processed",   c_uint64), # Number of frames published to shared memory
+        ("dropped",     c_uint64), # Number of frames discarded because the processing stage was busy
+        ("overwritten", c_uint64), # Number of buffered frames replaced by newer ones before they were processed
+        ("latency",     c_double), # Capture-to-publish time in seconds of the last published frame
+    ]
+
+
+class FrameRing:
+    """
+    Shared memory ring of N frame slots with per-slot headers.
+
+    Create in the main process and pass to workers like any other multiprocessing object.
+
+    Segment layout: latest sequence number, then one FrameHeader per slot, then the
+    frame data of every slot (aligned to FRAME_BUFFER_ALIGN bytes)
+    """
+
+    def __init__(self, shape, dtype, n_slots=FRAME_RING_SLOTS, name=None, create=True):
+        """
+        Parameters:
+        - shape (tuple (int)): Shape of a single frame
+        - dtype (str | numpy.dtype): Data type of a single frame
+        - n_slots (int): Number of frames held by the ring. Must be >= 2
+        - name (str | None): Name of the shared memory segment. A unique name is generated if not given
+        - create (bool): Create a new segment if True, otherwise attach to the existing segment 'name'
+        """
+        assert n_slots >= 2, "Frame ring needs at least two slots"
+        assert create or name is not None, "Need a segment name to attach to"
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.n_slots = n_slots
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        # Byte offsets of each section in the segment
+        self._header_offset = sizeof(c_uint64)
+        self._data_offset = self._header_offset + n_slots * sizeof(FrameHeader)
+        self._data_offset = -(-self._data_offset // FRAME_BUFFER_ALIGN) * FRAME_BUFFER_ALIGN
+        self.nbytes = self._data_offset + n_slots * self.frame_bytes
+
+        # Create or attach to the segment
+        self._shm = SharedMemory(name, create=create, size=self.nbytes if create else 0)
+        self.name = self._shm.name
+        assert self._shm.size >= self.nbytes, f"Shared memory segment '{self.name}' is too small for this ring"
+
+        # Sequence number of the frame currently being written (producer only)
+        self._writing = 0
+
+        self._map()
+
+
+    def _map(self):
+        """Create ctypes/numpy views of the segment in this process"""
+        buf = self._shm.buf
+
+        # Sequence number of the newest complete frame
+        self._latest = c_uint64.from_buffer(buf, 0)
+
+        # Per-slot frame headers
+        self._headers = (FrameHeader * self.n_slots).from_buffer(buf, self._header_offset)
+
+        # Numpy views of the frame data, created lazily
+        self._slots = None
+        self._views = None
+
+
+    def __getstate__(self):
+        # Shared memory handles and views can't be pickled, reattach by name in the other process
+        state = self.__dict__.copy()
+        for key in ("_shm", "_latest", "_headers", "_slots", "_views"):
+            del state[key]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = SharedMemory(self.name)
+        self._map()
+
+
+    def __del__(self):
+        # Drop views of the segment before it gets unmapped
+        if hasattr(self, "_shm"): self.close()
+
+
+    @property
+    def slots(self):
+        """(list (numpy.ndarray)): Numpy views of every slot in the ring"""
+        if self._slots is None:
+            count = self.n_slots * int(np.prod(self.shape))
+            data = np.frombuffer(self._shm.buf, self.dtype, count, self._data_offset)
+            self._slots = [s.reshape(self.shape) for s in np.split(data, self.n_slots)]
+        return self._slots
+
+
+    @property
+    def views(self):
+        """(list (numpy.ndarray)): Read-only numpy views of every slot in the ring, used for zero-copy reads"""
+        if self._views is None:
+            self._views = []
+            for s in self.slots:
+                view = s.view()
+                view.flags.writeable = False
+                self._views.append(view)
+        return self._views
+
+
+    def close(self):
+        """
+        Release this process's mapping of the segment
+
+        Notes: Views handed out by slots and readers must not be used afterwards
+        """
+        self._latest = self._headers = self._slots = self._views = None
+
+        # Readers may still hold views of the segment.
+        # The mapping is then released when they are garbage collected
+        try: self._shm.close()
+        except BufferError: pass
+
+
+    def unlink(self):
+        """Destroy the shared memory segment once every process has closed it (owner only)"""
+        try: self._shm.unlink()
+        except FileNotFoundError: pass
+
+
+    @property
+    def latest(self):
+        """(int): Sequence number of the newest complete frame, 0 if nothing was written yet"""
+        return self._latest.value
+
+
+    def begin_write(self):
+        """
+        Claim the next slot for writing (producer only).
+
+        Returns (numpy.ndarray): The slot to write the frame into, e.g. as a 'dst' argument
+
+        Notes: Call end_write() to publish the frame
+        """
+        self._writing = self._latest.value + 1
+        slot = self._writing % self.n_slots
+
+        # Invalidate the slot before touching its data
+        self._headers[slot].seq = 0
+        return self.slots[slot]
+
+
+    def end_write(self, timestamp=None):
+        """
+        Publish the frame claimed by begin_write() (producer only)
+
+        Parameters:
+        - timestamp (float | None): Monotonic capture time of the frame. Defaults to now
+        """
+        header = self._headers[self._writing % self.n_slots]
+        header.timestamp = time.monotonic() if timestamp is None else timestamp
+        header.pid = os.getpid()
+
+        # Sequence number goes last, it marks the slot as valid
+        header.seq = self._writing
+        self._latest.value = self._writing
+
+
+    def write(self, frame, timestamp=None):
+        """
+        Copy a frame into the next slot and publish it (producer only)
+
+        Parameters:
+        - frame (numpy.ndarray): The frame to write
+        - timestamp (float | None): Monotonic capture time of the frame. Defaults to now
+        """
+        np.copyto(self.begin_write(), frame)
+        self.end_write(timestamp)
+
+
+    def reader(self, stats=None):
+        """
+        Create a reader for this ring (consumer only)
+
+        Parameters:
+        - stats (ReaderStats | None): Shared counters to update as frames are read
+
+        Returns (FrameReader): A new reader
+        """
+        return FrameReader(self, stats)
+
+
+
+class FrameReader:
+    """Reads the newest complete frame from a FrameRing and counts dropped frames"""
+
+    def __init__(self, ring: FrameRing, stats=None):
+        """
+        Parameters:
+        - ring (FrameRing): The ring to read from
+        - stats (ReaderStats | None): Shared counters to update as frames are read
+        """
+        self.ring = ring
+        self.stats = stats
+
+        # Sequence number of the last frame read
+        # Frames written before the reader was created are not counted as dropped
+        self.last_seq = ring.latest
+
+        # Slot and sequence number of the last zero-copy read
+        self._view_slot = 0
+        self._view_seq  = 0
+
+        # Header of the last frame read
+        self.header = FrameHeader()
+
+
+    def new_frame(self):
+        """Returns (bool): True if a newer frame than the last one read is available"""
+        return self.ring.latest > self.last_seq
+
+
+    def read(self, out=None):
+        """
+        Copy the newest complete frame out of the ring
+
+        Parameters:
+        - out (numpy.ndarray | None): Array to copy the frame into. Allocated if not given
+
+        Returns (tuple (bool, numpy.ndarray)): Similar interface to VideoCapture.read();
+        boolean indicates whether a frame was read, followed by the frame data (if valid)
+        """
+        if out is None:
+            out = np.empty(self.ring.shape, self.ring.dtype)
+
+        # Retry if the producer overwrites the slot while we are copying.
+        # This needs the producer to lap the whole ring, so it is rare
+        for _ in range(self.ring.n_slots):
+            seq = self.ring.latest
+            if seq == 0: return False, None
+
+            slot = seq % self.ring.n_slots
+            header = self.ring._headers[slot]
+            if header.seq != seq: continue
+            np.copyto(out, self.ring.slots[slot])
+            self._copy_header(header)
+            if header.seq != seq: continue
+
+            self._count(seq)
+            return True, out
+
+        return False, None
+
+
+    def read_view(self):
+        """
+        Get the newest complete frame without copying it
+
+        Returns (tuple (bool, numpy.ndarray)): Similar interface to VideoCapture.read();
+        boolean indicates whether a frame is available, followed by a read-only view into shared memory (if valid)
+
+        Notes: The producer may overwrite the slot while the view is in use.
+        Call torn() once the frame has been processed to check that the data stayed valid
+        """
+        for _ in range(self.ring.n_slots):
+            seq = self.ring.latest
+            if seq == 0: return False, None
+
+            slot = seq % self.ring.n_slots
+            header = self.ring._headers[slot]
+            if header.seq != seq: continue
+            self._copy_header(header)
+            if header.seq != seq: continue
+
+            self._view_slot = slot
+            self._view_seq  = seq
+            self._count(seq)
+            return True, self.ring.views[slot]
+
+        return False, None
+
+
+    def torn(self):
+        """Returns (bool): True if the frame from the last read_view() has been overwritten since it was read"""
+        return self.ring._headers[self._view_slot].seq != self._view_seq
+
+
+    def latency(self):
+        """Returns (float): Time in seconds since the last frame read was captured"""
+        return time.monotonic() - self.header.timestamp
+
+
+    def _copy_header(self, header):
+        """Snapshot a slot header into self.header"""
+        self.header.seq       = header.seq
+        self.header.timestamp = header.timestamp
+        self.header.pid       = header.pid
+
+
+    def _count(self, seq):
+        """Update frame counters after reading frame 'seq'"""
+        if self.stats is not None and seq != self.last_seq:
+            self.stats.received += 1
+            self.stats.dropped  += max(0, seq - self.last_seq - 1)
+        self.last_seq = seq
+
+
+
+class FrameBufferRegistry:
+    """
+    Allocates one named FrameRing per camera stream and owns the segments.
+
+    Create once in the main process. Rings can be passed to workers directly or
+    attached by stream name from any process with FrameBufferRegistry.attach()
+    """
+
+    # Frame shape, data type and number of slots of every stream
+    # The visible ring must hold frames for a whole inference pass
+    STREAMS = {
+        STREAM_TYPE_THERMAL: (RAW_THERMAL_SHAPE, "uint16", FRAME_RING_SLOTS),
+        STREAM_TYPE_VISIBLE: (VISIBLE_SHAPE, "uint8", VISIBLE_RING_SLOTS),
+    }
+
+    def __init__(self, n_slots=None):
+        """
+        Parameters:
+        - n_slots (int | None): Number of frames held by each ring. Uses each stream's own slot count if not given
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.DEBUG)
+
+        self.n_slots = n_slots
+        self.rings = dict()
+        for stream in self.STREAMS:
+            self.rings[stream] = self._create(stream)
+
+
+    @staticmethod
+    def segment_name(stream):
+        """
+        Parameters:
+        - stream (str): Stream name, one of FrameBufferRegistry.STREAMS
+
+        Returns (str): Name of the stream's shared memory segment
+        """
+        return f"{FRAME_BUFFER_PREFIX}_{stream}"
+
+
+    def _create(self, stream):
+        """Allocate the ring of a stream, replacing a segment left behind by a previous run"""
+        shape, dtype, n_slots = self.STREAMS[stream]
+        if self.n_slots is not None: n_slots = self.n_slots
+        name = self.segment_name(stream)
+
+        try: return FrameRing(shape, dtype, n_slots, name)
+        except FileExistsError:
+            self.logger.warning(f"Removing stale shared memory segment '{name}'")
+            stale = SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            return FrameRing(shape, dtype, n_slots, name)
+
+
+    def __getitem__(self, stream):
+        """Returns (FrameRing): The ring of a stream"""
+        return self.rings[stream]
+
+
+    @classmethod
+    def attach(cls, stream, n_slots=None):
+        """
+        Attach to the ring of a stream created by a registry in another process
+
+        Parameters:
+        - stream (str): Stream name, one of FrameBufferRegistry.STREAMS
+        - n_slots (int | None): Number of frames held by the ring, must match the registry. Uses the stream's own slot count if not given
+
+        Returns (FrameRing): The attached ring
+        """
+        shape, dtype, default_slots = cls.STREAMS[stream]
+        if n_slots is None: n_slots = default_slots
+        return FrameRing(shape, dtype, n_slots, cls.segment_name(stream), create=False)
+
+
+    def close(self):
+        """Release and destroy every segment. Call once all workers have stopped"""
+        for ring in self.rings.values():
+            ring.close()
+            ring.unlink()
+        self.rings.clear()
@@ -1,56 +1,255 @@
-"""Event wrappers to help manage several child events"""
+"""
+Event fan-out to signal when new frames are written to memory.
 
-from multiprocessing.synchronize import Event
+A FrameEventHub holds a fixed pool of subscriber slots in shared memory, so
+consumers can subscribe and unsubscribe at any time, from any process, as long
+as the hub was created before the workers were started. Producers only wake
+subscribers that are subscribed to their stream and enabled.
+
+A subscriber can follow several streams at once (e.g. thermal and visible)
+and wait on all of them at once with ready(), which also tells which streams fired.
+"""
+
+from multiprocessing.sharedctypes import RawArray
 from multiprocessing import get_context
+from ctypes import c_uint8
+import time
+from constants import STREAM_TYPE_THERMAL, STREAM_TYPE_VISIBLE, FRAME_EVENT_MAX_SUBSCRIBERS
+
+
+class FrameEventHub():
+    """
+    Pool of subscriber events shared by one or more frame streams.
+
+    Create in the main process before any worker is started
+    """
+
+    def __init__(self, streams=(STREAM_TYPE_THERMAL, STREAM_TYPE_VISIBLE), max_subscribers=FRAME_EVENT_MAX_SUBSCRIBERS):
+        """
+        Parameters:
+        - streams (tuple (str)): Names of the streams that publish through this hub
+        - max_subscribers (int): Number of subscriber slots
+        """
+        ctx = get_context()
+        self.streams = tuple(streams)
+        self.max_subscribers = max_subscribers
+        n_streams = len(self.streams)
+
+        # One event per subscriber slot, set by any stream the slot is subscribed to
+        self._events = [ctx.Event() for _ in range(max_subscribers)]
+
+        # Per-slot flags
+        self._in_use  = RawArray(c_uint8, max_subscribers)
+        self._enabled = RawArray(c_uint8, max_subscribers)
+
+        # Per-slot, per-stream flags. Indexed [slot * n_streams + stream]
+        # Each producer only writes its own stream's flags
+        self._subscribed = RawArray(c_uint8, max_subscribers * n_streams)
+        self._pending    = RawArray(c_uint8, max_subscribers * n_streams)
+
+        # Guards slot allocation
+        self._lock = ctx.Lock()
+
+        # Publishers of every stream
+        self._publishers = {s: NewFrameEvent(self, s) for s in self.streams}
+
+
+    def __getitem__(self, stream):
+        """Returns (NewFrameEvent): The publisher of a stream"""
+        return self._publishers[stream]
+
+
+    def subscribe(self, *streams):
+        """
+        Claim a subscriber slot. Can be called at any time, from any process
+
+        Parameters:
+        - streams (str): Names of the streams to subscribe to
+
+        Returns (NewFrameConsumer): The new subscriber
+        """
+        with self._lock:
+            for slot in range(self.max_subscribers):
+                if self._in_use[slot]: continue
+                self._in_use[slot]  = 1
+                self._enabled[slot] = 1
+                break
+            else: raise RuntimeError("All frame event subscriber slots are in use")
+
+        consumer = NewFrameConsumer(self, slot)
+        for s in streams: consumer.subscribe(s)
+        return consumer
+
+
+    def _index(self, slot, stream):
+        """Returns (int): Index of a slot's flag for a stream"""
+        return slot * len(self.streams) + self.streams.index(stream)
+
+
 
 class NewFrameEvent():
     """
-    Manages a list of child events.
+    Publisher side of a frame stream.
 
-    Setting and clearing is performed on all children
+    Setting wakes every enabled subscriber of the stream
     """
 
-    def __init__(self):
-        self.__children = []
+    def __init__(self, hub=None, stream=None):
+        """
+        Parameters:
+        - hub (FrameEventHub | None): Hub to publish through. A private single-stream hub is created if not given
+        - stream (str | None): Name of the stream this publisher signals. Required with a shared hub
+        """
+        self.hub = FrameEventHub((stream,)) if hub is None else hub
+        self.stream = stream
+
+
+    def subscribe(self):
+        """Returns (NewFrameConsumer): A new subscriber of this stream"""
+        return self.hub.subscribe(self.stream)
+
+    # Older name of subscribe()
+    get_child = subscribe
 
-    def get_child(self):
-        """Returns (NewFrameConsumer): Child event belonging to this instance"""
-        child = NewFrameConsumer()
-        self.__children.append(child)
-        return child
 
     def set(self):
-        """Sets all child events"""
-        for ch in self.__children: ch.set()
+        """Signal a new frame to all enabled subscribers of this stream"""
+        hub = self.hub
+        for slot in range(hub.max_subscribers):
+            i = hub._index(slot, self.stream)
+            if not (hub._subscribed[i] and hub._enabled[slot]): continue
+            hub._pending[i] = 1
+            hub._events[slot].set()
+
 
     def clear(self):
-        """Clears all child events"""
-        for ch in self.__children: ch.clear()
+        """Withdraw the last signal of this stream from all subscribers"""
+        hub = self.hub
+        for slot in range(hub.max_subscribers):
+            hub._pending[hub._index(slot, self.stream)] = 0
 
+            # Lower the event unless another stream is still pending
+            flags = hub._pending[slot*len(hub.streams) : (slot+1)*len(hub.streams)]
+            if not any(flags): hub._events[slot].clear()
 
-class NewFrameConsumer(Event):
+
+
+class NewFrameConsumer():
     """
-    Wrapper for multiprocessing.Event that allows the Event to be enabled/disabled.
+    Subscriber side of one or more frame streams. Behaves like a multiprocessing.Event.
 
-    'enabled' property can be used to 'pause' a worker process that consumes video data
+    'enabled' property can be used to 'pause' a worker process that consumes video data.
+    It is stored in shared memory, so it can be toggled from any process
     """
 
-    def __init__(self) -> None:
-        super().__init__(ctx=get_context())
-        self._enabled = True
+    def __init__(self, hub: FrameEventHub, slot):
+        """
+        Parameters:
+        - hub (FrameEventHub): The hub the subscriber slot belongs to
+        - slot (int): Index of the claimed subscriber slot
+        """
+        self.hub = hub
+        self.slot = slot
+        self._event = hub._events[slot]
+
 
     @property
     def enabled(self):
-        return self._enabled
+        return bool(self.hub._enabled[self.slot])
 
     @enabled.setter
     def enabled(self, value: bool):
-        self._enabled = value
-        
+        self.hub._enabled[self.slot] = value
+
         # Lower flag when disabled
-        if value == False: 
-            super().clear()
+        if value == False:
+            self.clear()
+
+
+    def subscribe(self, stream):
+        """
+        Start receiving signals from a stream
+
+        Parameters:
+        - stream (str): Name of the stream
+        """
+        self.hub._subscribed[self.hub._index(self.slot, stream)] = 1
+
+
+    def unsubscribe(self, stream=None):
+        """
+        Stop receiving signals from a stream
+
+        Parameters:
+        - stream (str | None): Name of the stream. If not given, unsubscribe from all streams and release the slot
+        """
+        hub = self.hub
+        streams = hub.streams if stream is None else (stream,)
+        for s in streams:
+            hub._subscribed[hub._index(self.slot, s)] = 0
+            hub._pending[hub._index(self.slot, s)] = 0
+
+        # Release slot
+        if stream is None:
+            self._event.clear()
+            with hub._lock:
+                hub._enabled[self.slot] = 0
+                hub._in_use[self.slot]  = 0
+
+
+    def wait(self, timeout=None):
+        """
+        Block until a subscribed stream signals a new frame
+
+        Parameters:
+        - timeout (float | None): Maximum time to wait in seconds
+
+        Returns (bool): False if the wait timed out
+        """
+        return self._event.wait(timeout)
+
+
+    def is_set(self):
+        """Returns (bool): True if a subscribed stream signalled a new frame since the last clear()"""
+        return self._event.is_set()
+
 
     def set(self):
         # Only allows set() to take effect when enabled
-        if self.enabled: super().set()
+        if self.enabled: self._event.set()
+
+
+    def clear(self):
+        """Lower the flag and forget which streams signalled"""
+        self._event.clear()
+        for s in self.hub.streams:
+            self.hub._pending[self.hub._index(self.slot, s)] = 0
+
+
+    def ready(self, timeout=None):
+        """
+        Wait for new frames on any subscribed stream and consume the signals
+
+        Parameters:
+        - timeout (float | None): Maximum time to wait in seconds
+
+        Returns (list (str)): Names of the streams with a new frame. Empty only if the wait timed out
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Lower the event before reading the flags.
+            # A frame signalled in between sets the event again, so it is never lost.
+            # An event left over from flags that were already consumed just waits again
+            self._event.clear()
+
+            out = []
+            for s in self.hub.streams:
+                i = self.hub._index(self.slot, s)
+                if self.hub._pending[i]:
+                    self.hub._pending[i] = 0
+                    out.append(s)
+            if len(out): return out
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0: return []
+            if not self._event.wait(remaining): return []
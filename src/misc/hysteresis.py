@@ -20,7 +20,7 @@ class HysteresisBool():
         self._t_release = release_time
         
         # Timestamp of last current-value change
-        self._change_ts = time.time()
+        self._change_ts = time.monotonic()
 
     @property
     def value(self):
@@ -28,13 +28,25 @@ class HysteresisBool():
     
     @value.setter
     def value(self, new):
+        self.update(new)
+
+    def update(self, new, timestamp=None):
+        """
+        Update the current value
+
+        Parameters:
+        - new (bool): The new current value
+        - timestamp (float | None): Monotonic time (time.monotonic() clock) at which the value was observed, e.g. a frame capture time. Defaults to now
+        """
+        if timestamp is None: timestamp = time.monotonic()
+
         # Change current value and reset change timestamp
         if new != self._current_value:
             self._current_value = new
-            self._change_ts = time.time()
+            self._change_ts = timestamp
 
         # Time since last change
-        current_period = time.time() - self._change_ts
+        current_period = timestamp - self._change_ts
         
         # If the current value has not changed for a sufficently long time, latch it
         if self._current_value and current_period > self._t_trip:
@@ -1,8 +1,9 @@
 """Parent class for launching worker processes"""
 
 from constants import EXCEPTION_HISTORY_WINDOW, ALLOWABLE_EXCEPTION_COUNT
-from multiprocessing import Process, Event, get_context, Manager
+from multiprocessing import Process, Event, get_context, Manager, Value
 import multiprocessing.queues
+from ctypes import c_double
 from queue import Full, Empty
 import logging
 import time
@@ -28,6 +29,9 @@ class Launcher:
         # Signal to shut down worker
         self.suspend_sig = Event()
 
+        # CPU usage of the worker in percent of one core, updated by the worker
+        self.cpu_usage = Value(c_double, 0.0)
+
         # Exception recovery
         self.exception_whitelist = [] # List of non-fatal errors
         self.exception_history   = [] # Timestamps of recent non-fatal errors
@@ -3,6 +3,7 @@
 from .user_detect_worker import user_detect_worker
 from  misc.launcher import Launcher
 from  multiprocessing import Value
+from misc.frame_buffer import ReaderStats
 from ctypes import c_double
 import logging
 
@@ -18,13 +19,16 @@ class UserDetect(Launcher):
         # Epoch time of last detection
         self.last_detected = Value(c_double, 0.0)
 
+        # Received/dropped visible frame counters
+        self.frame_stats = Value(ReaderStats, lock=False)
+
 
     def start(self, vis_mem, frame_event, log_queue):
         """
         Start the user detection worker
 
         Parameters:
-        - vis_mem (multiprocessing.Array): Shared memory location of visible camera data
+        - vis_mem (FrameRing): Shared memory ring of visible camera data
         - frame_event (NewFrameConsumer): Flag that indicates when a new frame is available
         - log_queue (multiprocessing.Queue): Queue used to transfer log records from a subrocess to the main process
         """
@@ -38,6 +42,8 @@ class UserDetect(Launcher):
                 self.suspend_sig,
                 log_queue,
                 self.exception_queue,
-                self.last_detected
+                self.last_detected,
+                self.frame_stats,
+                self.cpu_usage
             )
          )
@@ -1,8 +1,10 @@
 """Worker that performs user detection"""
 
 from misc.logs import configure_subprocess_log
+from misc.cpu_meter import CpuMeter
 from misc.hysteresis import HysteresisBool
 from misc.monitor import MonitorServer
+from arducam.undistort import get_undistort_maps, undistort_frame, undistort_boxes
 from constants import *
 import numpy as np
 import platform
@@ -23,17 +25,19 @@ elif platform.system() == 'Linux':
 
 
 
-def user_detect_worker(mem, new, ports, stop, log, errs, detect_ts):
+def user_detect_worker(mem, new, ports, stop, log, errs, detect_ts, frame_stats, cpu_usage):
     """
     Main user detection loop
 
     Parameters:
-    - mem (multiprocessing.Array): Shared memory location of visible camera data
+    - mem (FrameRing): Shared memory ring of visible camera data
     - new (NewFrameConsumer): Flag that indicates when a new frame is available
     - stop (multiprocessing.Event): Flag that indicates when to suspend process
     - log (multiprocessing.Queue): Queue to handle log messages
     - errs (multiprocessing.Queue): Queue to dump errors raised by worker
     - detect_ts (multiprocessing.Value (double)): Epoch timestamp of last detection
+    - frame_stats (ReaderStats): Received/dropped frame counters and latency
+    - cpu_usage (multiprocessing.Value (double)): CPU usage of the worker in percent of one core
     """
 
     # === Setup ===
@@ -56,15 +60,21 @@ def user_detect_worker(mem, new, ports, stop, log, errs, detect_ts):
             detector = JetsonDetect()
         logger.debug("Detector ready")
 
-        # Create numpy array backed by shared memory
-        frame_src = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8', buffer=mem.get_obj())
+        # Create reader for the shared memory ring
+        reader = mem.reader(frame_stats)
 
-        # Create array for us to copy to
-        frame = np.empty_like(frame_src)
+        # Create array to copy to if a zero-copy read gets torn
+        frame_copy = np.empty(VISIBLE_SHAPE, dtype='uint8')
 
         # Detection state
         user_detected = HysteresisBool(USER_TRIP_TIME, USER_RELEASE_TIME)
 
+        # Frames arrive distorted in point space mode, undistortion maps are needed for the debug monitor
+        if ARDUCAM_UNDISTORT_POINTS: map1, map2 = get_undistort_maps()
+
+        # CPU usage measurement
+        cpu_meter = CpuMeter(cpu_usage)
+
         # ========== For testing ===========
         # Initialize csv
         frame_index = 0
@@ -85,19 +95,33 @@ def user_detect_worker(mem, new, ports, stop, log, errs, detect_ts):
     # === Loop ===
     while not stop.is_set():
         try:
+            # Measure CPU usage
+            cpu_meter.update()
+
             # Wait for new frame
             if not new.wait(timeout=0.5): continue
             else: new.clear()
 
-            # Copy frame from shared memory
-            if not mem.get_lock().acquire(timeout=0.2): continue
-            np.copyto(frame, frame_src)
-            mem.get_lock().release()
+            # Read newest frame in place
+            ret, frame = reader.read_view()
+            if not ret: continue
 
             # Detect user
             boxes, confs, tm = detector.detect(frame)
-            user_detected.value = len(boxes) > 0
+
+            # The frame was overwritten during inference.
+            # Fall back to a private copy of the newest frame
+            if reader.torn():
+                ret, frame = reader.read(out=frame_copy)
+                if not ret: continue
+                boxes, confs, tm = detector.detect(frame)
+
+            # Map boxes into rectified frame coordinates
+            if ARDUCAM_UNDISTORT_POINTS: boxes = undistort_boxes(boxes)
+
+            user_detected.update(len(boxes) > 0, reader.header.timestamp)
             if user_detected.value: detect_ts.value = time.time()
+            frame_stats.latency = reader.latency()
 
             # Log detection time
             # logger.debug(f"Inference time: {tm*1000:5.2f}ms")
@@ -115,13 +139,19 @@ def user_detect_worker(mem, new, ports, stop, log, errs, detect_ts):
 
                 csv_writer.writerow([time.time(), frame_index, tm] + det_info)
                 csvfile.flush()
-
-            # Add index to frame
-            cv2.putText(frame, str(frame_index), (5, 480-5), 0, 3/2, [0, 0, 255], thickness=2, lineType=cv2.LINE_AA,)
             # ==================================
 
             # Show debug output on monitor
             if len(ports):
+                # Shared memory is read-only, annotate a copy
+                if ARDUCAM_UNDISTORT_POINTS: frame = undistort_frame(cv2.flip(frame, -1), map1, map2)
+                else: frame = frame.copy()
+
+                # ========== For testing ===========
+                # Add index to frame
+                cv2.putText(frame, str(frame_index), (5, 480-5), 0, 3/2, [0, 0, 255], thickness=2, lineType=cv2.LINE_AA,)
+                # ==================================
+
                 for i, box in enumerate(boxes):
                     color = (0, 255, 0) if user_detected.value else (0, 186, 255)
                     plot_box(box, frame, color, f"{confs[i]:0.2f}")
@@ -4,11 +4,11 @@
 import os, sys
 sys.path.append(os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', "src")))
 
-from constants import VISIBLE_SHAPE, STREAM_UDP_PORT
+from constants import VISIBLE_SHAPE, STREAM_UDP_PORT, STREAM_TYPE_VISIBLE
 from misc.frame_event import NewFrameEvent
-from multiprocessing import Array, Queue
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
 from misc.monitor import MonitorClient
-from ctypes import c_uint8
 from misc.logs import *
 import numpy as np
 import logging
@@ -30,21 +30,21 @@ def main():
     # Create queue for workers to log to
     logging_queue = Queue(10)
 
-    # Create image array in shared memory
-    dummy = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8')
-    mem = Array(c_uint8, dummy.nbytes, lock=True)
+    # Create image ring in shared memory
+    frame_buffers = FrameBufferRegistry()
+    mem = frame_buffers[STREAM_TYPE_VISIBLE]
 
-    # Create numpy array backed by shared memory
-    frame_src = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8', buffer=mem.get_obj())
+    # Create reader for the ring
+    reader = mem.reader()
 
     # Create array for us to copy to
-    frame = np.empty_like(frame_src)
+    frame = np.empty(VISIBLE_SHAPE, dtype='uint8')
 
     # Create master event object for new frames
     new_frame_parent = NewFrameEvent()
 
-    # Get a different child event for each process that reads frame data
-    new_frame_child = new_frame_parent.get_child()
+    # Subscribe each process that reads frame data
+    new_frame_child = new_frame_parent.subscribe()
 
     # Instantiate launchers
     cam = Arducam()
@@ -84,9 +84,8 @@ def main():
                 new_frame_child.clear()
 
                 # Copy frame from shared memory
-                if not mem.get_lock().acquire(timeout=0.5): continue
-                np.copyto(frame, frame_src)
-                mem.get_lock().release()
+                ret, _ = reader.read(out=frame)
+                if not ret: continue
 
                 # Show frame
                 cv2.imshow("memory", frame)
@@ -119,6 +118,11 @@ def main():
     finally:
         monitor.stop()
         cam.stop()
+        frame_buffers.close()
+
+        # Report capture counters
+        stats = cam.capture_stats
+        logger.info(f"Frames grabbed: {stats.grabbed}, processed: {stats.processed}, dropped: {stats.dropped}, last latency: {stats.latency*1000:.1f}ms, CPU: {cam.cpu_usage.value:.1f}%")
 
         logging_thread.stop()
         logger.info("test ended")
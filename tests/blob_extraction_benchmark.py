@@ -0,0 +1,126 @@
+"""
+Benchmark of blob extraction on synthetic thermal frames, with the time spent in each stage of the pipeline.\n
+Also checks that BlobExtractor finds the same blobs as the contour pipeline it replaced, including ring-shaped
+blobs (a pan with a cooler centre) whose hole has to be filled
+"""
+
+# Add parent directory to the Python path
+import os.path as path
+import sys
+sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
+
+from cooking_detection.cooking_detect_worker import BlobExtractor
+from cooking_detection.blob import Blob
+from lepton.utils import clip_norm, temp2raw, raw2temp
+from constants import *
+import numpy as np
+import time
+import cv2
+
+
+def allocating_find_blobs(frame, timestamp=None):
+    """Same pipeline as BlobExtractor, allocating every intermediate image and the kernel per call like find_blobs() did"""
+    clipped = clip_norm(frame, temp2raw(TEMP_THRESH_LOW), temp2raw(TEMP_THRESH_HIGH))
+    clipped = cv2.bilateralFilter(clipped, 5, 30, 20)
+    thresh = cv2.adaptiveThreshold(clipped, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 35, 0)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+    # Fill holes: flood the background from a zero border, the rest is enclosed
+    padded = cv2.copyMakeBorder(closed, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    cv2.floodFill(padded, None, (0, 0), 255, flags=4)
+    filled = cv2.bitwise_or(closed, cv2.bitwise_not(padded[1:-1, 1:-1]))
+
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(filled, connectivity=8, ltype=cv2.CV_16U)
+
+    area = stats[:, cv2.CC_STAT_AREA]
+    blob_pixels = filled.ravel() != 0
+    temps = raw2temp(np.bincount(labels.ravel()[blob_pixels], weights=frame.ravel()[blob_pixels], minlength=len(stats)) / np.maximum(area, 1))
+    good = (area >= BLOB_MIN_AREA) & (temps >= BLOB_MIN_TEMP)
+    good[0] = False
+
+    blobs = []
+    for i in np.flatnonzero(good):
+        x, y, w, h = stats[i, :4]
+        mask = cv2.compare(labels[y:y+h, x:x+w], float(i), cv2.CMP_EQ)
+        blobs.append(Blob((x, y, w, h), mask, (int(centroids[i,0]), int(centroids[i,1])), int(area[i]), float(temps[i]), timestamp))
+    return blobs
+
+
+def contour_find_blobs(frame, timestamp=None):
+    """Contour pipeline BlobExtractor replaced: filled outer contours, then the area and temperature filter"""
+    clipped = clip_norm(frame, temp2raw(TEMP_THRESH_LOW), temp2raw(TEMP_THRESH_HIGH))
+    clipped = cv2.bilateralFilter(clipped, 5, 30, 20)
+    thresh = cv2.adaptiveThreshold(clipped, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 35, 0)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    blobs = [Blob.from_contour(c, frame, timestamp) for c in contours]
+    return [b for b in blobs if b.area >= BLOB_MIN_AREA and b.temp >= BLOB_MIN_TEMP]
+
+
+def make_frame(rng, n_blobs):
+    """Returns (numpy.ndarray): Raw-16 frame of a room temperature scene with n hot discs"""
+    temp = rng.normal(22.0, 0.3, RAW_THERMAL_SHAPE)
+    for _ in range(n_blobs):
+        mask = np.zeros(RAW_THERMAL_SHAPE, dtype='uint8')
+        cv2.circle(mask, (int(rng.integers(10, 150)), int(rng.integers(10, 110))), int(rng.integers(3, 15)), 255, -1)
+        temp[mask > 0] = rng.uniform(40, 200) + rng.normal(0, 1, np.count_nonzero(mask))
+    return np.vectorize(temp2raw)(temp).astype('uint16')
+
+
+def make_ring_frame(rng, n_rings):
+    """Returns (numpy.ndarray): Raw-16 frame of a room temperature scene with n hot rings around cooler centres"""
+    temp = rng.normal(22.0, 0.3, RAW_THERMAL_SHAPE)
+    for _ in range(n_rings):
+        mask = np.zeros(RAW_THERMAL_SHAPE, dtype='uint8')
+        center, radius = (int(rng.integers(20, 140)), int(rng.integers(20, 100))), int(rng.integers(10, 20))
+        cv2.circle(mask, center, radius, 255, int(rng.integers(3, 6)))
+        temp[mask > 0] = rng.uniform(100, 200) + rng.normal(0, 1, np.count_nonzero(mask))
+    return np.vectorize(temp2raw)(temp).astype('uint16')
+
+
+def same_blobs(a, b):
+    """Returns (bool): True if both lists hold the same blobs: equal rects, areas and temperatures, centroids within a pixel"""
+    a, b = sorted(a, key=lambda blob: blob.rect), sorted(b, key=lambda blob: blob.rect)
+    return len(a) == len(b) and all(
+        x.rect == y.rect and x.area == y.area and np.isclose(x.temp, y.temp)
+        and abs(x.centroid[0] - y.centroid[0]) <= 1 and abs(x.centroid[1] - y.centroid[1]) <= 1
+        for x, y in zip(a, b)
+    )
+
+
+def main():
+    rng = np.random.default_rng(0)
+    frames = [make_frame(rng, rng.integers(1, 8)) for _ in range(20)]
+    n_runs = 30
+
+    # The differences are small, so runs are interleaved and the fastest one is kept
+    extractor = BlobExtractor()
+    timed = BlobExtractor(timed=True)
+    pipelines = {"allocating": allocating_find_blobs, "BlobExtractor": extractor, "timed stages": timed}
+    best = dict.fromkeys(pipelines, np.inf)
+    for _ in range(n_runs):
+        for name, func in pipelines.items():
+            start = time.perf_counter()
+            for f in frames: func(f)
+            best[name] = min(best[name], (time.perf_counter() - start) / len(frames))
+    for name, t in best.items():
+        print(f"{name:14s} {t * 1e3:6.3f} ms/frame")
+
+    # Every pipeline finds the same blobs, holes included
+    rings = [make_ring_frame(rng, rng.integers(1, 4)) for _ in range(20)]
+    for name, test_frames in [("discs", frames), ("rings", rings)]:
+        same = all(same_blobs(contour_find_blobs(f), extractor(f)) and same_blobs(contour_find_blobs(f), allocating_find_blobs(f)) for f in test_frames)
+        print(f"Same blobs as the contour pipeline ({name}): {same}")
+        assert same, f"BlobExtractor and the contour pipeline disagree on {name}"
+    print()
+
+    print("BlobExtractor stages (ms/frame):")
+    for stage, ms in timed.stage_times().items():
+        print(f"  {stage:10s} {ms:6.3f}")
+
+
+if __name__ == "__main__":
+    main()
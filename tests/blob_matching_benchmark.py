@@ -0,0 +1,98 @@
+"""Benchmark of blob matching (similarity scores + assignment) for 1-50 blobs"""
+
+# Add parent directory to the Python path
+import os.path as path
+import sys
+sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
+
+from cooking_detection.cooking_detect_worker import assign_blobs
+from cooking_detection.blob import Blob, similarity_matrix
+from lepton.utils import temp2raw
+from constants import *
+import numpy as np
+import time
+import cv2
+
+
+def legacy_matches(new_blobs, old_blobs):
+    """Previous matching from cooking_detect_worker.match_blobs. Returns the matched old blob of each new blob (or -1)"""
+    compare_all_news = lambda old: [old.compare(new) for new in new_blobs]
+    similarities = np.array([compare_all_news(old) for old in old_blobs])
+
+    running = True
+    while running:
+        best_matches = np.argmax(similarities, axis=1)
+        for r, c in enumerate(best_matches):
+            mark = lambda row, c: (row[c] > SIM_SCORE_MATCH) and (-1 not in row)
+            if mark(similarities[r,:], c): similarities[r,c] = -1
+
+        matches = np.count_nonzero(similarities == -1, axis=0)
+        for c, cnt in enumerate(matches):
+            if cnt <= 1: continue
+            age  = lambda i: time.monotonic() - old_blobs[i].first_detected
+            ages = [(age(r) if (s==-1) else -1) for r, s in enumerate(similarities[:,c])]
+            oldest = np.argmax(ages)
+            similarities[:, c] = 0
+            similarities[oldest, c] = -1
+            break
+        else: running = False
+
+    out = np.full(len(new_blobs), -1)
+    for c, col in enumerate(similarities.T):
+        if -1 in col: out[c] = np.where(col == -1)[0][0]
+    return out
+
+
+def new_matches(new_blobs, old_blobs):
+    """Vectorized scores + deferred acceptance"""
+    similarities = similarity_matrix(old_blobs, new_blobs)
+    return assign_blobs(similarities, [b.first_detected for b in old_blobs])
+
+
+def make_blobs(rng, n):
+    """
+    Synthetic stovetop: n hot ellipses, then the same ellipses moved slightly with a few new ones
+
+    Returns (tuple (list (Blob), list (Blob))): Old blobs, new blobs
+    """
+    h, w = RAW_THERMAL_SHAPE
+    params = [(rng.uniform(0, w), rng.uniform(0, h), rng.uniform(2, 10), rng.uniform(2, 8), rng.uniform(0, 180), rng.uniform(60, 200))
+              for _ in range(n)]
+
+    def blobs(params, jitter, t):
+        out = []
+        frame = np.full(RAW_THERMAL_SHAPE, temp2raw(22.0), dtype='uint16')
+        for x, y, a, b, ang, temp in params:
+            x, y = x + rng.normal(0, jitter), y + rng.normal(0, jitter)
+            mask = np.zeros(RAW_THERMAL_SHAPE, dtype='uint8')
+            cv2.ellipse(mask, (int(x), int(y)), (int(a), int(b)), ang, 0, 360, 255, -1)
+            frame[mask > 0] = temp2raw(temp)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            out += [Blob.from_contour(c, frame, t + rng.uniform(0, 1)) for c in contours]
+        return out
+
+    return blobs(params, 0, 0.0), blobs(params, 1.5, 10.0)
+
+
+def main():
+    rng = np.random.default_rng(0)
+
+    for n in (1, 2, 5, 10, 20, 50):
+        cases = [make_blobs(rng, n) for _ in range(5)]
+        n_runs = max(3, 200 // n)
+
+        results = {}
+        for name, func in [("legacy", legacy_matches), ("vectorized", new_matches)]:
+            start = time.perf_counter()
+            for _ in range(n_runs):
+                for old, new in cases: func(new, old)
+            results[name] = (time.perf_counter() - start) / (n_runs * len(cases))
+
+        # Matched pairs that differ from the legacy matching
+        diff = sum(np.count_nonzero(legacy_matches(new, old) != new_matches(new, old)) for old, new in cases)
+        print(f"{n:3d} blobs: legacy {results['legacy']*1e3:8.3f} ms, vectorized {results['vectorized']*1e3:7.3f} ms, "
+              f"x{results['legacy']/results['vectorized']:5.1f}, different matches: {diff}")
+
+
+if __name__ == "__main__":
+    main()
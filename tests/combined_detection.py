@@ -5,12 +5,11 @@ import os, sys
 sys.path.append(os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', "src")))
 
 # Muliprocessing stuff
-from constants import VISIBLE_SHAPE, RAW_THERMAL_SHAPE, STREAM_UDP_PORT
+from constants import STREAM_TYPE_VISIBLE, STREAM_TYPE_THERMAL, STREAM_UDP_PORT
 from state_machine import StateMachine, WorkerProcess
-from misc.frame_event import NewFrameEvent
-from multiprocessing import Array, Queue
-from ctypes import c_uint8, c_uint16
-import numpy as np
+from misc.frame_event import FrameEventHub
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
 
 # Debugging stuff
 from misc.monitor import MonitorClient
@@ -33,6 +32,12 @@ from arducam import Arducam
 from lepton.polling import PureThermal
 # from stubs import PureThermal
 
+# Replay recordings through the real polling workers instead of the cameras
+from lepton.replay import ThermalReplay
+from arducam.replay import VisibleReplay
+THERMAL_REPLAY = None # e.g. ThermalReplay("vids/demo.tiff", speed=1.0, loop=True)
+VISIBLE_REPLAY = None # e.g. VisibleReplay("vids/kitchen.mp4", speed=0, loop=True)
+
 from user_detection import UserDetect
 # from stubs import UserDetect
 
@@ -52,21 +57,19 @@ def main():
     # Create queue for workers to log to
     logging_queue = Queue(10)
 
-    # Create visible image array in shared memory
-    vis_bytes = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8').nbytes
-    vis_mem = Array(c_uint8, vis_bytes, lock=True)
-    
-    # Create thermal image array in shared memory
-    raw16_bytes = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16').nbytes
-    raw16_mem = Array(c_uint16, raw16_bytes, lock=True)
+    # Create visible and thermal image rings in shared memory
+    frame_buffers = FrameBufferRegistry()
+    vis_mem = frame_buffers[STREAM_TYPE_VISIBLE]
+    raw16_mem = frame_buffers[STREAM_TYPE_THERMAL]
 
-    # Create master event object for new frames
-    vis_frame_parent   = NewFrameEvent()
-    raw16_frame_parent = NewFrameEvent()
+    # Create new frame events for both streams
+    frame_events = FrameEventHub()
+    vis_frame_parent   = frame_events[STREAM_TYPE_VISIBLE]
+    raw16_frame_parent = frame_events[STREAM_TYPE_THERMAL]
 
-    # Get a different child event for each process that reads frame data
-    user_det_frame_event    = vis_frame_parent.get_child()
-    cooking_det_frame_event = raw16_frame_parent.get_child()
+    # Subscribe each process that reads frame data
+    user_det_frame_event    = vis_frame_parent.subscribe()
+    cooking_det_frame_event = raw16_frame_parent.subscribe()
 
     # Instantiate alarm board
     alarm = AlarmBoard()
@@ -75,8 +78,8 @@ def main():
     node = NodeServer()
 
     # Instantiate launchers
-    arducam_proc        = Arducam()
-    purethermal_proc    = PureThermal()
+    arducam_proc        = Arducam(VISIBLE_REPLAY)
+    purethermal_proc    = PureThermal(THERMAL_REPLAY)
     user_detect_proc    = UserDetect()
     cooking_detect_proc = CookingDetect()
 
@@ -192,6 +195,9 @@ def main():
         user_detect_proc.stop()
         cooking_detect_proc.stop()
 
+        # Release shared frame buffers
+        frame_buffers.close()
+
         # Shut down node server connection
         node.disconnect()
 
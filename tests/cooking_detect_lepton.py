@@ -6,10 +6,10 @@ import sys
 sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
 
 from misc.frame_event import NewFrameEvent
-from multiprocessing import Array, Queue
-from constants import RAW_THERMAL_SHAPE
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
+from constants import RAW_THERMAL_SHAPE, STREAM_TYPE_THERMAL
 from misc.monitor import MonitorClient
-from ctypes import c_uint16
 from misc.logs import *
 import numpy as np
 import logging
@@ -33,15 +33,15 @@ def main():
     # Create queue for workers to log to
     logging_queue = Queue(10)
 
-    # Create image array in shared memory
-    dummy = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16')
-    mem = Array(c_uint16, dummy.nbytes, lock=True)
+    # Create image ring in shared memory
+    frame_buffers = FrameBufferRegistry()
+    mem = frame_buffers[STREAM_TYPE_THERMAL]
 
     # Create master event object for new frames
     new_frame_parent = NewFrameEvent()
 
-    # Create child event object for reader process
-    new_frame_child = new_frame_parent.get_child()
+    # Subscribe reader process to new frames
+    new_frame_child = new_frame_parent.subscribe()
 
     # Instantiate launchers
     pt = PureThermal()
@@ -116,6 +116,7 @@ def main():
         cd.stop()    
         pt.stop()  
         monitor.stop()
+        frame_buffers.close()
         logging_thread.stop()
         cv2.destroyAllWindows()
 
@@ -0,0 +1,105 @@
+"""
+Benchmark of the cooking detection worker with and without the extraction scheduler.
+
+Feeds the same synthetic stovetop to the real worker at the Lepton frame rate: one pan heating up
+from the start and a second one put on the stove halfway through. Reports the worker's CPU usage,
+its capture-to-output latency for extracted and refreshed frames, the fraction of due extractions the
+change gate skipped, and when cooking was first detected
+"""
+
+# Add parent directory to the Python path
+import os.path as path
+import sys
+sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
+
+from misc.frame_event import NewFrameEvent
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
+from lepton.utils import temp2raw
+from constants import *
+from misc.logs import *
+import numpy as np
+import logging
+import time
+import cv2
+
+from cooking_detection import CookingDetect
+
+
+DURATION = 40.0
+"""(float) Duration in seconds of each run"""
+
+
+def make_frame(rng, t):
+    """Returns (numpy.ndarray): Raw-16 frame of the stovetop 't' seconds into the run"""
+    temp = rng.normal(22.0, 0.3, RAW_THERMAL_SHAPE)
+
+    pan = np.zeros(RAW_THERMAL_SHAPE, dtype='uint8')
+    cv2.circle(pan, (50, 50), 12, 255, -1)
+    temp[pan > 0] = 60 + 0.5*t + rng.normal(0, 0.5, np.count_nonzero(pan))
+
+    if t > DURATION / 2:
+        pan[:] = 0
+        cv2.circle(pan, (115, 70), 10, 255, -1)
+        temp[pan > 0] = 80 + rng.normal(0, 0.5, np.count_nonzero(pan))
+
+    return np.vectorize(temp2raw)(temp).astype('uint16')
+
+
+def run(name, rate, mem, new_frame_parent, new_frame_child, logging_queue):
+    rng = np.random.default_rng(0)
+    cd = CookingDetect(rate)
+    cd.start(mem, new_frame_child, logging_queue)
+
+    cpu, extract_latency, refresh_latency = [], [], []
+    detected = None
+    start = next_frame = time.monotonic()
+    while (now := time.monotonic()) - start < DURATION:
+        # Publish frames at the Lepton rate
+        time.sleep(max(next_frame - now, 0))
+        next_frame += 1 / RAW_THERMAL_RATE
+        mem.write(make_frame(rng, time.monotonic() - start))
+        new_frame_parent.set()
+
+        # Skip the first second, the worker is starting up
+        if time.monotonic() - start < 1: continue
+        cpu.append(cd.cpu_usage.value)
+        extract_latency.append(cd.detect_stats.extract_latency)
+        refresh_latency.append(cd.detect_stats.refresh_latency)
+        if detected is None and len(cd.cooking_coords): detected = time.monotonic() - start
+
+    stats = cd.detect_stats
+    print(f"{name:22s} CPU {np.mean(cpu):5.1f} %, "
+          f"{stats.extracted:4d} extracted ({1e3*np.mean(extract_latency):5.2f} ms), "
+          f"{stats.refreshed:4d} refreshed ({1e3*np.mean(refresh_latency):5.2f} ms), skip rate {stats.skip_rate:4.2f}, "
+          f"cooking detected after {detected if detected is None else round(detected, 1)} s")
+    cd.stop()
+
+
+def main():
+    # Configure logger
+    configure_main_log(False, False)
+
+    # Create queue for workers to log to
+    logging_queue = Queue(10)
+    logging_thread = QueueListener(logging_queue)
+    logging_thread.start()
+
+    # Create image ring in shared memory
+    frame_buffers = FrameBufferRegistry()
+    mem = frame_buffers[STREAM_TYPE_THERMAL]
+
+    # Create master event object for new frames and subscribe the worker
+    new_frame_parent = NewFrameEvent()
+    new_frame_child = new_frame_parent.subscribe()
+
+    try:
+        run("every frame", None, mem, new_frame_parent, new_frame_child, logging_queue)
+        run(f"scheduled ({COOKING_DETECT_RATE} Hz)", COOKING_DETECT_RATE, mem, new_frame_parent, new_frame_child, logging_queue)
+    finally:
+        frame_buffers.close()
+        logging_thread.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,11 @@ import sys
 sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
 
 from misc.frame_event import NewFrameEvent
-from multiprocessing import Array, Queue
-from lepton.file_utils import Raw16Video
-from constants import RAW_THERMAL_SHAPE
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
+from lepton.file_utils import Raw16Video, Raw16Reader
+from constants import RAW_THERMAL_SHAPE, STREAM_TYPE_THERMAL
 from misc.monitor import MonitorClient
-from ctypes import c_uint16
 from misc.logs import *
 import numpy as np
 import logging
@@ -30,20 +30,15 @@ def main():
     # Create queue for workers to log to
     logging_queue = Queue(10)
 
-    # Create array for us to copy to
-    frame = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16')
-
-    # Create image array in shared memory
-    mem = Array(c_uint16, frame.nbytes, lock=True)
-
-    # Create numpy array backed by shared memory
-    frame_dst = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16', buffer=mem.get_obj())
+    # Create image ring in shared memory
+    frame_buffers = FrameBufferRegistry()
+    mem = frame_buffers[STREAM_TYPE_THERMAL]
 
     # Create master event object for new frames
     new_frame_parent = NewFrameEvent()
 
-    # Create child event object for reader process
-    new_frame_child = new_frame_parent.get_child()
+    # Subscribe reader process to new frames
+    new_frame_child = new_frame_parent.subscribe()
 
     # Instantiate launcher
     cd = CookingDetect()
@@ -57,7 +52,10 @@ def main():
     cv2.namedWindow("monitor", cv2.WINDOW_NORMAL)
 
     # Load lepton video
-    vid = Raw16Video(path.normpath(path.join(path.dirname(path.abspath(__file__)), 'vids', "demo.tiff")))
+    # Prefer the memory-mapped recording (see lepton.file_utils.tiff_to_raw16), .tiff files are loaded into RAM
+    vid_path = path.normpath(path.join(path.dirname(path.abspath(__file__)), 'vids', "demo"))
+    if path.exists(vid_path + ".raw16"): vid = Raw16Reader(vid_path + ".raw16")
+    else: vid = Raw16Video(vid_path + ".tiff")
 
     try:
         # Start thread to emit worker log messages
@@ -84,9 +82,7 @@ def main():
                 if not ret: raise KeyboardInterrupt
 
                 # Write frame to shared memory
-                if not mem.get_lock().acquire(timeout=0.5): continue
-                np.copyto(frame_dst, frame)
-                mem.get_lock().release()
+                mem.write(frame)
                 new_frame_parent.set()
 
                 # Print when detection state changes
@@ -121,6 +117,7 @@ def main():
     finally:
         cd.stop()      
         monitor.stop()
+        frame_buffers.close()
         logging_thread.stop()
         cv2.destroyAllWindows()
 
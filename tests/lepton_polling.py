@@ -5,12 +5,12 @@ import os.path as path
 import sys
 sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
 
-from constants import RAW_THERMAL_SHAPE, STREAM_UDP_PORT
+from constants import RAW_THERMAL_SHAPE, STREAM_UDP_PORT, STREAM_TYPE_THERMAL
 from misc.frame_event import NewFrameEvent
-from multiprocessing import Array, Queue
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
 from misc.monitor import MonitorClient
 from lepton.utils import clip_norm
-from ctypes import c_uint16
 from misc.logs import *
 import numpy as np
 import logging
@@ -34,17 +34,18 @@ def main():
     # Create array for us to copy to
     frame = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16')
 
-    # Create image array in shared memory
-    mem = Array(c_uint16, frame.nbytes, lock=True)
+    # Create image ring in shared memory
+    frame_buffers = FrameBufferRegistry()
+    mem = frame_buffers[STREAM_TYPE_THERMAL]
 
-    # Create numpy array backed by shared memory
-    frame_src = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16', buffer=mem.get_obj())
+    # Create reader for the ring
+    reader = mem.reader()
 
     # Create master event object for new frames
     new_frame_parent = NewFrameEvent()
 
-    # Create child event object for reader process
-    new_frame_child = new_frame_parent.get_child()
+    # Subscribe reader process to new frames
+    new_frame_child = new_frame_parent.subscribe()
 
     # Instantiate launcher
     pt = PureThermal()
@@ -80,15 +81,14 @@ def main():
                 ret = pt.handle_exceptions()
                 assert ret, "Lepton polling process not recoverable"
                 logger.warning("Attempting to restart lepton polling process")
-                pt.start(mem, new_frame_child, logging_queue)
+                pt.start(mem, new_frame_parent, logging_queue)
 
             if running and new_frame_child.is_set():
                 new_frame_child.clear()
 
                 # Grab frame from shared memory
-                if not mem.get_lock().acquire(timeout=0.5): continue
-                np.copyto(frame, frame_src)
-                mem.get_lock().release()
+                ret, _ = reader.read(out=frame)
+                if not ret: continue
 
                 # Show image
                 color = cv2.applyColorMap(clip_norm(frame), cv2.COLORMAP_INFERNO)
@@ -103,6 +103,17 @@ def main():
                 if (time.time()-last_print) > 1:
                     last_print = time.time()
                     logger.info(f"Max Temperature: {pt.max_temp.value:.1f}. Hotspot Detected: {pt.hotspot_detected.value}")
+
+                    # USB jitter shows up as dropped/overwritten frames
+                    stats = pt.capture_stats
+                    logger.info(f"Frames received: {stats.grabbed}, processed: {stats.processed}, dropped: {stats.dropped}, "
+                                f"overwritten: {stats.overwritten}, latency: {stats.latency*1000:.1f}ms, CPU: {pt.cpu_usage.value:.1f}%")
+
+                    # Recorder progress
+                    if pt.recording():
+                        rec = pt.recorder.stats
+                        logger.info(f"Recorded: {rec.frames}, dropped: {rec.dropped}, backlog: {rec.backlog}, "
+                                    f"disk: {rec.bandwidth/1e3:.1f}kB/s, ratio: {rec.ratio:.2f}, chunks: {rec.chunks}")
             
             # Controls
             k = cv2.waitKey(25)
@@ -114,7 +125,14 @@ def main():
             elif k == ord('s'):
                 logger.info("starting worker")
                 running = True
-                pt.start(mem, new_frame_child, logging_queue)
+                pt.start(mem, new_frame_parent, logging_queue)
+            elif k == ord('r') and running:
+                if pt.recording():
+                    logger.info("stopping recording")
+                    pt.stop_recording()
+                else:
+                    logger.info("starting recording")
+                    pt.start_recording()
             elif k == ord('q'):
                 logger.info("quitting")
                 raise KeyboardInterrupt
@@ -126,6 +144,7 @@ def main():
     finally:
         monitor.stop()
         pt.stop()
+        frame_buffers.close()
         logging_thread.stop()
         cv2.destroyAllWindows()
 
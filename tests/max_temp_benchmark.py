@@ -0,0 +1,74 @@
+"""Benchmark of the hotspot (max temperature) estimators on synthetic thermal frames"""
+
+# Add parent directory to the Python path
+import os.path as path
+import sys
+sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
+
+from lepton.utils import HotspotEstimator, raw2temp, temp2raw
+from constants import RAW_THERMAL_SHAPE
+import numpy as np
+import time
+import cv2
+
+
+def legacy_max_temp(frame):
+    """Previous estimator from lepton/polling_worker.py (8-bit, +/- 2.56 C)"""
+    frame = cv2.medianBlur((frame >> 8).astype("uint8"), 7) # Filter outliers
+    _, t_max, _, loc = cv2.minMaxLoc(frame)
+    return raw2temp(int(t_max) << 8), loc
+
+
+def make_frame(rng, hotspot_temp, n_outliers):
+    """
+    Synthetic scene: room temperature background, one hot pan and a few dead/hot pixels
+
+    Returns (tuple):
+    - (numpy.ndarray) Raw-16 frame
+    - (float) True hotspot temperature in celsius
+    """
+    h, w = RAW_THERMAL_SHAPE
+
+    # Background with sensor noise
+    temp = rng.normal(22.0, 0.1, RAW_THERMAL_SHAPE)
+
+    # Pan: disc with a smooth falloff towards its edge
+    cy, cx = rng.integers(15, h-15), rng.integers(15, w-15)
+    yy, xx = np.mgrid[:h, :w]
+    r = np.hypot(yy-cy, xx-cx)
+    pan = np.clip(1 - (r/10)**2, 0, 1)
+    temp += pan * (hotspot_temp - 22.0)
+
+    # Hot pixel outliers
+    ys = rng.integers(0, h, n_outliers)
+    xs = rng.integers(0, w, n_outliers)
+    temp[ys, xs] = 400.0
+
+    frame = np.vectorize(temp2raw)(temp).astype("uint16")
+    return frame, hotspot_temp
+
+
+def main():
+    rng = np.random.default_rng(0)
+    n_frames = 50
+    n_runs = 200
+
+    frames = [make_frame(rng, rng.uniform(40, 250), rng.integers(0, 4)) for _ in range(n_frames)]
+    estimator = HotspotEstimator(RAW_THERMAL_SHAPE)
+
+    for name, func in [("legacy (8-bit, median 7)", legacy_max_temp), ("HotspotEstimator", estimator)]:
+        # Accuracy
+        errors = np.array([func(f)[0] - t for f, t in frames])
+
+        # Speed
+        start = time.perf_counter()
+        for _ in range(n_runs):
+            for f, _ in frames: func(f)
+        per_frame = (time.perf_counter() - start) / (n_runs * n_frames)
+
+        print(f"{name:>26}: {per_frame*1e6:7.1f} us/frame, "
+              f"error mean {errors.mean():+.2f} C, max abs {np.abs(errors).max():.2f} C")
+
+
+if __name__ == "__main__":
+    main()
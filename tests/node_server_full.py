@@ -3,10 +3,10 @@ import os.path as path
 import sys
 sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
 
-from misc.frame_event import NewFrameEvent
-from multiprocessing import Array, Queue
+from misc.frame_event import FrameEventHub
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
 from misc.monitor import MonitorClient
-from ctypes import c_uint8, c_uint16
 from constants import *
 from misc.logs import *
 import numpy as np
@@ -36,17 +36,15 @@ def main():
     # Create queue for workers to log to
     logging_queue = Queue(40)
 
-    # Create image array in shared memory
-    thermal_bytes = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16').nbytes
-    raw16_mem = Array(c_uint16, thermal_bytes, lock=True)
+    # Create image rings in shared memory
+    frame_buffers = FrameBufferRegistry()
+    raw16_mem = frame_buffers[STREAM_TYPE_THERMAL]
+    vis_mem = frame_buffers[STREAM_TYPE_VISIBLE]
 
-    # Create image array in shared memory
-    visible_bytes = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8').nbytes
-    vis_mem = Array(c_uint8, visible_bytes, lock=True)
-
-    # Create master event object for new frames
-    vis_frame_parent = NewFrameEvent()
-    lep_frame_parent = NewFrameEvent()
+    # Create new frame events for both streams
+    frame_events = FrameEventHub()
+    vis_frame_parent = frame_events[STREAM_TYPE_VISIBLE]
+    lep_frame_parent = frame_events[STREAM_TYPE_THERMAL]
 
     # Create node server object
     node = NodeServer()
@@ -139,6 +137,7 @@ def main():
     finally:
         vis.stop()
         lep.stop()
+        frame_buffers.close()
         node.disconnect()
         monitor.stop()
         logging_thread.stop()
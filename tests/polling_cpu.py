@@ -0,0 +1,125 @@
+"""
+Benchmark of the CPU time the polling loops burn while waiting for frames.
+
+Runs each loop against a simulated camera, first the way the workers used to poll
+(retry immediately when no frame is available) and then with the blocking reads.
+The real workers report the same measurement through their launcher's cpu_usage
+"""
+
+# Add parent directory to the Python path
+import os.path as path
+import sys
+sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
+
+from constants import RAW_THERMAL_SHAPE, RAW_THERMAL_RATE, VISIBLE_SHAPE
+from arducam.capture import CaptureThread
+from lepton.frame_pool import FramePool
+from misc.cpu_meter import CpuMeter
+import numpy as np
+import threading
+import time
+
+
+DURATION = 3.0
+"""(float) Duration in seconds of each run"""
+
+
+class FakeVideoCapture:
+    """Stands in for cv2.VideoCapture. Delivers frames at a fixed rate, or none at all while disconnected"""
+
+    def __init__(self, fps, connected=True):
+        self.period = 1 / fps
+        self.connected = connected
+        self._next = time.monotonic()
+
+    def grab(self):
+        if not self.connected: return False
+
+        # Block like the driver until the next frame is due
+        delay = self._next - time.monotonic()
+        if delay > 0: time.sleep(delay)
+        self._next = max(self._next + self.period, time.monotonic())
+        return True
+
+    def retrieve(self, image=None):
+        return True, image
+
+
+def lepton_producer(pool, stop):
+    """Publishes frames into a FramePool at the Lepton frame rate, like the libuvc callback"""
+    while not stop.wait(1 / RAW_THERMAL_RATE):
+        idx = pool.acquire()
+        pool.publish(idx, time.monotonic())
+
+
+def run(name, loop):
+    """Runs a polling loop for DURATION seconds and prints the CPU usage of the process"""
+    meter = CpuMeter(period=DURATION)
+    end = time.monotonic() + DURATION
+    frames = loop(end)
+    print(f"{name:>32}: {meter.update():5.1f}% CPU, {frames / DURATION:5.1f} fps")
+
+
+def main():
+    # === Lepton ===
+    pool = FramePool(RAW_THERMAL_SHAPE, 'uint16')
+    stop = threading.Event()
+    producer = threading.Thread(target=lepton_producer, args=(pool, stop), daemon=True)
+    producer.start()
+
+    def lepton_spin(end):
+        frames = 0
+        while time.monotonic() < end:
+            ret, frame, ts = pool.get()
+            if not ret: continue
+            frames += 1
+        return frames
+
+    def lepton_blocking(end):
+        frames = 0
+        while time.monotonic() < end:
+            ret, frame, ts = pool.get(timeout=0.5)
+            if not ret: continue
+            frames += 1
+        return frames
+
+    run("lepton, spinning read()", lepton_spin)
+    run("lepton, read(timeout)", lepton_blocking)
+    stop.set()
+    producer.join()
+
+    # === Arducam, disconnected camera ===
+    # The driver returns immediately from a failed grab, so the capture thread used to spin
+    def arducam_spin(end):
+        vidcap = FakeVideoCapture(30, connected=False)
+        while time.monotonic() < end:
+            if not vidcap.grab(): continue
+        return 0
+
+    def arducam_backoff(end):
+        capture = CaptureThread(FakeVideoCapture(30, connected=False), VISIBLE_SHAPE, timeout=2*DURATION)
+        capture.start()
+        while time.monotonic() < end:
+            capture.read(timeout=0.5)
+        capture.stop()
+        return 0
+
+    run("arducam (no signal), spinning", arducam_spin)
+    run("arducam (no signal), back off", arducam_backoff)
+
+    # === Arducam, streaming ===
+    def arducam_stream(end):
+        capture = CaptureThread(FakeVideoCapture(30), VISIBLE_SHAPE)
+        capture.start()
+        frames = 0
+        while time.monotonic() < end:
+            ret, frame, ts = capture.read(timeout=0.5)
+            if ret: frames += 1
+        capture.stop()
+        return frames
+
+    run("arducam, read(timeout)", arducam_stream)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Thermal recorder testbench: forces the disk queue to overflow and checks the drop counter.
+
+Publishes a burst of noisy frames much faster than the recorder can compress them, with the
+frame index as timestamp. Every frame published after the recorder started is either in the
+recording or counted in RecorderStats.dropped, exactly once
+"""
+
+# Add parent directory to the Python path
+import os.path as path
+import sys
+sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
+
+from misc.frame_event import NewFrameEvent
+from misc.frame_buffer import FrameBufferRegistry
+from lepton.file_utils import Raw16ChunkReader
+from lepton.recorder import Recorder
+from multiprocessing import Queue
+from constants import RAW_THERMAL_SHAPE, STREAM_TYPE_THERMAL
+from misc.logs import *
+import numpy as np
+import tempfile
+import glob
+import time
+
+
+N_FRAMES = 2000
+"""(int) Number of frames in the burst"""
+
+
+def main():
+    # Configure logger
+    configure_main_log(False, True)
+
+    # Create queue for workers to log to
+    logging_queue = Queue(10)
+    logging_thread = QueueListener(logging_queue)
+    logging_thread.start()
+
+    # Create image ring in shared memory
+    frame_buffers = FrameBufferRegistry()
+    mem = frame_buffers[STREAM_TYPE_THERMAL]
+    new_frame_parent = NewFrameEvent(stream=STREAM_TYPE_THERMAL)
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(29000, 31000, RAW_THERMAL_SHAPE, dtype='uint16') for _ in range(16)]
+
+    recorder = Recorder()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            # Frames written before the recorder's reader exists are not part of the recording
+            mem.write(frames[0], timestamp=0)
+            recorder.start(mem, new_frame_parent.subscribe(), logging_queue, directory)
+            time.sleep(2)
+
+            # Burst of frames 1..N_FRAMES, then let the recorder catch up
+            for i in range(1, N_FRAMES + 1):
+                mem.write(frames[i % len(frames)], timestamp=i)
+                new_frame_parent.set()
+            time.sleep(3)
+            recorder.stop()
+
+            recorded = Raw16ChunkReader(sorted(glob.glob(recorder.prefix + "*"))).timestamps.astype(int)
+            missing = N_FRAMES - len(set(recorded.tolist()) & set(range(1, N_FRAMES + 1)))
+            stats = recorder.stats
+
+            print(f"Published {N_FRAMES}, recorded {len(recorded)}, missing {missing}, dropped {stats.dropped}")
+            assert len(recorded) == len(set(recorded.tolist())), "Frames recorded twice"
+            assert missing > 0, "The burst didn't overflow the disk queue"
+            assert stats.dropped == missing, "Dropped counter doesn't match the frames missing from the recording"
+            print("OK")
+    finally:
+        recorder.stop()
+        frame_buffers.close()
+        logging_thread.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,6 @@ import time
 
 def worker(stop, vis_mem, frame_event, ports):
 
-    # Create numpy array backed by shared memory
-    frame_dst = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8', buffer=vis_mem.get_obj())
-
     # Create monitor server
     monitor = MonitorServer()
 
@@ -26,9 +23,7 @@ def worker(stop, vis_mem, frame_event, ports):
         start = time.time()
         frame = np.random.randint(0, 255, VISIBLE_SHAPE, dtype='uint8')
 
-        if not vis_mem.get_lock().acquire(timeout=0.5): continue
-        np.copyto(frame_dst, frame)
-        vis_mem.get_lock().release()
+        vis_mem.write(frame)
 
         # Stream to UDP
         if len(ports):
@@ -62,8 +57,8 @@ class Arducam(Launcher):
         Start the arducam polling worker
 
         Parameters:
-        - vis_mem (multiprocessing.Array): Shared memory location of visible camera data
-        - frame_event (NewFrameEvent): Master 'new frame' event. Set all child events when a new frame is written
+        - vis_mem (FrameRing): Shared memory ring of visible camera data
+        - frame_event (NewFrameEvent): Publisher of the stream. Wakes all subscribers when a new frame is written
         - log_queue (multiprocessing.Queue): Queue to handle log messages
         """
         if self.thread == None:
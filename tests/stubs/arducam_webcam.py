@@ -17,9 +17,6 @@ import cv2
 
 def worker(stop, vis_mem, frame_event, ports):
 
-    # Create numpy array backed by shared memory
-    frame_dst = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8', buffer=vis_mem.get_obj())
-
     # Create monitor server
     monitor = MonitorServer()
 
@@ -32,9 +29,7 @@ def worker(stop, vis_mem, frame_event, ports):
         ret, frame = cap.read()
         if not ret: continue
 
-        if not vis_mem.get_lock().acquire(timeout=0.5): continue
-        np.copyto(frame_dst, frame)
-        vis_mem.get_lock().release()
+        vis_mem.write(frame)
 
         # Set new frame flag
         frame_event.set()
@@ -69,8 +64,8 @@ class Arducam(Launcher):
         Start the arducam polling worker
 
         Parameters:
-        - vis_mem (multiprocessing.Array): Shared memory location of visible camera data
-        - frame_event (NewFrameEvent): Master 'new frame' event. Set all child events when a new frame is written
+        - vis_mem (FrameRing): Shared memory ring of visible camera data
+        - frame_event (NewFrameEvent): Publisher of the stream. Wakes all subscribers when a new frame is written
         - log_queue (multiprocessing.Queue): Queue to handle log messages
         """
         if self.thread == None:
@@ -71,7 +71,7 @@ class CookingDetect(Launcher):
         Start the cooking detection worker
 
         Parameters:
-        - raw16_mem (multiprocessing.Array): Shared memory location of raw16 frame data
+        - raw16_mem (FrameRing): Shared memory ring of raw16 frame data
         - frame_event (NewFrameConsumer): Flag that indicates when a new frame is available
         - log_queue (multiprocessing.Queue): Queue used to transfer log records from a subrocess to the main process
         """
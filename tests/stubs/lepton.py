@@ -23,18 +23,13 @@ SOCKET_PORT = 15666
 
 def worker(stop, raw16_mem, frame_event, ports):
 
-    # Create numpy array backed by shared memory
-    frame_dst = np.ndarray(shape=RAW_THERMAL_SHAPE, dtype='uint16', buffer=raw16_mem.get_obj())
-
     monitor = MonitorServer()
 
     while not stop.is_set():
         start = time.time()
         frame = np.random.randint(0, 2**16-1, RAW_THERMAL_SHAPE, dtype='uint16')
 
-        if not raw16_mem.get_lock().acquire(timeout=0.5): continue
-        np.copyto(frame_dst, frame)
-        raw16_mem.get_lock().release()
+        raw16_mem.write(frame)
 
         # Send frame oover UDP
         if len(ports):
@@ -85,8 +80,8 @@ class PureThermal(Launcher):
         Start the PureThermal polling worker
 
         Parameters:
-        - raw16_mem (multiprocessing.Array): Shared memory location of thermal camera data
-        - frame_event (NewFrameEvent): Master 'new frame' event. Set all child events when a new frame is written
+        - raw16_mem (FrameRing): Shared memory ring of thermal camera data
+        - frame_event (NewFrameEvent): Publisher of the stream. Wakes all subscribers when a new frame is written
         - log_queue (multiprocessing.Queue): Queue to handle log messages
         """
         
@@ -72,7 +72,7 @@ class UserDetect(Launcher):
         Start the user detection worker
 
         Parameters:
-        - vis_mem (multiprocessing.Array): Shared memory location of visible camera data
+        - vis_mem (FrameRing): Shared memory ring of visible camera data
         - frame_event (NewFrameConsumer): Flag that indicates when a new frame is available
         - log_queue (multiprocessing.Queue): Queue used to transfer log records from a subrocess to the main process
         """
@@ -0,0 +1,125 @@
+"""
+Benchmark of the windowed and batched Theil-Sen estimators against the previous implementation, at several
+history depths, and of the batched estimator against one estimator per blob, for growing numbers of blobs
+"""
+
+# Add parent directory to the Python path
+import os.path as path
+import sys
+sys.path.append(path.normpath(path.join(path.dirname(path.abspath(__file__)), '..', "src")))
+
+from cooking_detection.theil_sen import TheilSen, TheilSenBatch
+from constants import BLOB_HISTORY_DEPTH
+import numpy as np
+import time
+
+
+class LegacyTheilSen:
+    """Previous estimator from theil_sen.py: per-point slope arrays, median of all slopes rebuilt on every estimate"""
+
+    class Point:
+        def __init__(self, x, y, n_points):
+            self.x, self.y = x, y
+            self.slopes = np.zeros(n_points-1)
+            self.n_slopes = 0
+
+        def add_child(self, other):
+            dx = other.x - self.x
+            self.slopes[self.n_slopes] = (other.y - self.y) / (1e-6 if dx==0 else dx)
+            self.n_slopes += 1
+
+    def __init__(self, n_points):
+        self.max_points = n_points
+        self.points = []
+
+    def add_point(self, x, y):
+        new_point = self.Point(x, y, self.max_points)
+        if len(self.points) >= self.max_points: self.points.pop(0)
+        self.points.append(new_point)
+        for p in self.points[:-1]: p.add_child(new_point)
+
+    def get_estimate(self):
+        if len(self.points) <= 1: return 0.0
+        return float(np.median(np.concatenate([p.slopes[:p.n_slopes] for p in self.points[:-1]])))
+
+
+class SingleTrack:
+    """TheilSenBatch used like a single estimator"""
+
+    def __init__(self, n_points):
+        self.batch = TheilSenBatch(n_points)
+
+    def add_point(self, x, y):
+        self.batch.add_points([0], [x], [y])
+
+    def get_estimate(self):
+        return float(np.nan_to_num(self.batch.get_estimates([0])[0]))
+
+
+def samples(rng, n):
+    """Returns (tuple (numpy.ndarray, numpy.ndarray)): Timestamps at BLOB_HISTORY_RATE with jitter, and a noisy heating curve with outliers"""
+    t = np.arange(n) * 0.5 + rng.normal(0, 0.01, n)
+    temp = 60 + 40 * np.tanh(t / 120) + rng.normal(0, 0.5, n)
+    outliers = rng.random(n) < 0.05
+    temp[outliers] += rng.normal(0, 30, np.count_nonzero(outliers))
+    return t, np.round(temp, 2)
+
+
+def main():
+    rng = np.random.default_rng(0)
+
+    for depth in (30, 100, 300):
+        # Fill the window, then keep sliding it
+        n_samples = 3 * depth
+        t, temp = samples(rng, n_samples)
+
+        results = {}
+        estimates = {}
+        for name, cls in [("legacy", LegacyTheilSen), ("sorted", TheilSen), ("batched", SingleTrack)]:
+            est = cls(depth)
+            out = np.zeros(n_samples)
+            start = time.perf_counter()
+            for i in range(n_samples):
+                est.add_point(t[i], temp[i])
+                out[i] = est.get_estimate()
+            results[name] = (time.perf_counter() - start) / n_samples
+            estimates[name] = out
+
+        max_diff = max(np.max(np.abs(estimates["legacy"] - estimates[name])) for name in ("sorted", "batched"))
+        print(f"depth {depth:3d}: legacy {results['legacy']*1e3:7.3f} ms, sorted {results['sorted']*1e3:6.3f} ms, "
+              f"batched {results['batched']*1e3:6.3f} ms per sample, x{results['legacy']/results['sorted']:5.1f} / "
+              f"x{results['legacy']/results['batched']:5.1f}, max estimate difference: {max_diff:.2e}")
+
+    print()
+
+    # Every blob gets a new sample per update, like burners heating side by side
+    for n_blobs in (1, 2, 5, 10, 20, 50):
+        n_samples = 2 * BLOB_HISTORY_DEPTH
+        data = [samples(rng, n_samples) for _ in range(n_blobs)]
+        t, temp = np.array([d[0] for d in data]), np.array([d[1] for d in data])
+        ids = list(range(n_blobs))
+
+        estimators = [TheilSen(BLOB_HISTORY_DEPTH) for _ in ids]
+        single = np.zeros((n_samples, n_blobs))
+        start = time.perf_counter()
+        for i in range(n_samples):
+            for b, est in enumerate(estimators):
+                est.add_point(t[b,i], temp[b,i])
+                single[i,b] = est.get_estimate()
+        t_single = (time.perf_counter() - start) / n_samples
+
+        batch = TheilSenBatch(BLOB_HISTORY_DEPTH)
+        batched = np.zeros((n_samples, n_blobs))
+        start = time.perf_counter()
+        for i in range(n_samples):
+            batch.add_points(ids, t[:,i], temp[:,i])
+            batched[i] = batch.get_estimates(ids)
+        t_batch = (time.perf_counter() - start) / n_samples
+
+        max_diff = np.nanmax(np.abs(single[1:] - batched[1:]))
+        print(f"{n_blobs:3d} blobs: per blob {t_single*1e3:7.3f} ms, batched {t_batch*1e3:6.3f} ms per update, "
+              f"x{t_single/t_batch:5.1f}, max estimate difference: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
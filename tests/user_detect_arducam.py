@@ -5,10 +5,10 @@ import os, sys
 sys.path.append(os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', "src")))
 
 from misc.frame_event import NewFrameEvent
-from multiprocessing import Array, Queue
+from misc.frame_buffer import FrameBufferRegistry
+from multiprocessing import Queue
 from misc.monitor import MonitorClient
-from constants import VISIBLE_SHAPE
-from ctypes import c_uint8
+from constants import VISIBLE_SHAPE, STREAM_TYPE_VISIBLE
 from misc.logs import *
 import numpy as np
 import logging
@@ -33,15 +33,15 @@ def main():
     # Create queue for workers to log to
     logging_queue = Queue(10)
 
-    # Create image array in shared memory
-    dummy = np.ndarray(shape=VISIBLE_SHAPE, dtype='uint8')
-    mem = Array(c_uint8, dummy.nbytes, lock=True)
+    # Create image ring in shared memory
+    frame_buffers = FrameBufferRegistry()
+    mem = frame_buffers[STREAM_TYPE_VISIBLE]
 
     # Create master event object for new frames
     new_frame_parent = NewFrameEvent()
 
-    # Get a different child event for each process that reads frame data
-    new_frame_child = new_frame_parent.get_child()
+    # Subscribe each process that reads frame data
+    new_frame_child = new_frame_parent.subscribe()
 
     # Instantiate launchers
     user = UserDetect()
@@ -115,6 +115,7 @@ def main():
         user.stop()
         cam.stop()
         monitor.stop()
+        frame_buffers.close()
 
         logging_thread.stop()
         logger.info("test ended")